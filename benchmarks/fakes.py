@@ -0,0 +1,191 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# Local stand-ins for the chain and network objects the neurons use, so miners, validators and the bridge can be
+# run against each other in a single process.
+
+import copy
+import time
+import random
+import asyncio
+import inspect
+import typing
+import collections
+import numpy as np
+import bittensor as bt
+
+class AxonInfo:
+    """
+    The parts of a bt.axon_info the neurons read.
+    """
+
+    def __init__( self, hotkey: str, ip: str = '127.0.0.1', port: int = 8091 ):
+        self.hotkey = hotkey
+        self.ip = ip
+        self.port = port
+        self.ip_type = 4
+        self.version = 1
+
+class Metagraph:
+    """
+    A metagraph of the given hotkeys and stake, one axon per hotkey.
+    """
+
+    def __init__( self, hotkeys: typing.List[ str ], stake: typing.Optional[ np.ndarray ] = None, block: int = 0 ):
+        self.hotkeys = list( hotkeys )
+        self.S = np.ones( len( hotkeys ) ) if stake is None else np.asarray( stake, dtype = np.float64 )
+        self.axons = [ AxonInfo( hotkey, port = 8091 + uid ) for uid, hotkey in enumerate( hotkeys ) ]
+        self.uids = np.arange( len( hotkeys ) )
+        self.block = np.array( block )
+
+class Subtensor:
+    """
+    A chain which serves a fixed metagraph and advances one block per call to get_current_block.
+    """
+
+    def __init__( self, metagraph: Metagraph ):
+        self._metagraph = metagraph
+        self.block = int( metagraph.block )
+
+    def get_current_block( self ) -> int:
+        self.block += 1
+        return self.block
+
+    def metagraph( self, netuid: int ) -> Metagraph:
+        return self._metagraph
+
+class Hotkey:
+    def __init__( self, ss58_address: str ):
+        self.ss58_address = ss58_address
+
+class Wallet:
+    """
+    A wallet with the given hotkey address, name and hotkey name.
+    """
+
+    def __init__( self, hotkey: str, name: str = 'benchmark', hotkey_str: str = 'default' ):
+        self.hotkey = Hotkey( hotkey )
+        self.name = name
+        self.hotkey_str = hotkey_str
+
+class Axon:
+    """
+    Serves attached forward functions in-process, dispatching requests on the name of the synapse type the
+    function is annotated with, like bt.axon, and records how long each handler took.
+    """
+
+    def __init__( self, hotkey: str ):
+        self.info = AxonInfo( hotkey )
+        self.forward_fns: typing.Dict[ str, typing.Callable ] = {}
+        self.serve_times: typing.Dict[ str, typing.List[ float ] ] = collections.defaultdict( list )
+
+    def attach( self, forward_fn: typing.Callable ) -> 'Axon':
+        annotation = list( inspect.signature( forward_fn ).parameters.values() )[0].annotation
+        # String annotations name the type, i.e. 'storage.protocol.Store'.
+        name = annotation.rsplit( '.', 1 )[-1] if isinstance( annotation, str ) else annotation.__name__
+        self.forward_fns[ name ] = forward_fn
+        return self
+
+    async def forward( self, synapse: bt.Synapse ) -> bt.Synapse:
+        name = type( synapse ).__name__
+        began = time.perf_counter()
+        result = self.forward_fns[ name ]( synapse )
+        if inspect.isawaitable( result ):
+            result = await result
+        self.serve_times[ name ].append( time.perf_counter() - began )
+        return result
+
+def payload_size( synapse: bt.Synapse ) -> int:
+    # Characters carried by the string fields of a synapse, which dominate its size on the wire.
+    size = 0
+    for value in vars( synapse ).values():
+        if isinstance( value, str ):
+            size += len( value )
+        elif isinstance( value, list ):
+            size += sum( len( item ) for item in value if isinstance( item, str ) )
+    return size
+
+class Dendrite:
+    """
+    Delivers requests to in-process axons with injected network conditions: a latency each way drawn around latency
+    with the given jitter, transfer time at the given bandwidth, and requests lost with probability loss.
+    Lost requests and requests slower than their timeout come back unanswered after the timeout, as from bt.dendrite.
+
+    The round trip time of every request is recorded by synapse type.
+
+    Args:
+    - hotkey (str): The hotkey requests are sent with, i.e. the validator's.
+    - axons (dict): The in-process axons by hotkey.
+    - latency (float): The mean one way latency in seconds.
+    - jitter (float): The standard deviation of the latency in seconds.
+    - loss (float): The probability a request is lost.
+    - bandwidth (float): The bytes per second in each direction, 0 for no limit.
+    """
+
+    def __init__( self, hotkey: str, axons: typing.Dict[ str, Axon ], latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, bandwidth: float = 0.0 ):
+        self.hotkey = hotkey
+        self.axons = axons
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.bandwidth = bandwidth
+        self.round_trips: typing.Dict[ str, typing.List[ float ] ] = collections.defaultdict( list )
+        self.counters = collections.Counter()
+
+    def delay( self, size: int ) -> float:
+        delay = max( 0.0, random.gauss( self.latency, self.jitter ) ) if self.jitter > 0 else self.latency
+        return delay + ( size / self.bandwidth if self.bandwidth > 0 else 0.0 )
+
+    async def call( self, axon, synapse: bt.Synapse, timeout: float ) -> bt.Synapse:
+        name = type( synapse ).__name__
+        began = time.perf_counter()
+        request = copy.deepcopy( synapse )
+        request.dendrite = bt.TerminalInfo( hotkey = self.hotkey )
+        target = self.axons.get( axon.hotkey )
+        delay = self.delay( payload_size( request ) )
+        self.counters[ 'requests' ] += 1
+        if target is None or random.random() < self.loss or delay > timeout:
+            # Nothing comes back, the caller waits out its timeout.
+            self.counters[ 'lost' if target is not None and delay <= timeout else 'timeouts' ] += 1
+            await asyncio.sleep( timeout )
+            response = synapse
+        else:
+            await asyncio.sleep( delay )
+            response = await target.forward( request )
+            remaining = timeout - ( time.perf_counter() - began )
+            back = self.delay( payload_size( response ) )
+            if back > remaining:
+                self.counters[ 'timeouts' ] += 1
+                await asyncio.sleep( max( 0.0, remaining ) )
+                response = synapse
+            else:
+                await asyncio.sleep( back )
+        self.round_trips[ name ].append( time.perf_counter() - began )
+        return response
+
+    async def forward( self, axons, synapse: bt.Synapse, timeout: float = 12.0, deserialize: bool = True ):
+        single = not isinstance( axons, list )
+        responses = await asyncio.gather( *[ self.call( axon, synapse, timeout ) for axon in ( [ axons ] if single else axons ) ] )
+        if deserialize:
+            responses = [ response.deserialize() for response in responses ]
+        return responses[0] if single else responses
+
+    # bt.dendrite is also awaited directly.
+    async def __call__( self, *args, **kwargs ):
+        return await self.forward( *args, **kwargs )
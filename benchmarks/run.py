@@ -0,0 +1,380 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# End to end benchmark of the miner handlers, the validator loop and the bridge endpoints, run in a single process
+# against the local stand-ins of fakes.py. Reports throughput and latency percentiles as JSON.
+#
+# python benchmarks/run.py --miners 16 --chunks 256 --latency 0.05 --loss 0.01 --output benchmark.json
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import types
+import numpy as np
+
+# The neurons, the bridge and the benchmarks import their siblings by name.
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+for directory in [ ROOT, os.path.join( ROOT, 'neurons' ), os.path.join( ROOT, 'frontend' ), os.path.join( ROOT, 'benchmarks' ) ]:
+    if directory not in sys.path:
+        sys.path.insert( 0, directory )
+
+import bittensor as bt
+import storage
+import allocate
+import allocation_table
+import chunkstore
+import challenges
+import miner
+import validator
+import fakes
+
+SUITES = [ 'miner', 'validator', 'bridge' ]
+
+def get_config() -> argparse.Namespace:
+    parser = argparse.ArgumentParser( description = "Benchmark the miner, validator and bridge against local stand-ins for the network." )
+    parser.add_argument( '--suites', type = str, default = ','.join( SUITES ), help = "Comma separated suites to run, of: miner, validator, bridge." )
+    # The network.
+    parser.add_argument( '--miners', type = int, default = 8, help = "The number of miners." )
+    parser.add_argument( '--chunks', type = int, default = 128, help = "The mean number of chunks each miner holds for the validator." )
+    parser.add_argument( '--chunk_spread', type = float, default = 0.5, help = "Miner capacities are drawn uniformly within this fraction of --chunks." )
+    parser.add_argument( '--chunk_size', type = int, default = 1 << 16, help = "The size of a generated chunk in characters." )
+    parser.add_argument( '--latency', type = float, default = 0.01, help = "The mean one way latency in seconds." )
+    parser.add_argument( '--jitter', type = float, default = 0.0, help = "The standard deviation of the latency in seconds." )
+    parser.add_argument( '--loss', type = float, default = 0.0, help = "The probability a request is lost." )
+    parser.add_argument( '--bandwidth', type = float, default = 0.0, help = "The bytes per second each way, 0 for no limit." )
+    # The miner suite.
+    parser.add_argument( '--requests', type = int, default = 256, help = "The number of requests per miner operation." )
+    parser.add_argument( '--concurrency', type = int, default = 32, help = "The number of miner requests in flight." )
+    parser.add_argument( '--batch_size', type = int, default = 8, help = "The number of keys per batched retrieve and proof." )
+    parser.add_argument( '--storage_workers', type = int, default = 8, help = "The number of threads serving the miner's storage calls." )
+    parser.add_argument( '--cache_size', type = int, default = 1 << 26, help = "The bytes of the miner's chunk cache." )
+    # The validator suite.
+    parser.add_argument( '--rounds', type = int, default = 10, help = "The number of validator rounds." )
+    parser.add_argument( '--challenge_budget', type = int, default = 0, help = "The maximum number of miners challenged per round, 0 for no limit." )
+    parser.add_argument( '--challenge_mode', type = str, default = 'proof', choices = [ 'proof', 'full', 'stream' ], help = "How miners answer challenges." )
+    parser.add_argument( '--chunks_per_challenge', type = int, default = 1, help = "The number of chunks checked per miner per round." )
+    parser.add_argument( '--challenge_timeout', type = float, default = 12.0, help = "The per miner challenge timeout in seconds." )
+    # The bridge suite.
+    parser.add_argument( '--files', type = int, default = 4, help = "The number of files uploaded and downloaded." )
+    parser.add_argument( '--file_size', type = int, default = 1 << 22, help = "The size of each file in bytes." )
+    parser.add_argument( '--upload_chunk_size', type = int, default = 1 << 20, help = "The bytes of a file stored per chunk." )
+    parser.add_argument( '--data_shards', type = int, default = 1, help = "The data shards per chunk." )
+    parser.add_argument( '--parity_shards', type = int, default = 0, help = "The parity shards per chunk." )
+    parser.add_argument( '--frame_size', type = int, default = 0, help = "Transfer chunks in frames of this many characters, 0 for whole chunks." )
+    parser.add_argument( '--seed', type = int, default = 0, help = "The seed of the random capacities, keys and files." )
+    parser.add_argument( '--output', type = str, default = None, help = "Write the report to this file instead of stdout." )
+    return parser.parse_args()
+
+def summary( values ) -> dict:
+    """
+    Return the count, mean and 50th, 95th and 99th percentiles of a list of seconds.
+    """
+    if not values:
+        return { 'count': 0 }
+    values = np.asarray( values, dtype = np.float64 )
+    p50, p95, p99 = np.percentile( values, [ 50, 95, 99 ] )
+    return { 'count': len( values ), 'mean': float( values.mean() ), 'p50': float( p50 ), 'p95': float( p95 ), 'p99': float( p99 ) }
+
+class Network:
+    """
+    Miners with generated allocations for a single validator, each served by a local axon, and the validator's hash
+    tables of them. The validator's tables live under <root>/<wallet name>/<hotkey name>, where the bridge looks.
+    """
+
+    WALLET_NAME = 'benchmark'
+    HOTKEY_NAME = 'default'
+
+    def __init__( self, config: argparse.Namespace, root: str ):
+        self.config = config
+        self.root = root
+        self.validator_hotkey = 'validator'
+        self.miner_hotkeys = [ f"miner{uid}" for uid in range( config.miners ) ]
+        spread = config.chunk_spread * config.chunks
+        self.capacity = np.array( [ max( 1, int( config.chunks + random.uniform( -spread, spread ) ) ) for _ in self.miner_hotkeys ] )
+
+        # Every miner generates the data of its allocation, the validator keeps the hashes.
+        self.miner_config = types.SimpleNamespace(
+            cache_size = config.cache_size,
+            storage_workers = config.storage_workers,
+            max_pending_requests = 1 << 16,
+            max_batch_size = max( 64, config.batch_size ),
+            chunk_store = chunkstore.SQLITE,
+        )
+        self.miners = {}
+        self.axons = {}
+        began = time.time()
+        for hotkey, n_chunks in zip( self.miner_hotkeys, self.capacity ):
+            self.spawn( hotkey, int( n_chunks ) )
+        self.generate_seconds = time.time() - began
+
+        self.validator_root = f"{root}/{self.WALLET_NAME}/{self.HOTKEY_NAME}"
+        os.makedirs( self.validator_root, exist_ok = True )
+        self.metagraph = fakes.Metagraph( self.miner_hotkeys + [ self.validator_hotkey ] )
+
+    def spawn( self, hotkey: str, n_chunks: int ) -> miner.Miner:
+        """
+        Generate the data of a miner's allocation for the validator and serve its handlers on a local axon.
+        """
+        allocations = allocation_table.AllocationTable( f"{self.root}/miners/{hotkey}", hotkey, [ self.validator_hotkey ], role = allocation_table.MINER, n_chunks = [ n_chunks ] )
+        os.makedirs( allocations.root, exist_ok = True )
+        chains = storage.chains.HashChains( size = self.config.chunk_size )
+        chains.resize( allocations.to_dicts() )
+        chains.close()
+        self.miners[ hotkey ] = miner.Miner( self.miner_config, allocations )
+        self.axons[ hotkey ] = fakes.Axon( hotkey )
+        for handler in self.miners[ hotkey ].handlers():
+            self.axons[ hotkey ].attach( handler )
+        return self.miners[ hotkey ]
+
+    def dendrite( self ) -> fakes.Dendrite:
+        return fakes.Dendrite( self.validator_hotkey, self.axons, latency = self.config.latency, jitter = self.config.jitter, loss = self.config.loss, bandwidth = self.config.bandwidth )
+
+    def shutdown( self ):
+        for node in self.miners.values():
+            node.shutdown()
+
+def network_stats( dendrite: fakes.Dendrite, seconds: float ) -> dict:
+    # Round trip percentiles and request rates by synapse type, as seen by the sender.
+    return {
+        'counters': dict( dendrite.counters ),
+        'round_trips': { name: dict( summary( values ), per_second = len( values ) / seconds if seconds > 0 else 0.0 ) for name, values in dendrite.round_trips.items() },
+    }
+
+def run_miner( config: argparse.Namespace, network: Network, loop: asyncio.AbstractEventLoop ) -> dict:
+    """
+    Send batched retrieves, proofs and stores to a single miner at --concurrency requests in flight. The miner is
+    outside the metagraph, so the chunks the stores replace are never challenged by the validator suite.
+    """
+    hotkey, n_chunks = 'minerbenchmark', config.chunks
+    node = network.spawn( hotkey, n_chunks )
+    payload = ''.join( random.choices( 'abcdefghijklmnopqrstuvwxyz', k = config.chunk_size ) )
+    axon = network.axons[ hotkey ].info
+
+    def keys() -> list:
+        return [ str( random.randrange( n_chunks ) ) for _ in range( config.batch_size ) ]
+
+    def prove() -> storage.protocol.Prove:
+        # The miner takes the starts modulo its number of leaves.
+        return storage.protocol.Prove( keys = keys(), starts = [ random.randrange( 1 << 10 ) for _ in range( config.batch_size ) ], count = 4 )
+
+    operations = {
+        'retrieve_batch': lambda: storage.protocol.RetrieveBatch( keys = keys() ),
+        'prove': prove,
+        'store': lambda: storage.protocol.Store( data = payload ),
+    }
+    results = {}
+    for name, make in operations.items():
+        dendrite = network.dendrite()
+        semaphore = asyncio.Semaphore( config.concurrency )
+        overloaded = 0
+
+        async def send():
+            nonlocal overloaded
+            async with semaphore:
+                response = await dendrite.forward( axon, make(), timeout = config.challenge_timeout, deserialize = False )
+                overloaded += bool( response.overloaded )
+
+        async def run():
+            await asyncio.gather( *[ send() for _ in range( config.requests ) ] )
+
+        began = time.time()
+        loop.run_until_complete( run() )
+        seconds = time.time() - began
+        results[ name ] = dict(
+            network_stats( dendrite, seconds ),
+            seconds = seconds,
+            requests_per_second = config.requests / seconds,
+            overloaded = overloaded,
+        )
+    serve_times = network.axons[ hotkey ].serve_times
+    return {
+        'miner': hotkey,
+        'n_chunks': n_chunks,
+        'operations': results,
+        'serve': { name: summary( values ) for name, values in serve_times.items() },
+        'cache': node.chunk_cache.stats(),
+        'executor': node.storage_executor.stats(),
+    }
+
+def run_validator( config: argparse.Namespace, network: Network, loop: asyncio.AbstractEventLoop ) -> dict:
+    """
+    Run --rounds validator rounds over every miner: scheduled challenges, then the hash tables resized in-process.
+    """
+    allocations = allocation_table.AllocationTable(
+        network.validator_root,
+        network.validator_hotkey,
+        network.miner_hotkeys,
+        role = allocation_table.VALIDATOR,
+        n_chunks = np.full( len( network.miner_hotkeys ), challenges.MIN_CHUNKS ),
+        hash = True,
+    )
+    hash_index = storage.hash_index.HashIndex()
+    chains = storage.chains.HashChains( size = config.chunk_size )
+    manifest = allocate.manifest_path( network.validator_root )
+    scheduler = challenges.ChallengeScheduler( allocations, budget = config.challenge_budget )
+    validator_config = types.SimpleNamespace(
+        max_concurrent_challenges = 64,
+        challenge_timeout = config.challenge_timeout,
+        chunks_per_challenge = config.chunks_per_challenge,
+        challenge_mode = config.challenge_mode,
+        proof_leaves = 4,
+    )
+    dendrite = network.dendrite()
+
+    # The hash tables of the initial estimates, generated before the first round like a validator's first start.
+    began = time.time()
+    allocate.reallocate( allocations = allocations, manifest = manifest, no_prompt = True, chains = chains )
+    for alloc in allocations:
+        hash_index.update( alloc )
+    setup_seconds = time.time() - began
+
+    rounds = []
+    began = time.time()
+    for _ in range( config.rounds ):
+        rounds.append( validator.validate( loop, dendrite, network.metagraph.axons, allocations, scheduler, hash_index, chains, manifest, validator_config, network.validator_hotkey ) )
+    seconds = time.time() - began
+    chains.close()
+
+    error = np.abs( allocations.n_chunks - network.capacity ) / network.capacity
+    return dict(
+        network_stats( dendrite, seconds ),
+        setup_seconds = setup_seconds,
+        seconds = seconds,
+        rounds = len( rounds ),
+        challenged = sum( result['challenged'] for result in rounds ),
+        challenges_per_second = sum( result['challenged'] for result in rounds ) / seconds if seconds > 0 else 0.0,
+        sweep = summary( [ result['sweep_seconds'] for result in rounds ] ),
+        reallocate = summary( [ result['reallocate_seconds'] for result in rounds ] ),
+        estimate_error = { 'median': float( np.median( error ) ), 'max': float( error.max() ) },
+        scheduler = scheduler.stats(),
+        chains = chains.stats(),
+        hash_index_bytes = hash_index.nbytes(),
+    )
+
+def run_bridge( config: argparse.Namespace, network: Network, loop: asyncio.AbstractEventLoop ) -> dict:
+    """
+    Upload and download --files files through the bridge's /store/ and /retrieve/ endpoints, checking every byte.
+    """
+    # The bridge needs fastapi, and records files in ./test.db of the working directory.
+    import bridge
+    from fastapi import UploadFile
+
+    bridge_config = types.SimpleNamespace(
+        db_root_path = network.root,
+        wallet = types.SimpleNamespace( name = network.WALLET_NAME, hotkey = network.HOTKEY_NAME ),
+        upload_window = 4,
+        prefetch = 4,
+        data_shards = config.data_shards,
+        parity_shards = config.parity_shards,
+        hedge_percentile = 95.0,
+        frame_size = config.frame_size,
+    )
+    bridge.CHUNK_SIZE = config.upload_chunk_size
+
+    # Uploads land in the validator's hash tables of the miners, which hold one row per chunk of each miner.
+    allocations = allocation_table.AllocationTable( network.validator_root, network.validator_hotkey, network.miner_hotkeys, role = allocation_table.VALIDATOR, n_chunks = network.capacity, hash = True )
+    chains = storage.chains.HashChains( size = config.chunk_size )
+    chains.resize( allocations.to_dicts() )
+    chains.close()
+    for alloc in allocations:
+        bridge.hash_index.update( alloc )
+
+    dendrite = network.dendrite()
+    wallet = fakes.Wallet( network.validator_hotkey, network.WALLET_NAME, network.HOTKEY_NAME )
+    metagraph_cache = storage.metagraph.MetagraphCache( fakes.Subtensor( network.metagraph ), netuid = 0 )
+    app = bridge.create_app( bridge_config, wallet, dendrite, metagraph_cache )
+    endpoints = { route.path: route.endpoint for route in app.routes if hasattr( route, 'endpoint' ) }
+
+    async def round_trip( data: bytes ) -> dict:
+        began = time.time()
+        stored = await endpoints['/store/']( file = UploadFile( file = io.BytesIO( data ), filename = 'benchmark.bin' ) )
+        upload_seconds = time.time() - began
+        if not stored['status']:
+            return { 'stored': False, 'upload_seconds': upload_seconds }
+        began = time.time()
+        response = await endpoints['/retrieve/']( hash = stored['hash'] )
+        first_byte, received = None, []
+        async for part in response.body_iterator:
+            first_byte = first_byte or time.time() - began
+            received.append( part )
+        return {
+            'stored': True,
+            'verified': hashlib.sha256( b''.join( received ) ).digest() == hashlib.sha256( data ).digest(),
+            'upload_seconds': upload_seconds,
+            'download_seconds': time.time() - began,
+            'first_byte_seconds': first_byte or 0.0,
+        }
+
+    results = [ loop.run_until_complete( round_trip( random.randbytes( config.file_size ) ) ) for _ in range( config.files ) ]
+    uploaded = [ result for result in results if result['stored'] ]
+    upload_seconds = sum( result['upload_seconds'] for result in results )
+    download_seconds = sum( result['download_seconds'] for result in uploaded )
+    return dict(
+        network_stats( dendrite, upload_seconds + download_seconds ),
+        files = len( results ),
+        stored = len( uploaded ),
+        verified = sum( result['verified'] for result in uploaded ),
+        upload = dict( summary( [ result['upload_seconds'] for result in results ] ), bytes_per_second = len( uploaded ) * config.file_size / upload_seconds if upload_seconds > 0 else 0.0 ),
+        download = dict( summary( [ result['download_seconds'] for result in uploaded ] ), bytes_per_second = len( uploaded ) * config.file_size / download_seconds if download_seconds > 0 else 0.0 ),
+        first_byte = summary( [ result['first_byte_seconds'] for result in uploaded ] ),
+    )
+
+def main( config: argparse.Namespace ):
+    random.seed( config.seed )
+    suites = [ suite for suite in config.suites.split( ',' ) if suite ]
+    for suite in suites:
+        if suite not in SUITES:
+            raise SystemExit( f"Unknown suite: {suite}" )
+    allocate.CHUNK_SIZE = config.chunk_size
+
+    report = { 'config': vars( config ) }
+    cwd = os.getcwd()
+    output = os.path.abspath( config.output ) if config.output else None
+    with tempfile.TemporaryDirectory( prefix = 'storage-benchmark-' ) as root:
+        os.chdir( root )
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop( loop )
+        network = Network( config, root )
+        report['generate_seconds'] = network.generate_seconds
+        try:
+            for suite in suites:
+                bt.logging.info(f"Running the {suite} benchmark")
+                report[ suite ] = { 'miner': run_miner, 'validator': run_validator, 'bridge': run_bridge }[ suite ]( config, network, loop )
+        finally:
+            network.shutdown()
+            storage.connections.manager.close()
+            loop.close()
+            os.chdir( cwd )
+
+    text = json.dumps( report, indent = 2 )
+    if output:
+        with open( output, 'w' ) as f:
+            f.write( text )
+    else:
+        print( text )
+
+if __name__ == "__main__":
+    main( get_config() )
@@ -24,68 +24,134 @@
 import os
 import typing
 import time
+import asyncio
 import random
 import uvicorn
 import argparse
 import hashlib
 import sqlite3
 import secrets
+import zipfile
+import numpy as np
 import bittensor as bt
 import database
+import scoreboard
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from fastapi import FastAPI, File, UploadFile
-from pathlib import Path
+from fastapi import FastAPI, File, UploadFile, HTTPException
 
 # Import this repo
 import storage
 
 LIMIT_LOOP_COUNT = 3 # Maximum loop_count for every loop
 CHUNK_STORE_COUNT = 1 # Number of chunks to store
+RETRIEVE_BATCH_SIZE = 32 # Maximum number of keys fetched from a miner per request
 CHUNK_SIZE = 1 << 22    # 1 MB
 MIN_N_CHUNKS = 1 << 8  # the minimum number of chunks a miner should provide at least is 1GB (CHUNK_SIZE * MIN_N_CHUNKS)
 TB_NAME = "saved_data"
+VALIDATOR_STATE_NAME = "validator_state.npz" # Checkpoint the validator writes next to its hash tables, see neurons/state.py
+ERASURE_TB_NAME = "erasure"
+
+# In-memory index of the expected hashes of the chunks held by each miner.
+hash_index = storage.hash_index.HashIndex()
+
+# Allocation details of the hash table the validator keeps for a miner.
+def miner_allocation(config, miner_hotkey, validator_hotkey):
+    return {
+        'path': f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/DB-{miner_hotkey}-{validator_hotkey}",
+        'seed': f"{miner_hotkey}{validator_hotkey}",
+    }
+
+# Number of chunks the validator has verified for each miner by hotkey, read from its latest checkpoint.
+# Empty when the validator has not written one yet.
+def verified_chunks(config):
+    path = f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/{VALIDATOR_STATE_NAME}"
+    try:
+        with np.load(os.path.expanduser(path), allow_pickle = False) as checkpoint:
+            return dict(zip(checkpoint['hotkeys'].tolist(), checkpoint['verified'].tolist()))
+    except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+        return {}
+
+# Path of the database recording where the chunks of a stored file are held.
+def file_db_path(config, db_name):
+    return f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/data/{db_name}.db"
 
 # Create a database to store the given file
-def create_database_for_file(db_name):
+def create_database_for_file(config, db_name, data_shards = 1, parity_shards = 0):
     db_base_path = f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/data"
     if not os.path.exists(db_base_path):
         os.makedirs(db_base_path, exist_ok=True)
 
-    conn = sqlite3.connect(f"{db_base_path}/{db_name}.db")
-    cursor = conn.cursor()
-    
-    cursor.execute(f"CREATE TABLE IF NOT EXISTS {TB_NAME} (chunk_id INTEGER PRIMARY KEY, miner_hotkey TEXT, miner_key INTEGER)")
-    conn.close()
+    with storage.connections.writer(file_db_path(config, db_name)) as conn:
+        # A chunk has one row per shard per miner holding it, size is the length of the chunk before encoding.
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {TB_NAME} (chunk_id INTEGER, shard INTEGER, miner_hotkey TEXT, miner_key INTEGER, size INTEGER)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {TB_NAME}_chunk_id ON {TB_NAME} (chunk_id)")
+        # The erasure code every chunk of the file is encoded with.
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {ERASURE_TB_NAME} (data_shards INTEGER, parity_shards INTEGER)")
+        conn.execute(f"INSERT INTO {ERASURE_TB_NAME} (data_shards, parity_shards) VALUES (?, ?)", (data_shards, parity_shards))
 
 # Save the chunk(index : chunk_number) to db_name
-def save_chunk_location(db_name, chunk_number, store_resp_list):
-    conn = sqlite3.connect(f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/data/{db_name}.db")
-    cursor = conn.cursor()
-
-    for store_resp in store_resp_list:
-        cursor.execute(f"INSERT INTO {TB_NAME} (chunk_id, miner_hotkey, miner_key) VALUES (?, ?, ?)", (chunk_number, store_resp['hotkey'], store_resp['key']))
-    conn.commit()
-    conn.close()
+def save_chunk_location(config, db_name, chunk_number, store_resp_list):
+    with storage.connections.writer(file_db_path(config, db_name)) as conn:
+        conn.executemany(
+            f"INSERT INTO {TB_NAME} (chunk_id, shard, miner_hotkey, miner_key, size) VALUES (?, ?, ?, ?, ?)",
+            [(chunk_number, store_resp['shard'], store_resp['hotkey'], store_resp['key'], store_resp['size']) for store_resp in store_resp_list]
+        )
 
-# Update the hash value of miner table
-def update_miner_hash(validator_hotkey, store_resp_list):
+# Load the layout of a stored file: where each shard of each chunk is held, the chunk sizes and the erasure code.
+def load_file_layout(db_path):
+    with storage.connections.reader(db_path) as conn:
+        try:
+            rows = conn.execute(f"SELECT chunk_id, shard, miner_hotkey, miner_key, size FROM {TB_NAME}").fetchall()
+            data_shards, parity_shards = conn.execute(f"SELECT data_shards, parity_shards FROM {ERASURE_TB_NAME}").fetchone()
+        except sqlite3.OperationalError:
+            # Files stored before erasure coding hold every chunk whole, as shard 0 of a 1 + 0 code.
+            rows = [(chunk_id, 0, miner_hotkey, miner_key, None) for chunk_id, miner_hotkey, miner_key in conn.execute(f"SELECT chunk_id, miner_hotkey, miner_key FROM {TB_NAME}").fetchall()]
+            data_shards, parity_shards = 1, 0
+
+    locations = {}
+    sizes = {}
+    for chunk_id, shard, miner_hotkey, miner_key, size in rows:
+        locations.setdefault(chunk_id, []).append((shard, miner_hotkey, miner_key))
+        sizes[chunk_id] = size
+    return locations, sizes, data_shards, parity_shards
+
+# Update the hash value of miner table. Returns the responses whose key has a row in the
+# validator's table for the miner, the others can not be verified and count as not stored.
+def update_miner_hash(config, validator_hotkey, store_resp_list):
+    recorded = []
     for store_resp in store_resp_list:
-        miner_hotkey = store_resp['hotkey']
-        db_path = f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/DB-{miner_hotkey}-{validator_hotkey}"
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        update_request = f"UPDATE DB{miner_hotkey}{validator_hotkey} SET hash = ? where id = ?"
-        cursor.execute(update_request, (store_resp['hash'], store_resp['key']))
-        conn.commit()
-        conn.close()
-
-# Hash the given data
+        alloc = miner_allocation(config, store_resp['hotkey'], validator_hotkey)
+        with storage.connections.writer(alloc['path']) as conn:
+            try:
+                update_request = f"UPDATE DB{alloc['seed']} SET hash = ?, merkle_root = ? where id = ?"
+                cursor = storage.connections.execute(conn, update_request, (store_resp['hash'], store_resp['root'], store_resp['key']))
+            except sqlite3.OperationalError:
+                # Tables generated before merkle roots were recorded.
+                update_request = f"UPDATE DB{alloc['seed']} SET hash = ? where id = ?"
+                cursor = storage.connections.execute(conn, update_request, (store_resp['hash'], store_resp['key']))
+        # Ids without a row in the validator's table are not known to the index either.
+        if cursor.rowcount > 0:
+            hash_index.put(alloc, store_resp['key'], store_resp['hash'], store_resp['root'])
+            recorded.append(store_resp)
+    return recorded
+
+# Decode a chunk returned by a miner with the encoding it was stored with. Miners only
+# report no encoding for chunks stored before encodings were recorded, which were either
+# base64 encoded or the repr of their bytes, i.e. b'\x00\x01...'.
+def decode_chunk(data, encoding = None):
+    if encoding is not None:
+        return storage.protocol.decode_data(data, encoding)
+    if data.startswith("b'"):
+        return bytes.fromhex(data[2:-1].replace('\\x', ''))
+    return storage.protocol.decode_data(data, storage.protocol.ENCODING_BASE64)
+
+# Hash the given data, hex encoded like the hashes written by the generator.
 def hash_data(data):
     hasher = hashlib.sha256()
     hasher.update(data)
-    return hasher.digest()
+    return hasher.hexdigest()
 
 # Generate random hash string
 def generate_random_hash_str():
@@ -104,6 +170,27 @@ def get_config():
     parser.add_argument(
         "--no_bridge", action="store_true", help="Run without bridging to the network."
     )
+    parser.add_argument(
+        "--upload_window", type=int, default=8, help="Number of chunks kept in flight while storing a file."
+    )
+    parser.add_argument(
+        "--prefetch", type=int, default=8, help="Number of chunks fetched ahead of the one being sent while retrieving a file."
+    )
+    parser.add_argument(
+        "--data_shards", type=int, default=1, help="Number of data shards each chunk is split into."
+    )
+    parser.add_argument(
+        "--parity_shards", type=int, default=0, help="Number of Reed-Solomon parity shards stored per chunk, any data_shards of the shards recover it."
+    )
+    parser.add_argument(
+        "--hedge_percentile", type=float, default=95, help="Latency percentile of a miner after which a backup read is sent to the next holder."
+    )
+    parser.add_argument(
+        "--frame_size", type=int, default=0, help="Retrieve chunks in frames of this many characters, 0 retrieves whole chunks."
+    )
+    parser.add_argument(
+        "--metagraph_interval", type=int, default=storage.metagraph.BLOCK_INTERVAL, help="Number of blocks between metagraph syncs."
+    )
     # Adds override arguments for network and netuid.
     parser.add_argument("--netuid", type=int, default=7, help="The chain subnet uid.")
     # Adds subtensor specific arguments i.e. --subtensor.chain_endpoint ... --subtensor.network ...
@@ -116,8 +203,6 @@ def get_config():
     config = bt.config(parser)
     return config
 
-app = FastAPI()
-
 def main( config ):
 
     # The wallet holds the cryptographic key pairs for the validator.
@@ -133,8 +218,38 @@ def main( config ):
     bt.logging.info(f"Subtensor: {subtensor}")
 
     # The metagraph holds the state of the network, letting us know about other miners.
-    metagraph = subtensor.metagraph( config.netuid )
-    bt.logging.info(f"Metagraph: {metagraph}")
+    # It is synced in the background once the chain advanced by --metagraph_interval blocks.
+    metagraph_cache = storage.metagraph.MetagraphCache(subtensor, config.netuid, block_interval = config.metagraph_interval).start()
+    bt.logging.info(f"Metagraph: {metagraph_cache.metagraph}")
+
+    app = create_app(config, wallet, dendrite, metagraph_cache)
+    # Run front end.
+    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+def create_app(config, wallet, dendrite, metagraph_cache):
+    """
+    Build the bridge's FastAPI app. The endpoints only reach the network through the dendrite and the
+    metagraph cache, so they can also be served by local stand-ins, i.e. in the benchmarks.
+
+    Args:
+    - config (bt.config): The bridge config, see get_config.
+    - wallet (bt.wallet): The wallet whose hotkey the validator hash tables belong to.
+    - dendrite (bt.dendrite): The client used to reach the miners.
+    - metagraph_cache (storage.metagraph.MetagraphCache): The metagraph of the subnet.
+
+    Returns:
+    - FastAPI: The app, with the /store/ and /retrieve/ endpoints.
+    """
+    hotkey_axon_dict = {axon.hotkey: axon for axon in metagraph_cache.metagraph.axons}
+
+    def sync_axons():
+        # Rebuild the axons by hotkey when a sync registered new hotkeys or moved axons.
+        if any(changes.hotkeys or changes.axons for changes in metagraph_cache.changes()):
+            hotkey_axon_dict.clear()
+            hotkey_axon_dict.update({axon.hotkey: axon for axon in metagraph_cache.metagraph.axons})
+
+    # Live latency, success rate and capacity of every miner, used to place uploads and to order and hedge reads.
+    scores = scoreboard.Scoreboard()
 
     app = FastAPI()
 
@@ -150,146 +265,321 @@ def main( config ):
         allow_headers=["*"],
     )
 
+    async def store_on(axons_list, chunk):
+        """
+        Store an encoded chunk on each of the given axons, either as one Store request or, when
+        --frame_size is set, as a stream of bounded frames.
+
+        Returns:
+        - list: The key each miner stored the chunk under, -1 where the chunk was not stored.
+        """
+        if config.frame_size > 0:
+            async def store_streamed(axon):
+                result = await storage.stream.send(dendrite, axon, None, storage.stream.frames(chunk, config.frame_size), storage.protocol.ENCODING_BASE64)
+                return int(result[0]) if result else -1
+            return await asyncio.gather(*[store_streamed(axon) for axon in axons_list])
+        return await dendrite.forward(
+            axons_list,
+            storage.protocol.Store(data = chunk, encoding = storage.protocol.ENCODING_BASE64),
+            deserialize=True,
+        )
+
+    async def store_timed(axon, chunk):
+        # Store an encoded chunk on one axon, recording how long the miner took and whether it stored it.
+        start_time = time.time()
+        try:
+            key = (await store_on([axon], chunk))[0]
+        except Exception:
+            key = -1
+        scores.observe(axon.hotkey, time.time() - start_time, key != -1)
+        return key
+
+    async def store_chunk(chunk, placement, used):
+        """
+        Store a chunk on CHUNK_STORE_COUNT miners drawn from the placement, retrying failed
+        holders up to LIMIT_LOOP_COUNT times. Holders are never drawn from used, which is
+        updated before any request is sent so the shards of a chunk land on distinct miners.
+
+        Args:
+        - chunk (bytes): The chunk to store.
+        - placement (scoreboard.Placement): Weighted sampler over the active miners.
+        - used (set): Hotkeys already holding part of this chunk.
+
+        Returns:
+        - list: The locations the chunk was stored at, with the key, miner hotkey, hash and merkle root.
+        Only keys whose hash was recorded in the validator's table for the miner count as stored.
+        """
+        validator_hotkey = wallet.hotkey.ss58_address
+        # Encode the chunk as base64 text, which is what the miner stores and the hashes cover.
+        chunk = storage.protocol.encode_data(chunk, storage.protocol.ENCODING_BASE64)
+        chunk_hash = hash_data(chunk.encode('utf-8'))
+        chunk_root = storage.merkle.root(chunk.encode('utf-8')).hex()
+        store_resp_list = []
+        loop_count = 0
+        while len(store_resp_list) < CHUNK_STORE_COUNT and loop_count < LIMIT_LOOP_COUNT:
+            loop_count = loop_count + 1
+            # Choose the miners who will receive the chunk, count: the holders still missing.
+            hotkeys = placement.sample(CHUNK_STORE_COUNT - len(store_resp_list), used)
+            if not hotkeys:
+                break
+            used.update(hotkeys)
+
+            #Transfer the chunk to selected miners
+            axons_list = [hotkey_axon_dict[hotkey] for hotkey in hotkeys]
+            store_response = await asyncio.gather(*[store_timed(axon, chunk) for axon in axons_list])
+
+            stored = [
+                {"key": key, "hotkey": axon.hotkey, "hash": chunk_hash, "root": chunk_root}
+                for axon, key in zip(axons_list, store_response) if key != -1 #Miner saved the chunk
+            ]
+            # A miner may assign a key past the validator's estimate of its allocation, which has no hash row
+            # to record the chunk in. Such a chunk could never be verified, so the next loop retries elsewhere.
+            for store_resp in update_miner_hash(config, validator_hotkey, stored):
+                scores.stored(store_resp['hotkey'])
+                store_resp_list.append(store_resp)
+        return store_resp_list
+
     @app.post("/store/")
     async def store( file: UploadFile = File(...) ):
         # Find all active nodes
+        sync_axons()
+        axons = list(hotkey_axon_dict.values())
         ping_response = await dendrite.forward(
-            metagraph.axons,
+            axons,
             storage.protocol.Ping(),
             deserialize=True,
         )
-        
-        active_axons = [axon for i, axon in enumerate(metagraph.axons) if ping_response[i] == "OK"]
+
+        active_axons = [axon for i, axon in enumerate(axons) if ping_response[i] == "OK"]
+        if not active_axons:
+            return {"status": False, "error_msg" : "NETWORK IS BUSY"}
+
+        # Weight every active miner by its latency, success rate and the verified capacity it has left.
+        # The capacity is what the validator's challenges proved, not the size of its hash table for the miner.
+        verified = verified_chunks(config)
+        for axon in active_axons:
+            scores.set_capacity(axon.hotkey, verified.get(axon.hotkey, 0))
+        active_hotkeys = [axon.hotkey for axon in active_axons]
 
         db_name = generate_random_hash_str()
-        create_database_for_file(db_name)
-        # Number of miners
-        axon_count = len(active_axons)
-        
+        create_database_for_file(config, db_name, config.data_shards, config.parity_shards)
+
+        # Keep up to --upload_window chunks in flight, each recorded as soon as its miners acknowledge it.
+        window = asyncio.Semaphore(config.upload_window)
+        failed = asyncio.Event()
+
+        async def upload_chunk(chunk_number, chunk):
+            try:
+                # Split the chunk into data and parity shards and store every shard.
+                shards = await asyncio.get_running_loop().run_in_executor(None, storage.erasure.encode, chunk, config.data_shards, config.parity_shards)
+                # Rebuild the weights per chunk, so the capacity used by earlier chunks of the upload is accounted for.
+                placement = scores.placement(active_hotkeys)
+                used = set()
+                shard_resp_lists = await asyncio.gather(*[store_chunk(shard, placement, used) for shard in shards])
+                if not all(shard_resp_lists):
+                    failed.set()
+                    return
+                store_resp_list = [
+                    dict(store_resp, shard = shard, size = len(chunk))
+                    for shard, shard_resp_list in enumerate(shard_resp_lists)
+                    for store_resp in shard_resp_list
+                ]
+                #Save the key to db, the hashes were recorded as each shard was stored
+                save_chunk_location(config, db_name, chunk_number, store_resp_list)
+            except Exception as e:
+                bt.logging.error(f"Failed to store chunk {chunk_number}: {e}")
+                failed.set()
+            finally:
+                window.release()
+
+        tasks = []
         chunk_number = 0
-        while chunk := await file.read(CHUNK_SIZE):
-            hex_representation = ''.join([f'\\x{byte:02x}' for byte in chunk])
-
-            # Construct the desired string
-            chunk = f"b'{hex_representation}'"
-            store_resp_list = []
-            index_list = []
-            loop_count = 0
-            while len(store_resp_list) < CHUNK_STORE_COUNT and loop_count < LIMIT_LOOP_COUNT:
-                loop_count = loop_count + 1
-                #Generate list of miners who will receive chunk, count: CHUNK_STORE_COUNT
-                store_count = min(CHUNK_STORE_COUNT * 2, axon_count - len(index_list))
-                for i in range(axon_count):
-                    while True:
-                        chunk_i = random.randint(0, axon_count - 1)
-                        if chunk_i in index_list:
-                            continue
-                        index_list.append(chunk_i)
-                        break
-                
-                #Transfer the chunk to selected miners
-                axons_list = []
-                for index in index_list:
-                    axons_list.append(active_axons[index])
-
-                store_response = await dendrite.forward(
-                    axons_list,
-                    storage.protocol.Store(data = chunk),
-                    deserialize=True,
-                )
-                
-                for index, key in enumerate(store_response):
-                    if key != -1: #Miner saved the chunk
-                        store_resp_list.append({"key": key, "hotkey": axons_list[index].hotkey, "hash": hash_data(chunk.encode('utf-8'))})
-
-            if not store_resp_list:
-                return {"status": False, "error_msg" : "NETWORK IS BUSY"}
-            
-            #Save the key to db
-            save_chunk_location(db_name, chunk_number, store_resp_list)
-            
-            #Update the hash value of the key that miner responded
-            update_miner_hash(wallet.hotkey.ss58_address, store_resp_list)
-
+        while not failed.is_set():
+            await window.acquire()
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk or failed.is_set():
+                window.release()
+                break
+            tasks.append(asyncio.create_task(upload_chunk(chunk_number, chunk)))
             chunk_number += 1
+        await asyncio.gather(*tasks)
+
+        if failed.is_set():
+            return {"status": False, "error_msg" : "NETWORK IS BUSY"}
         database.save_file_info(file.filename, db_name)
         return {"status": True, "hash":db_name}
 
+    async def fetch_batch(axon, keys):
+        """
+        Fetch the data under a list of keys from a single miner, either as one batched request
+        or, when --frame_size is set, as one stream of bounded frames per key. Returns a
+        (data, encoding) pair per key, None for keys which were not found, or None if the
+        miner did not answer.
+        """
+        if config.frame_size > 0:
+            async def fetch_streamed(key):
+                frames, encodings = [], []
+                received = await storage.stream.receive(dendrite, axon, key, frames.append, frame_size = config.frame_size, on_encoding = encodings.append)
+                return (''.join(frames), encodings[0] if encodings else None) if received else None
+            return await asyncio.gather(*[fetch_streamed(key) for key in keys])
+        response = await dendrite.forward(axon, storage.protocol.RetrieveBatch(keys = keys), deserialize=False)
+        if response.data is None:
+            return None
+        encodings = response.encodings or []
+        return [(data, encodings[index] if index < len(encodings) else None) if data is not None else None for index, data in enumerate(response.data)]
+
+    async def fetch_timed(miner_hotkey, keys):
+        # Fetch a batch of keys from a miner, recording how long it took to answer.
+        start_time = time.time()
+        try:
+            data_list = await fetch_batch(hotkey_axon_dict[miner_hotkey], keys)
+        except Exception:
+            scores.observe(miner_hotkey, time.time() - start_time, False)
+            raise
+        scores.observe(miner_hotkey, time.time() - start_time, data_list is not None)
+        return data_list
+
+    async def fetch_shards(chunk_ids, locations, needed):
+        """
+        Fetch and verify the shards of a set of chunks with hedged reads. Each missing shard is first
+        requested from its historically fastest holder, batching all keys sent to the same miner into
+        one request. When no response arrives within the --hedge_percentile latency of the miners
+        still answering, a backup request goes to the next holder of every missing shard, and a shard
+        whose requests all failed moves on to its next holder straight away. Fetching stops as soon as
+        each chunk has needed shards, cancelling the requests still in flight.
+
+        Args:
+        - chunk_ids (list): The chunk numbers to fetch.
+        - locations (dict): Maps each chunk number to its list of (shard, miner_hotkey, miner_key) holders.
+        - needed (int): The number of distinct shards required per chunk.
+
+        Returns:
+        - dict: Maps each chunk number to a dict of its verified shards, shard index to a (data, encoding) pair.
+        """
+        validator_hotkey = wallet.hotkey.ss58_address
+        shards = {id: {} for id in chunk_ids}
+
+        # Holders of every shard which are still on the network, fastest first.
+        holders = {}
+        for id in chunk_ids:
+            for shard, miner_hotkey, miner_key in locations[id]:
+                if miner_hotkey in hotkey_axon_dict:
+                    holders.setdefault((id, shard), []).append((miner_hotkey, miner_key))
+        for shard_holders in holders.values():
+            ranked = scores.rank([miner_hotkey for miner_hotkey, _ in shard_holders])
+            shard_holders.sort(key = lambda holder: ranked.index(holder[0]))
+        next_holder = {shard_key: 0 for shard_key in holders}
+        in_flight = {shard_key: 0 for shard_key in holders}
+
+        def missing():
+            return [(id, shard) for id, shard in holders if len(shards[id]) < needed and shard not in shards[id]]
+
+        tasks = {}
+        def send(shard_keys):
+            # Request every given shard from its next untried holder, batched per miner.
+            requests = {}
+            for shard_key in shard_keys:
+                index = next_holder[shard_key]
+                if index >= len(holders[shard_key]):
+                    continue
+                next_holder[shard_key] = index + 1
+                miner_hotkey, miner_key = holders[shard_key][index]
+                requests.setdefault(miner_hotkey, []).append((shard_key, str(miner_key)))
+            sent = set()
+            for miner_hotkey, entries in requests.items():
+                for start in range(0, len(entries), RETRIEVE_BATCH_SIZE):
+                    batch = entries[start:start + RETRIEVE_BATCH_SIZE]
+                    for shard_key, _ in batch:
+                        in_flight[shard_key] += 1
+                    task = asyncio.create_task(fetch_timed(miner_hotkey, [key for _, key in batch]))
+                    tasks[task] = (miner_hotkey, batch)
+                    sent.add(task)
+            return sent
+
+        pending = send(missing())
+        try:
+            while pending and missing():
+                hedge_delay = max(scores.percentile(tasks[task][0], config.hedge_percentile) for task in pending)
+                finished, pending = await asyncio.wait(pending, timeout = hedge_delay, return_when = asyncio.FIRST_COMPLETED)
+                if not finished:
+                    # Every miner is running late, hedge each missing shard on its next holder.
+                    pending |= send(missing())
+                    continue
+
+                # Keep every shard whose data matches the hash recorded when it was stored.
+                for task in finished:
+                    miner_hotkey, batch = tasks[task]
+                    data_list = task.result() if task.exception() is None else None
+                    alloc = miner_allocation(config, miner_hotkey, validator_hotkey)
+                    if not all(hash_index.holds(alloc, key) for _, key in batch):
+                        # The table was not loaded yet or the validator has added rows since, read the rows past
+                        # the loaded length without blocking the event loop.
+                        await asyncio.get_running_loop().run_in_executor(None, hash_index.update, alloc)
+                    for index, ((id, shard), key) in enumerate(batch):
+                        in_flight[(id, shard)] -= 1
+                        entry = data_list[index] if data_list and index < len(data_list) else None
+                        if entry and entry[0] and hash_data(entry[0].encode('utf-8')) == hash_index.hexdigest(alloc, key):
+                            shards[id][shard] = entry
+
+                # Shards with no request left in flight move on to their next holder.
+                pending |= send([shard_key for shard_key in missing() if in_flight[shard_key] == 0])
+        finally:
+            for task in pending:
+                task.cancel()
+        return shards
+
     @app.get("/retrieve/")
-    async def retrieve( hash: str ) -> str:
+    async def retrieve( hash: str ) -> StreamingResponse:
         db_name = hash
-        output_filename = time.time()
-        db_path = f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/data/{db_name}.db"
+        db_path = file_db_path(config, db_name)
 
         if not os.path.exists(db_path):
             raise HTTPException(status_code=404, detail="Invalid hash value")
+        sync_axons()
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute(f"SELECT * FROM {TB_NAME}")
-        rows = cursor.fetchall()
-
-        chunk_size = max(rows, key=lambda obj: obj[0])[0] + 1
-        
-        hotkey_axon_dict = {}
-        for axon in metagraph.axons:
-            hotkey_axon_dict[axon.hotkey] = axon
-
-        file_path = str(time.time())
+        # Read the locations of every shard at once.
+        locations, sizes, data_shards, parity_shards = load_file_layout(db_path)
+        chunk_count = max(locations) + 1 if locations else 0
 
-        validator_hotkey = wallet.hotkey.ss58_address
+        def decode_shards(shards, size):
+            return storage.erasure.decode({shard: decode_chunk(*entry) for shard, entry in shards.items()}, data_shards, parity_shards, size)
 
-        with open(file_path, 'wb') as output_file:
-            for id in range(chunk_size):
-                cursor.execute(f"SELECT * FROM {TB_NAME} where chunk_id = {id}")
-                rows = cursor.fetchall()
-                hotkey_list = [row[1] for row in rows]
-                key_list = {row[1]:row[2] for row in rows}
-                axons_list = [hotkey_axon_dict[hotkey] for hotkey in hotkey_list]
-
-                miner_hotkey = axons_list[0].hotkey
-                db = sqlite3.connect( f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/DB-{miner_hotkey}-{validator_hotkey}")
-                validation_hash = (
-                    db.cursor()
-                    .execute(
-                        f"SELECT hash FROM DB{miner_hotkey}{validator_hotkey} WHERE id=?", (key_list[miner_hotkey],)
-                    )
-                    .fetchone()[0]
-                )
-                db.close()
-                
-                chunk_data = ''
-                loop_count = 0
-                while not chunk_data and loop_count < LIMIT_LOOP_COUNT:
-                    loop_count = loop_count + 1
-                    retrieve_response = await dendrite.forward(
-                        axons_list,
-                        storage.protocol.Retrieve(key_list = key_list),
-                        deserialize=True,
-                    )
-                    for index, retrieve_resp in enumerate(retrieve_response):
-                        if retrieve_resp and hash_data(retrieve_resp.encode('utf-8')) == validation_hash:
-                            chunk_data = retrieve_resp
-                            break
-                if not chunk_data:
+        async def fetch_window(chunk_ids):
+            # Fetch, verify and decode a window of consecutive chunks from the first data_shards shards of each to arrive.
+            shards = await fetch_shards([id for id in chunk_ids if id in locations], locations, data_shards)
+            for id in chunk_ids:
+                if len(shards.get(id, {})) < data_shards:
                     raise HTTPException(status_code=404, detail=f"Chunk_{id} is missing!")
-                else:
-                    hex_representation = chunk_data.split("'")[1]
-                    clean_hex_representation = ''.join(c for c in hex_representation if c in '0123456789abcdefABCDEF')
-                    # Convert the cleaned hexadecimal representation back to bytes
-                    chunk_data = bytes.fromhex(clean_hex_representation)
-                    output_file.write(chunk_data)
-        conn.close()
-        path = Path(file_path)
+            loop = asyncio.get_running_loop()
+            return await asyncio.gather(*[loop.run_in_executor(None, decode_shards, shards[id], sizes[id]) for id in chunk_ids])
+
+        # The first window is chunk 0 alone so the response starts after a single chunk,
+        # every following window holds --prefetch chunks and is fetched while the previous one is sent.
+        windows = [[0]] + [list(range(start, min(start + config.prefetch, chunk_count))) for start in range(1, chunk_count, config.prefetch)] if chunk_count else []
+        first_window = await fetch_window(windows[0]) if windows else []
+
+        async def stream_chunks():
+            next_task = asyncio.create_task(fetch_window(windows[1])) if len(windows) > 1 else None
+            try:
+                for data in first_window:
+                    yield data
+                for index in range(2, len(windows) + 1):
+                    task = next_task
+                    next_task = asyncio.create_task(fetch_window(windows[index])) if index < len(windows) else None
+                    for data in await task:
+                        yield data
+            except HTTPException as e:
+                # The response has started so the download can only be aborted.
+                bt.logging.error(f"Aborting retrieve of {hash}: {e.detail}")
+                raise
+            finally:
+                if next_task is not None:
+                    next_task.cancel()
+
         filename = database.get_filename_for_hash(hash)
-        try:
-            return StreamingResponse(open(path, "rb"), media_type="application/octet-stream", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error retrieving file: {str(e)}")
-    # Run front end.
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-    
+        return StreamingResponse(stream_chunks(), media_type="application/octet-stream", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    return app
+
 if __name__ == "__main__":
     config = get_config()
     main( config )
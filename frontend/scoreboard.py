@@ -0,0 +1,179 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import random
+import collections
+
+# Number of latency samples kept per miner.
+SAMPLE_COUNT = 64
+# Number of samples needed before a miner's own percentiles are trusted.
+MIN_SAMPLES = 4
+# Latency assumed for miners with too few samples, in seconds.
+DEFAULT_LATENCY = 1.0
+# Weight of the newest observation in the moving averages.
+EWMA_ALPHA = 0.2
+# Draws per requested holder before placement falls back to a scan.
+SAMPLE_ATTEMPTS = 4
+
+class MinerStats:
+    """
+    What the bridge has observed of a single miner.
+    """
+
+    def __init__(self, sample_count, default_latency):
+        self.samples = collections.deque(maxlen = sample_count)
+        self.latency = default_latency
+        self.success_rate = 1.0
+        self.capacity = 0
+        self.stored = 0
+
+    @property
+    def remaining(self):
+        # Chunk slots of the verified allocation not yet used by the bridge.
+        return max(0, self.capacity - self.stored)
+
+class Scoreboard:
+    """
+    Keeps live statistics for every miner the bridge talks to: a window of recent response
+    latencies, moving averages of latency and success rate, and the verified capacity left.
+    Reads go to the fastest holder first and hedge once a holder runs late, and uploads are
+    placed on miners which will serve them back quickly.
+    """
+
+    def __init__(self, sample_count = SAMPLE_COUNT, default_latency = DEFAULT_LATENCY):
+        self.sample_count = sample_count
+        self.default_latency = default_latency
+        self.miners = {}
+
+    def stats(self, hotkey):
+        if hotkey not in self.miners:
+            self.miners[hotkey] = MinerStats(self.sample_count, self.default_latency)
+        return self.miners[hotkey]
+
+    def observe(self, hotkey, latency, success = True):
+        """
+        Record a response from a miner: its latency in seconds and whether it succeeded.
+        """
+        stats = self.stats(hotkey)
+        stats.samples.append(latency)
+        stats.latency += EWMA_ALPHA * (latency - stats.latency)
+        stats.success_rate += EWMA_ALPHA * (float(success) - stats.success_rate)
+
+    def set_capacity(self, hotkey, capacity):
+        """
+        Set the number of chunk slots the validator has verified for a miner.
+        """
+        self.stats(hotkey).capacity = capacity
+
+    def stored(self, hotkey, count = 1):
+        """
+        Record that the bridge used count chunk slots on a miner.
+        """
+        self.stats(hotkey).stored += count
+
+    def percentile(self, hotkey, q):
+        """
+        Return the q-th percentile (0-100) of a miner's recent latencies, or the default latency
+        if there are too few samples.
+        """
+        stats = self.miners.get(hotkey)
+        if stats is None or len(stats.samples) < MIN_SAMPLES:
+            return self.default_latency
+        ordered = sorted(stats.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * q / 100))
+        return ordered[index]
+
+    def rank(self, hotkeys):
+        """
+        Return the hotkeys ordered fastest first by median latency. Miners without samples
+        rank at the default latency, ties keep their given order.
+        """
+        return sorted(hotkeys, key = lambda hotkey: self.percentile(hotkey, 50))
+
+    def weight(self, hotkey):
+        """
+        Placement weight of a miner: its success rate times its remaining capacity over its
+        average latency, zero once it has no verified space left.
+        """
+        stats = self.stats(hotkey)
+        return stats.success_rate * stats.remaining / max(stats.latency, 1e-3)
+
+    def placement(self, hotkeys):
+        """
+        Build a Placement over the given hotkeys from their current weights.
+        """
+        return Placement(hotkeys, [self.weight(hotkey) for hotkey in hotkeys])
+
+class Placement:
+    """
+    Weighted sampling of distinct miners with Walker's alias method. Building the table is O(n)
+    and each draw is O(1), so choosing k holders for a chunk takes O(k) expected draws.
+    If every weight is zero the miners are sampled uniformly.
+    """
+
+    def __init__(self, hotkeys, weights):
+        self.hotkeys = list(hotkeys)
+        self.weights = list(weights)
+        n = len(self.hotkeys)
+        total = sum(self.weights)
+        if total <= 0:
+            self.weights = [1.0] * n
+            total = float(n)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        scaled = [weight * n / total for weight in self.weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] += scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def draw(self):
+        i = random.randrange(len(self.hotkeys))
+        return self.hotkeys[i] if random.random() < self.prob[i] else self.hotkeys[self.alias[i]]
+
+    def sample(self, k, exclude = ()):
+        """
+        Choose up to k distinct hotkeys which are not in exclude, in proportion to their weights.
+        Miners with zero weight are never chosen.
+
+        Returns:
+        - list: The chosen hotkeys, fewer than k if not enough miners are eligible.
+        """
+        chosen = []
+        if not self.hotkeys:
+            return chosen
+        seen = set(exclude)
+        for _ in range(SAMPLE_ATTEMPTS * k):
+            if len(chosen) >= k:
+                return chosen
+            hotkey = self.draw()
+            if hotkey not in seen:
+                seen.add(hotkey)
+                chosen.append(hotkey)
+        # Most of the weight is excluded, pick the rest from what is left, heaviest first.
+        rest = sorted(
+            (i for i, hotkey in enumerate(self.hotkeys) if hotkey not in seen and self.weights[i] > 0),
+            key = lambda i: -self.weights[i],
+        )
+        chosen.extend(self.hotkeys[i] for i in rest[:k - len(chosen)])
+        return chosen
@@ -1,6 +1,7 @@
 import os
+import sys
 import json
-import torch
+import numpy as np
 import shutil
 import typing
 import sqlite3
@@ -8,10 +9,24 @@ import hashlib
 import argparse
 import subprocess
 import bittensor as bt
+import chunkstore
+import generation
+import allocation_table
+import verification
+import storage
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor
 
 CHUNK_SIZE = 1000000
+# The generate_db binary, relative to the cargo directory.
+GENERATOR_BINARY = "./target/release/storer_db_project"
+# Name of the allocation manifest written next to the databases of a wallet.
+MANIFEST_NAME = "partition.json"
+
+# Reallocation job actions.
+ADD = 'add'
+GROW = 'grow'
+SHRINK = 'shrink'
+REMOVE = 'remove'
 
 def get_config() -> bt.config:
     parser = argparse.ArgumentParser(description="Rebase the database based on available memory and also")
@@ -22,6 +37,9 @@ def get_config() -> bt.config:
     parser.add_argument("--no_prompt", action='store_true', default=False, help="Does not wait for user input to confirm the allocation.")
     parser.add_argument("--restart", action='store_true',  default=False, help="Restart the db.")
     parser.add_argument("--workers", required=False, default=10, help="Number of concurrent workers to use.")
+    parser.add_argument("--verify_workers", type=int, default=None, required=False, help="Number of threads verifying the generated chunks, defaults to the number of CPUs.")
+    parser.add_argument("--verify_sample", type=int, default=0, required=False, help="Verify this many random chunks per allocation instead of every chunk, 0 verifies all.")
+    parser.add_argument("--chunk_store", type=str, default=chunkstore.SQLITE, choices=chunkstore.BACKENDS, help="Store chunks as SQLite rows or in append-only segment files.")
     bt.wallet.add_args(parser)
     bt.subtensor.add_args(parser)
     bt.logging.add_args(parser)
@@ -40,6 +58,116 @@ def get_available_space(path: str) -> int:
     stat = os.statvfs(path)
     return stat.f_frsize * stat.f_bavail
 
+def get_allocated_space(allocations: typing.List[dict]) -> int:
+    """
+    Calculate the space already taken on disk by a list of allocations.
+
+    Args:
+    - allocations (list): The allocations, i.e. the entries of the manifest.
+
+    Returns:
+    - int: Allocated space in bytes.
+    """
+    total = 0
+    for alloc in allocations:
+        for path in [alloc['path'], alloc['path'] + '-wal']:
+            if os.path.isfile(path):
+                total += os.path.getsize(path)
+        directory = chunkstore.segment_directory(alloc['path'])
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+def manifest_path(wallet_db_path: str) -> str:
+    """
+    Return the path of the allocation manifest of a wallet's database directory.
+    """
+    return os.path.join(wallet_db_path, MANIFEST_NAME)
+
+def load_manifest(path: str) -> typing.List[dict]:
+    """
+    Load the allocations recorded in a manifest.
+
+    Args:
+    - path (str): The manifest path.
+
+    Returns:
+    - list: The recorded allocations, empty if the manifest does not exist or cannot be read.
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        bt.logging.warning(f"Failed to read allocation manifest {path}, regenerating all allocations: {e}")
+        return []
+
+def save_manifest(path: str, allocations: typing.List[dict]):
+    """
+    Write the allocations to a manifest. The file is replaced atomically so a crash never leaves a partial manifest.
+
+    Args:
+    - path (str): The manifest path.
+    - allocations (list): The allocations which are generated on disk.
+    """
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    entries = [dict(alloc, size = alloc['n_chunks'] * CHUNK_SIZE) for alloc in allocations]
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(entries, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def identity(alloc: dict) -> tuple:
+    # The fields which determine the generated data, allocations recorded without a store were generated into SQLite.
+    return (alloc['seed'], bool(alloc.get('hash')), alloc.get('store') or chunkstore.SQLITE)
+
+def diff(previous: typing.List[dict], allocations: typing.List[dict]) -> typing.List[dict]:
+    """
+    Compare a new allocation plan with the allocations recorded in the manifest.
+
+    Args:
+    - previous (list): The allocations recorded in the manifest.
+    - allocations (list): The new allocations.
+
+    Returns:
+    - list: One job per allocation which changed, a dict with the 'action' (add, grow, shrink or remove), the new 'alloc'
+        and the 'previous' manifest entry. Allocations whose database is missing on disk are added again.
+    """
+    recorded = {alloc['path']: alloc for alloc in previous}
+    jobs = []
+    for alloc in allocations:
+        entry = recorded.pop(alloc['path'], None)
+        exists = os.path.exists(alloc['path']) or os.path.isdir(chunkstore.segment_directory(alloc['path']))
+        if entry is None or not exists or identity(entry) != identity(alloc):
+            jobs.append({'action': ADD, 'alloc': alloc, 'previous': entry})
+        elif alloc['n_chunks'] > entry['n_chunks']:
+            jobs.append({'action': GROW, 'alloc': alloc, 'previous': entry})
+        elif alloc['n_chunks'] < entry['n_chunks']:
+            jobs.append({'action': SHRINK, 'alloc': alloc, 'previous': entry})
+    # Whatever is left in the manifest is no longer allocated.
+    for entry in recorded.values():
+        jobs.append({'action': REMOVE, 'alloc': entry, 'previous': entry})
+    return jobs
+
+def remove(alloc: dict):
+    """
+    Delete the database files of an allocation.
+
+    Args:
+    - alloc (dict): The allocation.
+    """
+    for path in [alloc['path'], alloc['path'] + '-wal', alloc['path'] + '-shm']:
+        if os.path.isfile(path):
+            os.remove(path)
+    directory = chunkstore.segment_directory(alloc['path'])
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+
 def confirm_generation(allocations) -> bool:
     """
     Prompt the user to confirm the deletion of a directory.
@@ -51,7 +179,7 @@ def confirm_generation(allocations) -> bool:
     total_size = sum([alloc['n_chunks'] * CHUNK_SIZE for alloc in allocations])
     bt.logging.info(f'Allocations:')
     for alloc in allocations:
-        bt.logging.info('\n' + json.dumps(alloc, indent=4))
+        bt.logging.info('\n' + json.dumps(dict(alloc), indent=4))
     bt.logging.info(f'Are you sure you want to partition {total_dbs} databases with total size {human_readable_size(total_size)}? (yes/no)')
     response = input()
     return response.lower() in ['yes', 'y']
@@ -75,26 +203,27 @@ def human_readable_size(size: int) -> str:
 
     return f"{size} bytes"
 
-def run_rust_generate(alloc, restart=False):
+def generate_command(alloc, restart=False, progress=False) -> typing.List[str]:
     """
-    This function runs a Rust script to generate the data and hashes databases.
+    Build the command which runs the Rust generator for an allocation.
 
     Args:
     - alloc (dict): A dictionary containing allocation details. It includes the path to the database, the number of chunks, the size of each chunk, and the seed for the random number generator.
-    - hash (bool): A flag indicating whether to generate a hash database. If True, a hash database is generated. If False, a data database is generated. Default is False.
     - restart (bool): A flag indicating whether to restart the database. If True, the existing database is deleted and a new one is created. If False, the existing database is used. Default is False.
+    - progress (bool): If True the generator prints "progress <done> <total>" lines instead of drawing a progress bar.
+
+    Returns:
+    - list: The command, run from the generate_db directory.
     """
-    # Get the path to the database from the allocation details.
-    db_path = alloc['path']
+    # Without a built binary the chunks are generated by storage.generator, which writes the same rows. Segment files still need the binary.
+    if os.path.exists(os.path.join(cargo_directory(), GENERATOR_BINARY)) or alloc.get('store') == chunkstore.SEGMENT:
+        generator = [GENERATOR_BINARY]
+    else:
+        generator = [sys.executable, "-m", "storage.generator"]
 
-    # If the database directory does not exist, create it.
-    if not os.path.exists(os.path.dirname(db_path)):
-        os.makedirs(os.path.dirname(db_path))
-    
     # Construct the command to run the Rust script. The command includes the path to the script, the path to the database, the number of chunks, the size of each chunk, and the seed for the random number generator.
-    cmd = [
-        "./target/release/storer_db_project",
-        "--path", db_path,
+    cmd = generator + [
+        "--path", alloc['path'],
         "--n", str(alloc['n_chunks']),
         "--size", str(CHUNK_SIZE),
         "--seed", alloc['seed'],
@@ -104,38 +233,72 @@ def run_rust_generate(alloc, restart=False):
     if 'hash' in alloc and alloc['hash']:
         cmd.append("--hash")
 
+    # Write the chunks to segment files under {path}.segments instead of an SQLite table.
+    if alloc.get('store') == chunkstore.SEGMENT:
+        cmd.append("--segments")
+
     # If the restart flag is True, add the "--delete" option to the command. This will delete the existing database before creating a new one.
     if restart:
         cmd.append("--delete")
 
-    bt.logging.debug( cmd )
+    if progress:
+        cmd.append("--progress")
+    return cmd
+
+def cargo_directory() -> str:
     # Get the directory containing the Rust script.
-    cargo_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate_db")
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate_db")
+
+def run_rust_generate(alloc, restart=False) -> bool:
+    """
+    This function runs a Rust script to generate the data and hashes databases.
+
+    Args:
+    - alloc (dict): A dictionary containing allocation details. It includes the path to the database, the number of chunks, the size of each chunk, and the seed for the random number generator.
+    - restart (bool): A flag indicating whether to restart the database. If True, the existing database is deleted and a new one is created. If False, the existing database is used. Default is False.
 
-    # Run the command in the cargo directory. The output of the command is not captured.
-    result = subprocess.run(cmd, cwd=cargo_directory, capture_output=False, text=True)
+    Returns:
+    - bool: True if the generator exited successfully.
+    """
+    # If the database directory does not exist, create it.
+    db_path = alloc['path']
+    if not os.path.exists(os.path.dirname(db_path)):
+        os.makedirs(os.path.dirname(db_path))
+
+    cmd = generate_command(alloc, restart)
+    bt.logging.debug( cmd )
+
+    # Run the command in the cargo directory, capturing its errors.
+    result = subprocess.run(cmd, cwd=cargo_directory(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    # If the generator failed, log its exit status and error output.
+    if result.returncode != 0:
+        bt.logging.error(f"Failed to generate database: {db_path} exit status: {result.returncode} stderr: {result.stderr.strip()}")
+        return False
+    return True
 
-    # If there is an error message in the output of the command, log an error message.
-    if result.stderr:
-        bt.logging.error(f"Failed to generate database: {db_path}")
-        
 def generate(
         allocations: typing.List[dict],  # List of allocation details.
         no_prompt = False,  # If True, the function will not prompt for user confirmation. Default is False.
-        workers = 10,  # The number of concurrent workers to use for generation. Default is 10.
-        restart = False  # If True, the database will be restarted. Default is False.
-    ):
+        workers = 10,  # The maximum number of concurrent workers to use for generation. Default is 10.
+        restart = False,  # If True, the database will be restarted. Default is False.
+        remaining: typing.Optional[typing.Dict[str, int]] = None,  # Number of chunks left to generate per path, defaults to n_chunks.
+        on_done: typing.Optional[typing.Callable[[generation.Job], None]] = None,  # Called with each job as it finishes.
+    ) -> typing.List[generation.Job]:
     """
-    This function is responsible for generating data and hashes DBs. It uses multi-threading to speed up the process.
+    This function is responsible for generating data and hashes DBs. The generator processes are run by a
+    generation.Scheduler, which starts the largest allocations (i.e. those of the highest stake validators) first,
+    breaking ties by the number of chunks left, and tunes the number of concurrent processes to the measured throughput.
 
     Args:
-        wallet (bt.wallet): This is a wallet object that contains the name and hotkey.
         allocations (typing.List[dict]): This is a list of dictionaries. Each dictionary contains details about an allocation.
         no_prompt (bool): If this is set to True, the function will not ask for user confirmation before proceeding. By default, it's set to False.
-        workers (int): This is the number of concurrent workers that will be used for generation. By default, it's set to 10.
+        workers (int): This is the maximum number of concurrent workers that will be used for generation. By default, it's set to 10.
         restart (bool): If this is set to True, the database will be restarted. By default, it's set to False.
+        remaining (typing.Dict[str, int]): The number of chunks left to generate for each allocation path, used to order the jobs.
+        on_done (typing.Callable): Called with each generation.Job as it finishes.
     Returns:
-        None
+        list: The generation.Job of each allocation, with its final state and exit status.
     """
     # First, we confirm the allocation step. This is done by calling the confirm_generation function.
     # If the user does not confirm, the program will exit.
@@ -143,74 +306,135 @@ def generate(
         if not confirm_generation( allocations ):
             exit()
 
-    # Finally, we run the generation process. This is done using a ThreadPoolExecutor, which allows us to run multiple tasks concurrently.
-    # For each allocation, we submit two tasks to the executor: one for generating the hash, and one for generating the data.
-    # If only_hash is set to True, we skip the data generation task.
-    with ThreadPoolExecutor( max_workers = workers ) as executor:
-        for alloc in allocations:
-            executor.submit( run_rust_generate, alloc, restart )
-
-def verify( data_allocations, hash_allocations ):
+    jobs = []
+    for alloc in allocations:
+        # If the database directory does not exist, create it.
+        if not os.path.exists(os.path.dirname(alloc['path'])):
+            os.makedirs(os.path.dirname(alloc['path']))
+        deficit = alloc['n_chunks'] if remaining is None else remaining.get(alloc['path'], alloc['n_chunks'])
+        jobs.append(generation.Job(
+            alloc = alloc,
+            cmd = generate_command(alloc, restart, progress = True),
+            cwd = cargo_directory(),
+            chunk_size = CHUNK_SIZE,
+            priority = (alloc['n_chunks'], deficit),
+        ))
+    if not jobs:
+        return jobs
+
+    # Finally, we run the generation process, a few generators at a time and more while the disk keeps up.
+    scheduler = generation.Scheduler( max_workers = int(workers) )
+    jobs = scheduler.run( jobs, on_done = on_done )
+    failed = [job for job in jobs if job.state != generation.DONE]
+    if failed:
+        bt.logging.error(f"Failed to generate {len(failed)} of {len(jobs)} databases: {[job.alloc['path'] for job in failed]}")
+    return jobs
+
+def reallocate(
+        allocations: typing.Iterable[typing.Mapping],  # The allocations, i.e. an AllocationTable or a list of dicts.
+        manifest: str,  # Path to the allocation manifest.
+        no_prompt = False,  # If True, the function will not prompt for user confirmation. Default is False.
+        workers = 10,  # The maximum number of concurrent workers to use for generation. Default is 10.
+        restart = False,  # If True, every database will be regenerated from scratch. Default is False.
+        chains: typing.Optional[storage.chains.HashChains] = None,  # If given, SQLite tables are resized in-process instead of by generator processes.
+    ) -> typing.List[dict]:
     """
-    Verify the integrity of the generated data and hashes.
+    Bring the databases on disk in line with a new allocation plan. The plan is compared with the manifest of the
+    previous pass and only allocations which were added, grown, shrunk or removed are generated or deleted, so a pass
+    over an unchanged plan costs a file read and no generator processes. The manifest is rewritten as jobs finish.
 
     Args:
-    - config (bt.config): Configuration object.
-    - allocations (list): List of allocation details.
-    """
-
-    max_allocs = max( len(data_allocations), len(hash_allocations) )
-    for data_alloc, hash_allocs in list(zip(data_allocations[:max_allocs], hash_allocations[:max_allocs])):
-        # Connect to the SQLite databases for data and hashes.
-        data_conn = sqlite3.connect(data_alloc['path'])
-        hashes_conn = sqlite3.connect(hash_allocs['path'])
-        data_cursor = data_conn.cursor()
-        hashes_cursor = hashes_conn.cursor()
-
-        i = 0
-        while True:
-            data_key = str(i)
-            
-            # Fetch data from the data database using the current key.
-            data_cursor.execute(f"SELECT data FROM DB{data_alloc['seed']} WHERE id=?", (data_key,))
-            data_value = data_cursor.fetchone()
-
-            # Fetch the corresponding hash from the hashes database.
-            hashes_cursor.execute(f"SELECT hash FROM DB{hash_allocs['seed']} WHERE id=?", (data_key,))
-            stored_hash = hashes_cursor.fetchone()
-
-            # If no data is found for the current key, exit the loop.
-            if not data_value:
-                break
-
-            # Compute the hash of the fetched data.
-            computed_hash = hashlib.sha256(data_value[0].encode('utf-8')).hexdigest()
-
-            # Check if the computed hash matches the stored hash.
-            if computed_hash != stored_hash[0]:
-                bt.logging.error(f"Hash mismatch for key {i}!, computed hash: {computed_hash}, stored hash: {stored_hash[0]}")
-                return
-            else:
-                bt.logging.success(f"Hash match for key {i}! computed hash: {computed_hash}, stored hash: {stored_hash[0]}")
+        allocations (typing.Iterable[typing.Mapping]): The new allocations.
+        manifest (str): The path of the allocation manifest, see manifest_path.
+        no_prompt (bool): If this is set to True, the function will not ask for user confirmation before proceeding.
+        workers (int): The maximum number of concurrent workers used for generation.
+        restart (bool): If True the manifest is ignored and every allocation is generated from scratch.
+        chains (storage.chains.HashChains): The in-process hash chain service which resizes SQLite tables, i.e. the validator's.
 
+    Returns:
+        list: The jobs which were run, see diff.
+    """
+    # Copy the rows out of the table, so jobs and the manifest record the plan as it is now.
+    allocations = [dict(alloc) for alloc in allocations]
+    entries = {entry['path']: entry for entry in load_manifest(manifest)}
+    jobs = diff(list(entries.values()), allocations)
+    if not jobs and not restart:
+        bt.logging.debug(f"Allocations unchanged: {len(allocations)}")
+        return jobs
+    counts = {action: sum(job['action'] == action for job in jobs) for action in [ADD, GROW, SHRINK, REMOVE]}
+    bt.logging.info(f"Reallocating: {counts}")
+
+    # Allocations whose seed, kind or store changed are deleted and generated from empty files. The rest are extended
+    # or truncated in place, which also picks up databases generated before the manifest existed.
+    if restart:
+        fresh = changed = allocations
+    else:
+        fresh = [job['alloc'] for job in jobs if job['action'] == ADD and job['previous'] is not None]
+        changed = [job['alloc'] for job in jobs if job['action'] != REMOVE]
+    if not no_prompt and changed:
+        if not confirm_generation( changed ):
+            exit()
 
-            # Increment the key for the next iteration.
-            i += 1
+    # Delete removed and regenerated allocations first to free their space for the rest. Regenerated ones are
+    # recorded as empty, so an interrupted pass grows them on the next run instead of deleting them again.
+    for job in jobs:
+        if job['action'] == REMOVE:
+            bt.logging.debug(f"Removing allocation: {job['alloc']['path']}")
+            remove(job['alloc'])
+            entries.pop(job['alloc']['path'], None)
+            if chains is not None: chains.drop(job['alloc'])
+    for alloc in fresh:
+        remove(alloc)
+        entries[alloc['path']] = dict(alloc, n_chunks = 0)
+        if chains is not None: chains.drop(alloc)
+    save_manifest(manifest, list(entries.values()))
+
+    if chains is not None:
+        # Resize the SQLite tables in-process, in one transaction per database file.
+        in_process = [alloc for alloc in changed if alloc.get('store', chunkstore.SQLITE) == chunkstore.SQLITE]
+        for alloc in chains.resize(in_process):
+            entries[alloc['path']] = alloc
+        save_manifest(manifest, list(entries.values()))
+        changed = [alloc for alloc in changed if alloc.get('store', chunkstore.SQLITE) != chunkstore.SQLITE]
+        if not changed:
+            return jobs
+
+    # Order the jobs by how much is left to generate for each.
+    remaining = {alloc['path']: abs(alloc['n_chunks'] - entries.get(alloc['path'], {'n_chunks': 0})['n_chunks']) for alloc in changed}
+
+    # Record each job in the manifest as it finishes, so finished jobs are not run again after an interruption and
+    # failed or unfinished ones are picked up by the next diff, the generator continuing from its last chunk.
+    def on_done(job: generation.Job):
+        if job.state == generation.DONE:
+            entries[job.alloc['path']] = job.alloc
+            save_manifest(manifest, list(entries.values()))
+
+    generate(allocations = changed, no_prompt = True, workers = workers, restart = False, remaining = remaining, on_done = on_done)
+    return jobs
+
+def verify( data_allocations, hash_allocations, workers = None, sample = 0 ) -> typing.List[verification.Report]:
+    """
+    Verify the integrity of the generated data and hashes, see verification.verify.
 
-        # Log the successful verification of the data.
-        bt.logging.success(f"Verified {data_alloc['path']} with hashes from {hash_allocs['path']}")
+    Args:
+    - data_allocations (list): Allocations whose chunk stores hold the data.
+    - hash_allocations (list): Allocations whose chunk stores hold the expected hashes, paired with the data allocations by seed.
+    - workers (int): The number of verification threads, defaults to the number of CPUs.
+    - sample (int): If above 0, verify this many random chunks per allocation instead of every chunk.
 
-        # Close the database connections.
-        data_conn.close()
-        hashes_conn.close()
+    Returns:
+    - list: A verification.Report per data allocation.
+    """
+    return verification.verify( data_allocations, hash_allocations, workers = workers, sample = sample )
 
 def allocate(
         db_root_path: str,  # Path to the data database.
         wallet: bt.wallet,  # Wallet object
         metagraph: bt.metagraph,  # Metagraph object
         threshold: float = 0.0001,  # Threshold for the allocation.
-        hash: bool = False  # If True, the allocation is for a hash database. If False, the allocation is for a data database. Default is False.
-    ) -> typing.List[dict]:
+        hash: bool = False,  # If True, the allocation is for a hash database. If False, the allocation is for a data database. Default is False.
+        store: str = chunkstore.SQLITE  # The chunk store backend the data is generated into.
+    ) -> allocation_table.AllocationTable:
     """
     This function calculates the allocation of space for each hotkey in the metagraph.
 
@@ -219,59 +443,36 @@ def allocate(
         wallet (bt.wallet): The wallet object containing the name and hotkey.
         metagraph (bt.metagraph): The metagraph object containing the hotkeys.
         threshold (float): The threshold for the allocation. Default is 0.0001.
+        hash (bool): If True, the allocation is for a hash database. Default is False.
+        store (str): The chunk store backend, one of chunkstore.BACKENDS. Default is sqlite.
 
     Returns:
-        list: A list of dictionaries. Each dictionary contains the allocation details for a hotkey.
+        allocation_table.AllocationTable: The allocation for each validator hotkey, rows read like the dicts passed to generate.
     """
     # Calculate the path to the wallet database.
     wallet_db_path = os.path.join(db_root_path, wallet.name, wallet.hotkey_str)
     if not os.path.exists(wallet_db_path):
         os.makedirs(wallet_db_path)
 
-    # Calculate the available space in the data database.
-    available_space = get_available_space( wallet_db_path )
+    # Calculate the available space in the data database, counting the space our current allocations already take
+    # so a reallocation does not shrink them just because they filled the disk.
+    available_space = get_available_space( wallet_db_path ) + get_allocated_space( load_manifest( manifest_path( wallet_db_path ) ) )
 
     # Calculate the filling space based on the available space and the threshold.
     filling_space = available_space * threshold
 
-    # Initialize an empty list to store the allocations.
-    allocations = []
-
-    # Iterate over each hotkey in the metagraph.
-    for i, hotkey in enumerate( metagraph.hotkeys ):
-        # Calculate the denominator for the allocation formula.
-        denom = (metagraph.S + torch.ones_like(metagraph.S)).sum()
-
-        # Calculate the size of the database for the current hotkey.
-        db_size = (((metagraph.S[i] + 1) / denom) * filling_space).item()
-
-        # Calculate the number of chunks for the current hotkey.
-        n_chunks = int(db_size / CHUNK_SIZE) + 1
-
-        # Get the miner key from the wallet.
-        miner_key = wallet.hotkey.ss58_address
-
-        # Get the validator key from the metagraph.
-        validator_key = metagraph.hotkeys[i]
-
-        # Generate the seed for the current hotkey.
-        seed = f"{miner_key}{validator_key}"
-
-        # Calculate the path to the database for the current hotkey.
-        path = f"{wallet_db_path}/DB-{miner_key}-{validator_key}"
-
-        # Append the allocation details for the current hotkey to the allocations list.
-        allocations.append({
-            'path': path,
-            'n_chunks': n_chunks,
-            'seed': seed,
-            'hash': hash,
-            'miner': miner_key,
-            'validator': validator_key,
-        })
-
-    # Return the allocations list.
-    return allocations 
+    # Split the filling space across the validators by stake in a single vectorized pass.
+    return allocation_table.AllocationTable.planned(
+        root = wallet_db_path,
+        owner = wallet.hotkey.ss58_address,
+        peers = metagraph.hotkeys,
+        stake = np.asarray( metagraph.S, dtype = np.float64 ),
+        filling_space = filling_space,
+        chunk_size = CHUNK_SIZE,
+        role = allocation_table.MINER,
+        hash = hash,
+        store = store,
+    )
 
 def main( config ):
     bt.logging( config = config )
@@ -286,16 +487,21 @@ def main( config ):
         metagraph = metagraph,
         threshold = config.threshold,
         hash = config.validator,
+        store = config.chunk_store,
     )
-    bt.logging.info( f"Allocations: {json.dumps(allocations, indent=4)}" )
-    generate(  
+    bt.logging.info( f"Allocations: {json.dumps(allocations.to_dicts(), indent=4)}" )
+    reallocate(  
         allocations = allocations,
+        manifest = manifest_path( os.path.join( db_root_path, wallet.name, wallet.hotkey_str ) ),
         no_prompt = config.no_prompt,
-        workers = config.workers, 
+        workers = int( config.workers ), 
         restart = config.restart,
     )
     if not config.validator:
-        verify( allocations, allocations )
+        reports = verify( allocations, allocations, workers = config.verify_workers, sample = config.verify_sample )
+        failed = [report.to_dict() for report in reports if not report.ok]
+        if failed:
+            bt.logging.error(f"Mismatch report: {json.dumps(failed, indent=4)}")
 
 if __name__ == "__main__":
     main( get_config() )
@@ -0,0 +1,211 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import sys
+import typing
+import collections.abc
+import numpy as np
+import chunkstore
+
+# Roles of the table's owner: a miner holds one allocation per validator, a validator one per miner.
+MINER = 'miner'
+VALIDATOR = 'validator'
+
+# Keys of the dict form of an allocation, as passed to generate and written to the manifest.
+KEYS = [ 'path', 'n_chunks', 'seed', 'hash', 'store', 'miner', 'validator' ]
+
+def plan( stake: np.ndarray, filling_space: float, chunk_size: int ) -> np.ndarray:
+    """
+    Split the filling space across hotkeys in proportion to their stake plus one, in a single vectorized pass.
+
+    Args:
+    - stake (np.ndarray): The stake of each hotkey.
+    - filling_space (float): The bytes to allocate in total.
+    - chunk_size (int): The size of a chunk in bytes.
+
+    Returns:
+    - np.ndarray: The number of chunks allocated to each hotkey, at least one.
+    """
+    weights = np.asarray( stake, dtype = np.float64 ) + 1.0
+    sizes = weights / weights.sum() * filling_space
+    return ( sizes // chunk_size ).astype( np.int64 ) + 1
+
+class AllocationRow( collections.abc.Mapping ):
+    """
+    Dict compatible view of a single allocation in an AllocationTable, i.e. row['path'] or dict( row ).
+    Only 'n_chunks' can be assigned, writing through to the table's column.
+    """
+
+    __slots__ = [ 'table', 'i' ]
+
+    def __init__( self, table: 'AllocationTable', i: int ):
+        self.table = table
+        self.i = i
+
+    def __getitem__( self, key: str ):
+        table, i = self.table, self.i
+        if key == 'n_chunks': return int( table.n_chunks[ i ] )
+        if key == 'path': return table.path( i )
+        if key == 'seed': return table.seed( i )
+        if key == 'miner': return table.miner( i )
+        if key == 'validator': return table.validator( i )
+        if key == 'hash': return table.hash
+        if key == 'store': return table.store
+        raise KeyError( key )
+
+    def __setitem__( self, key: str, value: int ):
+        if key != 'n_chunks': raise KeyError( key )
+        self.table.n_chunks[ self.i ] = value
+
+    def __iter__( self ):
+        return iter( KEYS )
+
+    def __len__( self ) -> int:
+        return len( KEYS )
+
+    def __repr__( self ) -> str:
+        return repr( dict( self ) )
+
+class AllocationTable:
+    """
+    The allocations of a miner or validator as columns: one row per peer hotkey with its stake, the number of chunks
+    allocated and, for validators, the number of chunks verified. Hotkeys are interned and paths and seeds are derived
+    from them on access, so a table of thousands of uids is a few numpy arrays and a list of shared strings.
+
+    Rows are read as dict compatible AllocationRow views, by position or by peer hotkey, and snapshot() copies only
+    the numeric columns.
+
+    Args:
+    - root (str): The directory holding the allocation databases.
+    - owner (str): The hotkey of the miner or validator owning the table.
+    - peers (list): The peer hotkey of each row, validators for a miner and miners for a validator.
+    - role (str): MINER or VALIDATOR, the role of the owner.
+    - n_chunks, stake, verified (np.ndarray): The columns, zeros if not given.
+    - hash (bool): True if only the hashes of the chunks are generated.
+    - store (str): The chunk store backend.
+    """
+
+    def __init__(
+            self,
+            root: str,
+            owner: str,
+            peers: typing.List[ str ],
+            role: str = MINER,
+            n_chunks: typing.Optional[ np.ndarray ] = None,
+            stake: typing.Optional[ np.ndarray ] = None,
+            verified: typing.Optional[ np.ndarray ] = None,
+            hash: bool = False,
+            store: str = chunkstore.SQLITE,
+        ):
+        self.root = root
+        self.owner = sys.intern( owner )
+        self.peers = [ sys.intern( peer ) for peer in peers ]
+        self.role = role
+        self.hash = hash
+        self.store = store
+        n = len( self.peers )
+        self.n_chunks = np.zeros( n, dtype = np.int64 ) if n_chunks is None else np.asarray( n_chunks, dtype = np.int64 ).copy()
+        self.stake = np.zeros( n, dtype = np.float64 ) if stake is None else np.asarray( stake, dtype = np.float64 ).copy()
+        self.verified = np.zeros( n, dtype = np.int64 ) if verified is None else np.asarray( verified, dtype = np.int64 ).copy()
+        self.positions = { peer: i for i, peer in enumerate( self.peers ) }
+
+    @classmethod
+    def planned(
+            cls,
+            root: str,
+            owner: str,
+            peers: typing.List[ str ],
+            stake: np.ndarray,
+            filling_space: float,
+            chunk_size: int,
+            role: str = MINER,
+            hash: bool = False,
+            store: str = chunkstore.SQLITE,
+        ) -> 'AllocationTable':
+        """
+        Build a table with the filling space split across the peers by stake, see plan.
+        """
+        return cls( root, owner, peers, role = role, n_chunks = plan( stake, filling_space, chunk_size ), stake = stake, hash = hash, store = store )
+
+    def miner( self, i: int ) -> str:
+        return self.owner if self.role == MINER else self.peers[ i ]
+
+    def validator( self, i: int ) -> str:
+        return self.peers[ i ] if self.role == MINER else self.owner
+
+    def seed( self, i: int ) -> str:
+        return f"{self.miner( i )}{self.validator( i )}"
+
+    def path( self, i: int ) -> str:
+        return f"{self.root}/DB-{self.miner( i )}-{self.validator( i )}"
+
+    def index( self, hotkey: str ) -> int:
+        """
+        Return the row of a peer hotkey, raising KeyError if it has none.
+        """
+        return self.positions[ hotkey ]
+
+    def __len__( self ) -> int:
+        return len( self.peers )
+
+    def __iter__( self ) -> typing.Iterator[ AllocationRow ]:
+        return ( AllocationRow( self, i ) for i in range( len( self.peers ) ) )
+
+    def __getitem__( self, key: typing.Union[ int, str ] ) -> AllocationRow:
+        # Rows are looked up by position, or by peer hotkey like the dict the miner used to keep.
+        if isinstance( key, str ):
+            return AllocationRow( self, self.positions[ key ] )
+        if key < 0: key += len( self.peers )
+        if not 0 <= key < len( self.peers ): raise IndexError( key )
+        return AllocationRow( self, key )
+
+    def __contains__( self, hotkey: str ) -> bool:
+        return hotkey in self.positions
+
+    def keys( self ) -> typing.List[ str ]:
+        return list( self.peers )
+
+    def values( self ) -> typing.List[ AllocationRow ]:
+        return list( self )
+
+    def items( self ) -> typing.List[ typing.Tuple[ str, AllocationRow ] ]:
+        return list( zip( self.peers, self ) )
+
+    def to_dicts( self ) -> typing.List[ dict ]:
+        """
+        Return every allocation as a plain dict.
+        """
+        return [ dict( row ) for row in self ]
+
+    def snapshot( self ) -> 'AllocationTable':
+        """
+        Return a copy whose columns no longer change with this table. The interned hotkeys are shared.
+        """
+        snapshot = AllocationTable.__new__( AllocationTable )
+        snapshot.__dict__.update( self.__dict__ )
+        snapshot.n_chunks = self.n_chunks.copy()
+        snapshot.stake = self.stake.copy()
+        snapshot.verified = self.verified.copy()
+        return snapshot
+
+    def total_size( self, chunk_size: int ) -> int:
+        """
+        Return the bytes allocated across all rows.
+        """
+        return int( self.n_chunks.sum() ) * chunk_size
@@ -0,0 +1,115 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import typing
+import threading
+import collections
+
+class ChunkCache:
+    """
+    Least recently used cache of chunk data keyed by (validator, key), bounded by the total
+    size of the cached data rather than the number of entries.
+
+    Chunks larger than the whole budget are never cached, and a budget of 0 disables the cache.
+    """
+
+    def __init__( self, capacity: int ):
+        self.capacity = capacity
+        self.size = 0
+        self.entries: typing.OrderedDict[ typing.Tuple[ str, str ], str ] = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Number of invalidations so far, so data read before a concurrent write is not cached.
+        self.writes = 0
+
+    def get( self, validator: str, key: str ) -> typing.Optional[ str ]:
+        """
+        Return the cached data of a chunk and mark it most recently used, or None on a miss.
+        """
+        with self.lock:
+            data = self.entries.get( ( validator, key ) )
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end( ( validator, key ) )
+            self.hits += 1
+            return data
+
+    def stamp( self ) -> int:
+        """
+        Return a stamp to take before reading a chunk from the store and pass to put.
+        """
+        with self.lock:
+            return self.writes
+
+    def put( self, validator: str, key: str, data: str, stamp: typing.Optional[ int ] = None ):
+        """
+        Cache the data of a chunk, evicting the least recently used chunks until it fits.
+        If a stamp is given and any chunk was invalidated since it was taken, the data may be
+        stale and is not cached.
+        """
+        if len( data ) > self.capacity: return
+        with self.lock:
+            if stamp is not None and stamp != self.writes: return
+            previous = self.entries.pop( ( validator, key ), None )
+            if previous is not None:
+                self.size -= len( previous )
+            while self.entries and self.size + len( data ) > self.capacity:
+                _, evicted = self.entries.popitem( last = False )
+                self.size -= len( evicted )
+                self.evictions += 1
+            self.entries[ ( validator, key ) ] = data
+            self.size += len( data )
+
+    def invalidate( self, validator: str, key: str ):
+        """
+        Drop a chunk from the cache, i.e. when its data is written.
+        """
+        with self.lock:
+            self.writes += 1
+            data = self.entries.pop( ( validator, key ), None )
+            if data is not None:
+                self.size -= len( data )
+
+    def invalidate_all( self, validator: str ):
+        """
+        Drop every chunk of a validator from the cache, i.e. when its allocation is regenerated.
+        """
+        with self.lock:
+            self.writes += 1
+            for entry in [ entry for entry in self.entries if entry[0] == validator ]:
+                self.size -= len( self.entries.pop( entry ) )
+
+    def stats( self ) -> dict:
+        """
+        Return the hit, miss and eviction counters with the number and total size of cached chunks.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len( self.entries ),
+                'size': self.size,
+                'capacity': self.capacity,
+            }
@@ -0,0 +1,227 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import math
+import random
+import typing
+import numpy as np
+import allocation_table
+
+# Relative width of the capacity interval below which a miner is no longer searched, only audited.
+TOLERANCE = 0.1
+# Factor the bounds are loosened by each round, lower * decay and upper / decay, so the capacity of converged miners
+# is searched again once their interval widens past the tolerance, after roughly log( 1 - TOLERANCE ) / ( 2 * log( DECAY ) )
+# rounds.
+DECAY = 0.998
+# Factor the estimate grows by while no challenge has bounded the capacity from above.
+GROWTH = 1.5
+# The smallest estimated allocation of a miner.
+MIN_CHUNKS = 25
+# Significance of the audits: a miner is credited with the fraction of its proven prefix it holds with 1 - CONFIDENCE
+# confidence, i.e. a miner holding a fraction f of the prefix passes s audits with probability f ** s, so after s
+# consecutive passes it is credited with CONFIDENCE ** ( 1 / s ) of the prefix.
+CONFIDENCE = 0.05
+
+class ChallengeScheduler:
+    """
+    Chooses which miners the validator challenges each round and which chunks it asks for.
+
+    Miners generate their chunks in order, so the capacity of a miner is the number of leading chunks it holds, and
+    the scheduler keeps an interval [lower, upper) on it per miner: a passed challenge raises lower past the highest
+    key asked for, a failed key bounds the capacity by that key. While there is no upper bound challenges probe the
+    last chunk of the estimated allocation, which grows by GROWTH each time it passes, and once there is one they
+    probe random keys inside the interval, which bisects it. The estimated allocation follows the upper bound.
+
+    Passing the keys at the top of the prefix does not show the rest of it is held, so every challenge also audits
+    uniformly random keys below lower, and a failed audit lowers both bounds to the missing key. The verified
+    allocation is only the part of the prefix backed by the streak of audits passed since the last failure, see
+    CONFIDENCE, and a streak only covers the prefix it was drawn from: when lower grows past it by more than the
+    tolerance the streak starts over on the grown prefix.
+
+    Every round the budget goes to the miners with the widest intervals relative to their upper bound first, then
+    to converged miners, which are only audited.
+
+    The estimate (n_chunks) and the verified capacity (verified) are written to the allocation table.
+
+    Args:
+    - allocations (allocation_table.AllocationTable): The validator's allocations, the verified column seeds the lower bounds.
+    - budget (int): The maximum number of miners challenged per round, 0 for no limit.
+    - tolerance (float): The relative interval width below which a miner is only audited.
+    - decay (float): The factor the bounds are loosened by each round.
+    """
+
+    def __init__(
+            self,
+            allocations: allocation_table.AllocationTable,
+            budget: int = 0,
+            tolerance: float = TOLERANCE,
+            decay: float = DECAY,
+        ):
+        self.budget = budget
+        self.tolerance = tolerance
+        self.decay = decay
+        self.allocations = allocations
+        self.lower = allocations.verified.astype( np.float64 )
+        self.upper = np.full( len( allocations ), np.inf )
+        # The audits passed in a row by each miner and the prefix they were drawn from.
+        self.streak = np.zeros( len( allocations ), dtype = np.int64 )
+        self.covered = self.lower.copy()
+        self.challenged = 0
+        self.audited = 0
+        self.failed_audits = 0
+
+    def width( self ) -> np.ndarray:
+        """
+        Return the width of every miner's capacity interval relative to its upper bound, 1 while it has none.
+        """
+        with np.errstate( divide = 'ignore', invalid = 'ignore' ):
+            width = ( self.upper - self.lower ) / self.upper
+        return np.where( np.isfinite( self.upper ) & ( self.upper > 0 ), width, 1.0 )
+
+    def floor( self, uid: int ) -> int:
+        # Keys below this are audits, keys from it up probe the interval. Only chunks below the estimate have hashes.
+        return max( 0, min( int( self.lower[ uid ] ), int( self.allocations.n_chunks[ uid ] ) - 1 ) )
+
+    def credit( self, uid: int ) -> int:
+        """
+        Return the chunks of a miner's proven prefix backed by its streak of passed audits.
+        """
+        if self.streak[ uid ] == 0: return 0
+        return int( min( self.lower[ uid ], self.covered[ uid ] ) * CONFIDENCE ** ( 1.0 / self.streak[ uid ] ) )
+
+    def plan( self, n_keys: int = 1, exclude: typing.Optional[ str ] = None ) -> typing.Dict[ int, typing.List[ int ] ]:
+        """
+        Loosen every interval by one round of decay and choose this round's challenges.
+
+        Args:
+        - n_keys (int): The number of chunks probed per challenge, converged miners are audited on as many.
+        - exclude (str): A hotkey which is never challenged, i.e. our own.
+
+        Returns:
+        - dict: The chunk ids to ask for, by uid, for at most budget miners.
+        """
+        self.lower *= self.decay
+        self.upper /= self.decay
+        width = self.width()
+        candidates = np.ones( len( self.allocations ), dtype = bool )
+        if exclude in self.allocations:
+            candidates[ self.allocations.index( exclude ) ] = False
+        uids = np.flatnonzero( candidates )
+        # Widest first, ties (i.e. miners nothing is known about, or converged ones) broken randomly so a small budget reaches all of them.
+        searched = width[ uids ] > self.tolerance
+        uids = uids[ np.lexsort( ( np.random.random( len( uids ) ), -np.where( searched, width[ uids ], 0.0 ) ) ) ]
+        if self.budget > 0:
+            uids = uids[ :self.budget ]
+        self.challenged += len( uids )
+
+        plan = {}
+        for uid in uids.tolist():
+            n_chunks = int( self.allocations.n_chunks[ uid ] )
+            low = self.floor( uid )
+            if width[ uid ] <= self.tolerance:
+                probes = []
+            elif np.isfinite( self.upper[ uid ] ):
+                high = max( min( n_chunks, math.ceil( self.upper[ uid ] ) ), low + 1 )
+                probes = random.sample( range( low, high ), min( n_keys, high - low ) )
+            else:
+                # Search upwards: the last hashed chunk, with the rest of the keys spread over the interval.
+                probes = random.sample( range( low, n_chunks - 1 ), min( n_keys - 1, max( 0, n_chunks - 1 - low ) ) ) + [ n_chunks - 1 ]
+            # Audit the prefix below the interval, on as many keys as a probe when there is nothing to probe.
+            audits = random.sample( range( low ), min( max( 1, n_keys ) if not probes else 1, low ) )
+            self.audited += len( audits )
+            if probes or audits:
+                plan[ uid ] = sorted( set( audits + probes ) )
+        return plan
+
+    def record( self, uid: int, keys: typing.List[ int ], results: typing.List[ bool ] ):
+        """
+        Narrow a miner's interval with the result of a challenge and update its estimated and verified allocation.
+
+        Args:
+        - uid (int): The uid of the challenged miner.
+        - keys (list): The chunk ids the miner was asked for, as planned.
+        - results (list): Whether the miner proved each of the keys.
+        """
+        if not keys: return
+        low = self.floor( uid )
+        failed = [ key for key, ok in zip( keys, results ) if not ok ]
+        audits = [ key for key in keys if key < low ]
+        if failed:
+            # The miner holds a prefix of its chunks, so it holds none from the lowest missing key on.
+            self.upper[ uid ] = min( self.upper[ uid ], min( failed ) )
+            self.lower[ uid ] = min( self.lower[ uid ], self.upper[ uid ] )
+        else:
+            self.lower[ uid ] = max( self.lower[ uid ], max( keys ) + 1 )
+            # A pass above the upper bound means the failure which set it was spurious, i.e. a timeout, and a pass
+            # on the last hashed chunk means the miner may have grown: either way probe upwards again.
+            if self.lower[ uid ] >= min( self.upper[ uid ], self.allocations.n_chunks[ uid ] ):
+                self.upper[ uid ] = np.inf
+
+        if any( key < low for key in failed ):
+            # A failed audit: the data below lower is not all there, the credit starts over.
+            self.failed_audits += 1
+            self.streak[ uid ] = 0
+            self.covered[ uid ] = self.lower[ uid ]
+            self.allocations.verified[ uid ] = 0
+        else:
+            if self.lower[ uid ] > self.covered[ uid ] * ( 1 + self.tolerance ):
+                # The prefix grew past what the streak was drawn from, audits start over on the grown prefix.
+                self.streak[ uid ] = 0
+                self.covered[ uid ] = self.lower[ uid ]
+            else:
+                # Audits drawn from a prefix at least as long as the covered one only make its credit more conservative.
+                self.streak[ uid ] += len( audits )
+
+        n_chunks = int( self.allocations.n_chunks[ uid ] )
+        if np.isfinite( self.upper[ uid ] ):
+            n_chunks = math.ceil( self.upper[ uid ] )
+        elif self.lower[ uid ] >= n_chunks:
+            # Every chunk we hold hashes for passed, probe above them once they are generated.
+            n_chunks = int( n_chunks * GROWTH )
+        self.allocations.n_chunks[ uid ] = max( MIN_CHUNKS, n_chunks )
+        # The credit only rises with passed audits and falls with the bounds, or to zero with a failed audit.
+        verified = max( self.credit( uid ), int( self.allocations.verified[ uid ] ) )
+        self.allocations.verified[ uid ] = min( verified, int( self.lower[ uid ] ), self.allocations.n_chunks[ uid ] )
+
+    def sync( self, allocations: allocation_table.AllocationTable ):
+        """
+        Follow a reconciled allocation table: bounds are kept by hotkey, uids whose hotkey was replaced and new
+        uids start over from their verified allocation.
+        """
+        source = np.array( [ self.allocations.positions.get( hotkey, -1 ) for hotkey in allocations.peers ], dtype = np.int64 )
+        known = source >= 0
+        lower, upper = allocations.verified.astype( np.float64 ), np.full( len( allocations ), np.inf )
+        streak, covered = np.zeros( len( allocations ), dtype = np.int64 ), lower.copy()
+        lower[ known ] = self.lower[ source[ known ] ]
+        upper[ known ] = self.upper[ source[ known ] ]
+        streak[ known ] = self.streak[ source[ known ] ]
+        covered[ known ] = self.covered[ source[ known ] ]
+        self.allocations, self.lower, self.upper, self.streak, self.covered = allocations, lower, upper, streak, covered
+
+    def stats( self ) -> dict:
+        """
+        Return the number of challenges issued, audit keys asked for and failed so far, and how many miners have converged.
+        """
+        return {
+            'challenged': self.challenged,
+            'audited': self.audited,
+            'failed_audits': self.failed_audits,
+            'converged': int( ( self.width() <= self.tolerance ).sum() ),
+            'miners': len( self.allocations ),
+        }
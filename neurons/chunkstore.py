@@ -0,0 +1,472 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import abc
+import mmap
+import struct
+import random
+import typing
+import sqlite3
+import hashlib
+import threading
+import bittensor as bt
+
+# import this repo
+import storage
+
+# Chunk store backends, selected with --chunk_store.
+SQLITE = 'sqlite'
+SEGMENT = 'segment'
+BACKENDS = [ SQLITE, SEGMENT ]
+
+# Segment files are rolled over once they grow past this many bytes.
+SEGMENT_SIZE = 1 << 30
+# Index entry per chunk id: segment number (u32), length (u32), offset in the segment (u64).
+INDEX_ENTRY = struct.Struct( '<IIQ' )
+# Metadata entry per chunk id: sha256 of the generated data, rng state after it and its merkle root.
+META_ENTRY_SIZE = 96
+# Reserved key entry: chunk id (u64).
+KEY_ENTRY = struct.Struct( '<Q' )
+# Encoding entry: chunk id (u64), position of the encoding in storage.protocol.ENCODINGS (u8). The last entry of an id wins.
+ENCODING_ENTRY = struct.Struct( '<QB' )
+# Segment number of index entries which hold no data.
+MISSING_SEGMENT = 0xFFFFFFFF
+# Number of random ids tried when assigning a key to stored data.
+ASSIGN_KEY_ATTEMPTS = 32
+
+class ChunkStore( abc.ABC ):
+    """
+    Storage for the chunks of a single allocation, i.e. the table DB{seed} a miner holds for one validator.
+
+    Keys are chunk ids as strings, data is returned as str. Offsets and lengths count characters,
+    which are bytes for the ASCII payloads the network stores (generated and base64 encoded data).
+    """
+
+    @abc.abstractmethod
+    def count( self ) -> int:
+        """
+        Return the number of chunk ids held, including ids past any gap.
+        """
+
+    @abc.abstractmethod
+    def get( self, key: str ) -> typing.Optional[ str ]:
+        """
+        Return the data stored under a key, or None if the key is unknown.
+        """
+
+    def get_many( self, keys: typing.List[ str ] ) -> typing.Dict[ str, str ]:
+        """
+        Return the data of every known key in keys, keyed by key.
+        """
+        return { key: data for key, data in ( ( key, self.get( key ) ) for key in keys ) if data is not None }
+
+    @abc.abstractmethod
+    def read( self, key: str, offset: int, length: int ) -> typing.Tuple[ typing.Optional[ str ], typing.Optional[ int ] ]:
+        """
+        Return a range of the data stored under a key together with its full size, or (None, None).
+        """
+
+    def digest( self, key: str ) -> typing.Optional[ bytes ]:
+        """
+        Return the sha256 digest of the data stored under a key, or None if the key is unknown.
+        """
+        data = self.get( key )
+        return hashlib.sha256( data.encode( 'utf-8' ) ).digest() if data is not None else None
+
+    @abc.abstractmethod
+    def hash( self, key: str ) -> typing.Optional[ str ]:
+        """
+        Return the hex hash recorded for a key when it was generated, or None.
+        """
+
+    def rows( self, ids: typing.Iterable[ int ] ) -> typing.List[ typing.Tuple[ int, bytes, typing.Optional[ str ] ] ]:
+        """
+        Return ( id, data, hash ) for every known id in ids, with the data as bytes (or a memoryview of them) and the hex hash
+        recorded when it was generated.
+        """
+        rows = []
+        for id in ids:
+            data = self.get( str( id ) )
+            if data is not None:
+                rows.append( ( id, data.encode( 'utf-8' ), self.hash( str( id ) ) ) )
+        return rows
+
+    def scan( self, start: int, limit: int ) -> typing.List[ typing.Tuple[ int, bytes, typing.Optional[ str ] ] ]:
+        """
+        Return ( id, data, hash ) for up to limit known ids from start on, in id order.
+        """
+        return self.rows( range( start, min( start + limit, self.count() ) ) )
+
+    @abc.abstractmethod
+    def encoding( self, key: str ) -> typing.Optional[ str ]:
+        """
+        Return the encoding the data under a key was stored with, or None for generated data and data stored
+        before encodings were recorded.
+        """
+
+    @abc.abstractmethod
+    def assign_key( self, n_chunks: int ) -> typing.Optional[ str ]:
+        """
+        Reserve a random chunk id below n_chunks which holds no stored data yet, so new data never
+        overwrites earlier data. Returns None if no free id was found.
+        """
+
+    @abc.abstractmethod
+    def put( self, key: str, data: str, encoding: typing.Optional[ str ] = None ) -> bool:
+        """
+        Replace the data stored under an existing key, recording its encoding if given. Returns False if the key is unknown.
+        """
+
+    @abc.abstractmethod
+    def append( self, key: str, offset: int, data: str, final: bool = False ) -> bool:
+        """
+        Append data to an existing key if the data held so far is exactly offset long. A store may stage the frames
+        of a payload and only make them readable once the final frame is appended.
+        """
+
+    @abc.abstractmethod
+    def close( self ):
+        """
+        Release the files held by the store.
+        """
+
+class SQLiteChunkStore( ChunkStore ):
+    """
+    Chunks kept as TEXT rows of the generated SQLite table, read and written through the shared connection pool.
+    """
+
+    def __init__( self, alloc: dict ):
+        self.path = alloc['path']
+        self.table = f"DB{alloc['seed']}"
+        self.validator = alloc.get( 'validator', '' )
+        # Statements are built once so every call hits the prepared statement cache of the pooled connection.
+        self.sql = {
+            'count': f"SELECT MAX(id) FROM {self.table}",
+            'get': f"SELECT data FROM {self.table} WHERE id=?",
+            'read': f"SELECT substr( data, ?, ? ), length( data ) FROM {self.table} WHERE id=?",
+            'hash': f"SELECT hash FROM {self.table} WHERE id=?",
+            'scan': f"SELECT id, CAST( data AS BLOB ), hash FROM {self.table} WHERE id >= ? AND id < ? ORDER BY id",
+            'reserve': "INSERT INTO stored_keys (validator, id) VALUES (?, ?)",
+            'put': f"UPDATE {self.table} SET data = ? WHERE id = ?",
+            'record': "INSERT OR REPLACE INTO encodings (validator, id, encoding) VALUES (?, ?, ?)",
+            'length': f"SELECT length( data ) FROM {self.table} WHERE id = ?",
+            'staged': "SELECT offset + length( data ) FROM staged_frames WHERE validator = ? AND id = ? ORDER BY offset DESC LIMIT 1",
+            'stage': "INSERT INTO staged_frames (validator, id, offset, data) VALUES (?, ?, ?, ?)",
+            'frames': "SELECT data FROM staged_frames WHERE validator = ? AND id = ? ORDER BY offset",
+            'unstage': "DELETE FROM staged_frames WHERE validator = ? AND id = ?",
+            'append': f"UPDATE {self.table} SET data = data || ? WHERE id = ?",
+        }
+        # Keys handed out for stored data, so new data never overwrites earlier data.
+        with storage.connections.writer( self.path ) as db:
+            storage.connections.execute( db, "CREATE TABLE IF NOT EXISTS stored_keys (validator TEXT, id INTEGER, PRIMARY KEY (validator, id))" )
+            # The encoding of each stored chunk, kept in memory as well: only stored chunks have one, so it stays small.
+            storage.connections.execute( db, "CREATE TABLE IF NOT EXISTS encodings (validator TEXT, id INTEGER, encoding TEXT NOT NULL, PRIMARY KEY (validator, id))" )
+            rows = storage.connections.execute( db, "SELECT id, encoding FROM encodings WHERE validator = ?", ( self.validator, ) ).fetchall()
+            # Frames of streamed payloads waiting for their final frame. Concatenating a TEXT row copies it, so frames are
+            # staged here and joined into the row once, keeping a streamed payload linear in its size.
+            # Frames left from before a restart belong to streams which can no longer finish.
+            storage.connections.execute( db, "CREATE TABLE IF NOT EXISTS staged_frames (validator TEXT, id INTEGER, offset INTEGER, data TEXT, PRIMARY KEY (validator, id, offset))" )
+            storage.connections.execute( db, "DELETE FROM staged_frames WHERE validator = ?", ( self.validator, ) )
+        self.encodings = { str( id ): encoding for id, encoding in rows }
+
+    def fetchone( self, name: str, params: typing.Sequence ):
+        with storage.connections.reader( self.path ) as db:
+            return storage.connections.execute( db, self.sql[ name ], params ).fetchone()
+
+    def count( self ) -> int:
+        row = self.fetchone( 'count', () )
+        return row[0] + 1 if row and row[0] is not None else 0
+
+    def get( self, key: str ) -> typing.Optional[ str ]:
+        row = self.fetchone( 'get', ( key, ) )
+        return row[0] if row else None
+
+    def get_many( self, keys: typing.List[ str ] ) -> typing.Dict[ str, str ]:
+        # Fetch all requested rows with a single query.
+        if not keys: return {}
+        query = f"SELECT id, data FROM {self.table} WHERE id IN ({','.join( '?' * len(keys) )})"
+        with storage.connections.reader( self.path ) as db:
+            return { str( id ): data for id, data in storage.connections.execute( db, query, keys ).fetchall() }
+
+    def read( self, key: str, offset: int, length: int ) -> typing.Tuple[ typing.Optional[ str ], typing.Optional[ int ] ]:
+        # Fetch only the requested range of the row.
+        row = self.fetchone( 'read', ( offset + 1, length, key ) )
+        return ( row[0], row[1] ) if row else ( None, None )
+
+    def hash( self, key: str ) -> typing.Optional[ str ]:
+        row = self.fetchone( 'hash', ( key, ) )
+        return row[0] if row else None
+
+    def rows( self, ids: typing.Iterable[ int ] ) -> typing.List[ typing.Tuple[ int, bytes, typing.Optional[ str ] ] ]:
+        # Fetch all requested rows with a single query, the data cast to bytes so it is hashed without decoding.
+        ids = list( ids )
+        if not ids: return []
+        query = f"SELECT id, CAST( data AS BLOB ), hash FROM {self.table} WHERE id IN ({','.join( '?' * len( ids ) )})"
+        with storage.connections.reader( self.path ) as db:
+            return storage.connections.execute( db, query, ids ).fetchall()
+
+    def scan( self, start: int, limit: int ) -> typing.List[ typing.Tuple[ int, bytes, typing.Optional[ str ] ] ]:
+        # A single ordered range query walking the primary key.
+        with storage.connections.reader( self.path ) as db:
+            return storage.connections.execute( db, self.sql['scan'], ( start, start + limit ) ).fetchall()
+
+    def assign_key( self, n_chunks: int ) -> typing.Optional[ str ]:
+        with storage.connections.writer( self.path ) as db:
+            for _ in range( ASSIGN_KEY_ATTEMPTS ):
+                key = random.randrange( n_chunks )
+                try:
+                    storage.connections.execute( db, self.sql['reserve'], ( self.validator, key ) )
+                    return str( key )
+                except sqlite3.IntegrityError:
+                    continue
+        return None
+
+    def encoding( self, key: str ) -> typing.Optional[ str ]:
+        return self.encodings.get( str( key ) )
+
+    def put( self, key: str, data: str, encoding: typing.Optional[ str ] = None ) -> bool:
+        # The data and its encoding change in one transaction.
+        with storage.connections.writer( self.path ) as db:
+            stored = storage.connections.execute( db, self.sql['put'], ( data, key ) ).rowcount == 1
+            # A new payload drops the frames staged for the one it replaces.
+            storage.connections.execute( db, self.sql['unstage'], ( self.validator, int( key ) ) )
+            if stored and encoding is not None:
+                storage.connections.execute( db, self.sql['record'], ( self.validator, int( key ), encoding ) )
+        if stored and encoding is not None:
+            self.encodings[ str( key ) ] = encoding
+        return stored
+
+    def append( self, key: str, offset: int, data: str, final: bool = False ) -> bool:
+        with storage.connections.writer( self.path ) as db:
+            # The data held so far ends with the last staged frame, or with the row when none is staged.
+            row = storage.connections.execute( db, self.sql['length'], ( key, ) ).fetchone()
+            if row is None or row[0] is None: return False
+            staged = storage.connections.execute( db, self.sql['staged'], ( self.validator, int( key ) ) ).fetchone()
+            if ( staged[0] if staged else row[0] ) != offset: return False
+            if not final:
+                storage.connections.execute( db, self.sql['stage'], ( self.validator, int( key ), offset, data ) )
+                return True
+            # Join the staged frames and the final one into the row with a single update.
+            frames = [ frame for ( frame, ) in storage.connections.execute( db, self.sql['frames'], ( self.validator, int( key ) ) ).fetchall() ]
+            storage.connections.execute( db, self.sql['unstage'], ( self.validator, int( key ) ) )
+            return storage.connections.execute( db, self.sql['append'], ( ''.join( frames ) + data, key ) ).rowcount == 1
+
+    def close( self ):
+        storage.connections.manager.close( self.path )
+
+class SegmentChunkStore( ChunkStore ):
+    """
+    Chunks kept in append-only segment files under {path}.segments, written by the generator with --segments.
+
+    The directory holds:
+    - segment-NNNNNN: chunk data appended back to back, rolled over past SEGMENT_SIZE bytes.
+    - index: one fixed-width INDEX_ENTRY per chunk id locating its data, so a lookup is a single pread.
+    - meta: one META_ENTRY_SIZE entry per chunk id with its generated hash, rng state and merkle root.
+    - keys: the chunk ids reserved for stored data.
+    - encodings: one ENCODING_ENTRY per stored chunk with the encoding it was stored with.
+
+    Reads go through a read-only memory map of each segment so data comes straight from the page cache.
+    Replacing a chunk appends the new data and repoints its index entry, the old data is left in place.
+    """
+
+    def __init__( self, alloc: dict ):
+        self.directory = segment_directory( alloc['path'] )
+        os.makedirs( self.directory, exist_ok = True )
+        self.lock = threading.Lock()
+        flags = os.O_RDWR | os.O_CREAT
+        self.index = os.open( os.path.join( self.directory, 'index' ), flags )
+        self.meta = os.open( os.path.join( self.directory, 'meta' ), flags )
+        self.keys = os.open( os.path.join( self.directory, 'keys' ), flags | os.O_APPEND )
+        self.reserved = set()
+        entries = os.pread( self.keys, os.fstat( self.keys ).st_size, 0 )
+        for ( key, ) in KEY_ENTRY.iter_unpack( entries[ :len( entries ) - len( entries ) % KEY_ENTRY.size ] ):
+            self.reserved.add( key )
+        self.encoding_log = os.open( os.path.join( self.directory, 'encodings' ), flags | os.O_APPEND )
+        self.encodings = {}
+        entries = os.pread( self.encoding_log, os.fstat( self.encoding_log ).st_size, 0 )
+        for key, code in ENCODING_ENTRY.iter_unpack( entries[ :len( entries ) - len( entries ) % ENCODING_ENTRY.size ] ):
+            if code < len( storage.protocol.ENCODINGS ):
+                self.encodings[ str( key ) ] = storage.protocol.ENCODINGS[ code ]
+        # Memory maps of the segments, remapped when a read falls past the end of the current map.
+        self.maps: typing.Dict[ int, mmap.mmap ] = {}
+        segments = [ int( name.split( '-' )[1] ) for name in os.listdir( self.directory ) if name.startswith( 'segment-' ) ]
+        self.segment = max( segments, default = 0 )
+        self.segment_fd = os.open( self.segment_path( self.segment ), flags | os.O_APPEND )
+
+    def segment_path( self, segment: int ) -> str:
+        return os.path.join( self.directory, f"segment-{segment:06d}" )
+
+    def entry( self, key: typing.Union[ str, int ] ) -> typing.Optional[ typing.Tuple[ int, int, int ] ]:
+        try:
+            id = int( key )
+        except ( TypeError, ValueError ):
+            return None
+        if id < 0: return None
+        raw = os.pread( self.index, INDEX_ENTRY.size, id * INDEX_ENTRY.size )
+        if len( raw ) < INDEX_ENTRY.size: return None
+        segment, length, offset = INDEX_ENTRY.unpack( raw )
+        return None if segment == MISSING_SEGMENT else ( segment, length, offset )
+
+    def map( self, segment: int, end: int ) -> mmap.mmap:
+        # Return a map of the segment covering at least end bytes.
+        segment_map = self.maps.get( segment )
+        if segment_map is None or len( segment_map ) < end:
+            with self.lock:
+                segment_map = self.maps.get( segment )
+                if segment_map is None or len( segment_map ) < end:
+                    with open( self.segment_path( segment ), 'rb' ) as f:
+                        segment_map = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+                    # Older maps are left to be released once no reader holds them.
+                    self.maps[ segment ] = segment_map
+        return segment_map
+
+    def view( self, key: str ) -> typing.Optional[ memoryview ]:
+        """
+        Return a read-only view of the data stored under a key, without copying it out of the page cache.
+        """
+        entry = self.entry( key )
+        if entry is None: return None
+        segment, length, offset = entry
+        if length == 0: return memoryview( b'' )
+        return memoryview( self.map( segment, offset + length ) )[ offset: offset + length ]
+
+    def count( self ) -> int:
+        return os.fstat( self.index ).st_size // INDEX_ENTRY.size
+
+    def get( self, key: str ) -> typing.Optional[ str ]:
+        data = self.view( key )
+        return str( data, 'utf-8' ) if data is not None else None
+
+    def read( self, key: str, offset: int, length: int ) -> typing.Tuple[ typing.Optional[ str ], typing.Optional[ int ] ]:
+        data = self.view( key )
+        if data is None: return None, None
+        return str( data[ offset: offset + length ], 'utf-8' ), len( data )
+
+    def digest( self, key: str ) -> typing.Optional[ bytes ]:
+        # Hash straight from the map, hashlib releases the GIL for large buffers.
+        data = self.view( key )
+        return hashlib.sha256( data ).digest() if data is not None else None
+
+    def hash( self, key: str ) -> typing.Optional[ str ]:
+        if self.entry( key ) is None: return None
+        raw = os.pread( self.meta, 32, int( key ) * META_ENTRY_SIZE )
+        return raw.hex() if len( raw ) == 32 and any( raw ) else None
+
+    def rows( self, ids: typing.Iterable[ int ] ) -> typing.List[ typing.Tuple[ int, bytes, typing.Optional[ str ] ] ]:
+        rows = []
+        for id in ids:
+            data = self.view( str( id ) )
+            if data is not None:
+                rows.append( ( id, data, self.hash( str( id ) ) ) )
+        return rows
+
+    def scan( self, start: int, limit: int ) -> typing.List[ typing.Tuple[ int, bytes, typing.Optional[ str ] ] ]:
+        # Read the index and meta entries of the whole range with one pread each, the data is viewed straight from the maps.
+        index = os.pread( self.index, limit * INDEX_ENTRY.size, start * INDEX_ENTRY.size )
+        meta = os.pread( self.meta, limit * META_ENTRY_SIZE, start * META_ENTRY_SIZE )
+        rows = []
+        for i, ( segment, length, offset ) in enumerate( INDEX_ENTRY.iter_unpack( index[ :len( index ) - len( index ) % INDEX_ENTRY.size ] ) ):
+            if segment == MISSING_SEGMENT: continue
+            data = memoryview( self.map( segment, offset + length ) )[ offset: offset + length ] if length else memoryview( b'' )
+            digest = meta[ i * META_ENTRY_SIZE: i * META_ENTRY_SIZE + 32 ]
+            rows.append( ( start + i, data, digest.hex() if len( digest ) == 32 and any( digest ) else None ) )
+        return rows
+
+    def assign_key( self, n_chunks: int ) -> typing.Optional[ str ]:
+        with self.lock:
+            for _ in range( ASSIGN_KEY_ATTEMPTS ):
+                key = random.randrange( n_chunks )
+                if key in self.reserved: continue
+                os.write( self.keys, KEY_ENTRY.pack( key ) )
+                self.reserved.add( key )
+                return str( key )
+        return None
+
+    def write( self, data: bytes ) -> typing.Tuple[ int, int ]:
+        # Append data to the active segment, rolling over to a new one when it is full. Must hold the lock.
+        offset = os.fstat( self.segment_fd ).st_size
+        if offset > 0 and offset + len( data ) > SEGMENT_SIZE:
+            os.close( self.segment_fd )
+            self.segment += 1
+            self.segment_fd = os.open( self.segment_path( self.segment ), os.O_RDWR | os.O_CREAT | os.O_APPEND )
+            offset = 0
+        view = memoryview( data )
+        while view:
+            view = view[ os.write( self.segment_fd, view ): ]
+        return self.segment, offset
+
+    def encoding( self, key: str ) -> typing.Optional[ str ]:
+        return self.encodings.get( str( key ) )
+
+    def put( self, key: str, data: str, encoding: typing.Optional[ str ] = None ) -> bool:
+        with self.lock:
+            if self.entry( key ) is None: return False
+            data = data.encode( 'utf-8' )
+            segment, offset = self.write( data )
+            # Record the encoding before repointing the index, so the new data is never served with the old one.
+            if encoding is not None:
+                os.write( self.encoding_log, ENCODING_ENTRY.pack( int( key ), storage.protocol.ENCODINGS.index( encoding ) ) )
+                self.encodings[ str( key ) ] = encoding
+            os.pwrite( self.index, INDEX_ENTRY.pack( segment, len( data ), offset ), int( key ) * INDEX_ENTRY.size )
+        return True
+
+    def append( self, key: str, offset: int, data: str, final: bool = False ) -> bool:
+        # Frames extend the active segment in place, so they are written straight away.
+        with self.lock:
+            entry = self.entry( key )
+            if entry is None or entry[1] != offset: return False
+            segment, length, start = entry
+            data = data.encode( 'utf-8' )
+            end = os.fstat( self.segment_fd ).st_size
+            if segment == self.segment and start + length == end and end + len( data ) <= SEGMENT_SIZE:
+                # The chunk ends the active segment, extend it in place.
+                self.write( data )
+            else:
+                # Otherwise copy the chunk to the end of the active segment.
+                segment, start = self.write( bytes( self.view( key ) ) + data )
+            os.pwrite( self.index, INDEX_ENTRY.pack( segment, length + len( data ), start ), int( key ) * INDEX_ENTRY.size )
+        return True
+
+    def close( self ):
+        with self.lock:
+            for fd in ( self.index, self.meta, self.keys, self.encoding_log, self.segment_fd ):
+                os.close( fd )
+            self.maps = {}
+
+def segment_directory( path: str ) -> str:
+    """
+    Return the directory holding the segment files of an allocation.
+    """
+    return f"{path}.segments"
+
+def open_store( alloc: dict, backend: str = SQLITE ) -> ChunkStore:
+    """
+    Open the chunk store of an allocation.
+
+    Args:
+    - alloc (dict): The allocation, with 'path', 'seed' and optionally 'validator'.
+    - backend (str): One of BACKENDS.
+
+    Returns:
+    - ChunkStore: The store.
+    """
+    if backend == SEGMENT:
+        return SegmentChunkStore( alloc )
+    return SQLiteChunkStore( alloc )
@@ -0,0 +1,102 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import typing
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class Overloaded( Exception ):
+    """
+    Raised when a call is turned away because the executor's queue is full.
+    """
+
+class BoundedExecutor:
+    """
+    Runs blocking calls on a fixed size thread pool so they never stall the event loop.
+
+    At most max_pending calls are queued or running at once. A call past that limit fails
+    immediately with Overloaded instead of waiting behind the queue, so callers can answer
+    with an explicit overload response rather than building unbounded latency.
+    """
+
+    def __init__( self, workers: int, max_pending: int ):
+        self.pool = ThreadPoolExecutor( max_workers = workers )
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def depth( self ) -> int:
+        """
+        Number of calls queued or running.
+        """
+        return self.pending
+
+    async def run( self, fn: typing.Callable, *args ):
+        """
+        Run fn(*args) on the pool and return its result.
+
+        Raises:
+        - Overloaded: If max_pending calls are already queued or running.
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded( f"{self.pending} calls pending" )
+            self.pending += 1
+        submitted = time.time()
+
+        def call():
+            # Time spent queued before a worker picked the call up.
+            waited = time.time() - submitted
+            with self.lock:
+                self.wait_time += waited
+                self.max_wait_time = max( self.max_wait_time, waited )
+            return fn( *args )
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor( self.pool, call )
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+
+    def stats( self ) -> dict:
+        """
+        Return the queue depth, the completed and rejected call counts, and the total, mean and
+        maximum seconds calls waited in the queue.
+        """
+        with self.lock:
+            return {
+                'depth': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_time': self.wait_time,
+                'mean_wait_time': self.wait_time / self.completed if self.completed else 0.0,
+                'max_wait_time': self.max_wait_time,
+            }
+
+    def shutdown( self ):
+        self.pool.shutdown( wait = False )
@@ -8,10 +8,14 @@ extern crate log;
 
 use lazy_static::lazy_static;
 use rusqlite::{Connection, params};
-use indicatif::{MultiProgress, ProgressBar, ProgressStyle};
+use indicatif::{MultiProgress, ProgressBar, ProgressDrawTarget, ProgressStyle};
 use clap::{App, Arg};
 use sha2::{Sha256, Digest};
 use rand::{Rng, SeedableRng, rngs::StdRng};
+use std::fs::{self, File, OpenOptions};
+use std::io::{self, Write};
+use std::os::unix::fs::FileExt;
+use std::path::PathBuf;
 
 fn hash_data(data: &str) -> [u8; 32] {
     let mut hasher = Sha256::new();
@@ -19,6 +23,121 @@ fn hash_data(data: &str) -> [u8; 32] {
     hasher.finalize().into()
 }
 
+// Number of bytes covered by each leaf of a chunk's merkle tree, see storage/merkle.py.
+const MERKLE_LEAF_SIZE: usize = 1000;
+
+fn hash_leaf(leaf: &[u8]) -> [u8; 32] {
+    let mut hasher = Sha256::new();
+    hasher.update(&[0u8]);
+    hasher.update(leaf);
+    hasher.finalize().into()
+}
+
+fn hash_node(left: &[u8; 32], right: &[u8; 32]) -> [u8; 32] {
+    let mut hasher = Sha256::new();
+    hasher.update(&[1u8]);
+    hasher.update(left);
+    hasher.update(right);
+    hasher.finalize().into()
+}
+
+// Merkle root of a chunk. Unpaired nodes are carried up unchanged and the
+// number of leaves is bound into the root, matching storage/merkle.py.
+fn merkle_root(data: &[u8], leaf_size: usize) -> [u8; 32] {
+    let mut level: Vec<[u8; 32]> = if data.is_empty() {
+        vec![hash_leaf(&[])]
+    } else {
+        data.chunks(leaf_size).map(hash_leaf).collect()
+    };
+    let n_leaves = level.len() as u64;
+    while level.len() > 1 {
+        level = level
+            .chunks(2)
+            .map(|pair| if pair.len() == 2 { hash_node(&pair[0], &pair[1]) } else { pair[0] })
+            .collect();
+    }
+    let mut hasher = Sha256::new();
+    hasher.update(&[2u8]);
+    hasher.update(&n_leaves.to_le_bytes());
+    hasher.update(&level[0]);
+    hasher.finalize().into()
+}
+
+// Segment file layout, see SegmentChunkStore in neurons/chunkstore.py.
+const SEGMENT_SIZE: u64 = 1 << 30;
+const INDEX_ENTRY_SIZE: u64 = 16;
+const META_ENTRY_SIZE: u64 = 96;
+
+// Writes chunks to append-only segment files with a fixed-width index and metadata entry per id.
+struct SegmentWriter {
+    dir: PathBuf,
+    index: File,
+    meta: File,
+    segment_id: u32,
+    segment: File,
+    segment_len: u64,
+}
+
+impl SegmentWriter {
+    fn open(dir: PathBuf) -> SegmentWriter {
+        fs::create_dir_all(&dir).expect("Failed to create segment directory");
+        let open_rw = |name: &str| OpenOptions::new().read(true).write(true).create(true).open(dir.join(name)).expect("Failed to open segment index");
+        let index = open_rw("index");
+        let meta = open_rw("meta");
+        let segment_id = fs::read_dir(&dir).expect("Failed to list segment directory")
+            .filter_map(|entry| entry.ok())
+            .filter_map(|entry| entry.file_name().to_str().and_then(|name| name.strip_prefix("segment-")).and_then(|n| n.parse::<u32>().ok()))
+            .max()
+            .unwrap_or(0);
+        let segment = SegmentWriter::open_segment(&dir, segment_id);
+        let segment_len = segment.metadata().expect("Failed to stat segment").len();
+        SegmentWriter { dir, index, meta, segment_id, segment, segment_len }
+    }
+
+    fn open_segment(dir: &PathBuf, segment_id: u32) -> File {
+        OpenOptions::new().create(true).append(true).open(dir.join(format!("segment-{:06}", segment_id))).expect("Failed to open segment")
+    }
+
+    // Number of ids held, i.e. the next id to generate.
+    fn count(&self) -> usize {
+        (self.index.metadata().expect("Failed to stat index").len() / INDEX_ENTRY_SIZE) as usize
+    }
+
+    fn rng_state(&self, id: usize) -> [u8; 32] {
+        let mut state = [0u8; 32];
+        self.meta.read_exact_at(&mut state, id as u64 * META_ENTRY_SIZE + 32).expect("Failed to read rng_state");
+        state
+    }
+
+    fn truncate(&self, n: usize) {
+        self.index.set_len(n as u64 * INDEX_ENTRY_SIZE).expect("Failed to truncate index");
+        self.meta.set_len(n as u64 * META_ENTRY_SIZE).expect("Failed to truncate meta");
+    }
+
+    fn append(&mut self, id: usize, data: &[u8], hash: &[u8], rng_state: &[u8; 32], root: &[u8; 32]) {
+        if self.segment_len > 0 && self.segment_len + data.len() as u64 > SEGMENT_SIZE {
+            self.segment_id += 1;
+            self.segment = SegmentWriter::open_segment(&self.dir, self.segment_id);
+            self.segment_len = 0;
+        }
+        let offset = self.segment_len;
+        self.segment.write_all(data).expect("Failed to write segment");
+        self.segment_len += data.len() as u64;
+
+        // Data is written before the entries pointing at it.
+        let mut meta = [0u8; META_ENTRY_SIZE as usize];
+        meta[..32].copy_from_slice(hash);
+        meta[32..64].copy_from_slice(rng_state);
+        meta[64..].copy_from_slice(root);
+        self.meta.write_all_at(&meta, id as u64 * META_ENTRY_SIZE).expect("Failed to write meta");
+        let mut entry = [0u8; INDEX_ENTRY_SIZE as usize];
+        entry[..4].copy_from_slice(&self.segment_id.to_le_bytes());
+        entry[4..8].copy_from_slice(&(data.len() as u32).to_le_bytes());
+        entry[8..].copy_from_slice(&offset.to_le_bytes());
+        self.index.write_all_at(&entry, id as u64 * INDEX_ENTRY_SIZE).expect("Failed to write index");
+    }
+}
+
 fn combine_seeds(original_seed: [u8; 32], hash: [u8; 32]) -> [u8; 32] {
     let mut combined = [0u8; 32];
     for i in 0..32 {
@@ -59,6 +178,16 @@ fn main() {
             .help("Seed used to generate the data.")
             .required(true)
             .takes_value(true))
+        .arg(Arg::with_name("segments")
+            .long("segments")
+            .help("Write the chunks to segment files under {path}.segments instead of an SQLite table.")
+            .required(false)
+            .takes_value(false))
+        .arg(Arg::with_name("progress")
+            .long("progress")
+            .help("Print machine readable progress lines \"progress <done> <total>\" to stdout instead of drawing a progress bar.")
+            .required(false)
+            .takes_value(false))
         .arg(Arg::with_name("delete")
             .long("delete")
             .help("Delete the table if it exists.")
@@ -69,12 +198,11 @@ fn main() {
     env_logger::init();
 
     let hash = matches.is_present("hash");
+    let progress = matches.is_present("progress");
     let path = matches.value_of("path").unwrap();
     let num_chunks: usize = matches.value_of("n").unwrap().parse().expect("Failed to parse number of chunks");
     let chunk_size: usize = matches.value_of("size").unwrap().parse().expect("Failed to parse chunk size");
 
-    // Create a new SQLite connection
-    let conn = Connection::open(path).expect("Failed to open database");
     let seed_value = matches.value_of("seed").unwrap();
     log::info!("seed_value: {}", seed_value);
 
@@ -83,29 +211,52 @@ fn main() {
         panic!("Invalid characters in seed value.");
     }
 
-    if matches.is_present("delete") {
-        let delete_table = format!(
-            "DROP TABLE IF EXISTS DB{}", 
-            seed_value
-        );
-        conn.execute(&delete_table, params![]).expect("Failed to drop table");
-    }
+    // Chunks go to an SQLite table, or to segment files with --segments.
+    let mut conn: Option<Connection> = None;
+    let mut writer: Option<SegmentWriter> = None;
+    if matches.is_present("segments") {
+        let dir = PathBuf::from(format!("{}.segments", path));
+        if matches.is_present("delete") {
+            let _ = fs::remove_dir_all(&dir);
+        }
+        writer = Some(SegmentWriter::open(dir));
+    } else {
+        // Create a new SQLite connection
+        let db = Connection::open(path).expect("Failed to open database");
+
+        if matches.is_present("delete") {
+            let delete_table = format!(
+                "DROP TABLE IF EXISTS DB{}", 
+                seed_value
+            );
+            db.execute(&delete_table, params![]).expect("Failed to drop table");
+        }
     
-    let create_table_sql = format!(
-        "CREATE TABLE IF NOT EXISTS DB{} (
-            id INTEGER PRIMARY KEY, 
-            data TEXT NOT NULL, 
-            hash TEXT NOT NULL,
-            rng_state BLOB NOT NULL
-        )", seed_value);
-    log::info!("create_table_sql: {}", create_table_sql);
-    conn.execute(&create_table_sql, params![]).expect("Failed to create table");
+        let create_table_sql = format!(
+            "CREATE TABLE IF NOT EXISTS DB{} (
+                id INTEGER PRIMARY KEY, 
+                data TEXT NOT NULL, 
+                hash TEXT NOT NULL,
+                rng_state BLOB NOT NULL,
+                merkle_root TEXT
+            )", seed_value);
+        log::info!("create_table_sql: {}", create_table_sql);
+        db.execute(&create_table_sql, params![]).expect("Failed to create table");
+
+        // Tables created before merkle roots were recorded get the column added, this fails harmlessly if it exists.
+        let add_root_column = format!("ALTER TABLE DB{} ADD COLUMN merkle_root TEXT", seed_value);
+        let _ = db.execute(&add_root_column, params![]);
+        conn = Some(db);
+    }
     
     // Seed-based PRNG
     let seed_array = hash_data( matches.value_of("seed").unwrap() );
 
     // Set up the progress bar.
     let multi = MultiProgress::new();
+    if progress {
+        multi.set_draw_target(ProgressDrawTarget::hidden());
+    }
     let pb = multi.add(ProgressBar::new(num_chunks as u64));
     pb.set_style(ProgressStyle::default_bar()
         .template("{spinner:.green} [{elapsed_precise}] [{bar:40.cyan/blue}] {pos}/{len} ({eta})")
@@ -116,39 +267,65 @@ fn main() {
         multi.join().unwrap();
     });
 
+    let mut start_index = 0;
+    let mut current_seed = seed_array;  // default seed_array
+
     // Get current state
-    log::info!("Preparing statement to fetch the latest RNG state from the database.");
-    let query_latest_rng_state = format!("SELECT id, rng_state FROM DB{} ORDER BY id DESC LIMIT 1", seed_value);
-    let mut stmt = conn.prepare(&query_latest_rng_state).expect("Failed to prepare statement");
+    if let Some(writer) = &writer {
+        start_index = writer.count();
+        if start_index > 0 {
+            current_seed = writer.rng_state(start_index - 1);
+            log::info!("Retrieved RNG state for id: {} seed: {:?}", start_index - 1 , current_seed);
+        } else {
+            log::warn!("No RNG state found in the segments. Using default seed.");
+        }
+    } else if let Some(conn) = &conn {
+        log::info!("Preparing statement to fetch the latest RNG state from the database.");
+        let query_latest_rng_state = format!("SELECT id, rng_state FROM DB{} ORDER BY id DESC LIMIT 1", seed_value);
+        let mut stmt = conn.prepare(&query_latest_rng_state).expect("Failed to prepare statement");
 
-    log::info!("Executing query to fetch the latest RNG state.");
-    let mut rows = stmt.query(params![]).expect("Failed to query database");
+        log::info!("Executing query to fetch the latest RNG state.");
+        let mut rows = stmt.query(params![]).expect("Failed to query database");
 
-    let mut start_index = 0;
-    let mut current_seed = seed_array;  // default seed_array
+        if let Some(row) = rows.next().expect("Failed to read row") {
+            start_index = row.get::<_, i64>(0).expect("Failed to get id") as usize + 1;  // +1 because we want to start from the next index
+            log::info!("Found latest id: {}", start_index - 1 );  // subtracting 1 to get the actual latest id
 
-    if let Some(row) = rows.next().expect("Failed to read row") {
-        start_index = row.get::<_, i64>(0).expect("Failed to get id") as usize + 1;  // +1 because we want to start from the next index
-        log::info!("Found latest id: {}", start_index - 1 );  // subtracting 1 to get the actual latest id
+            let seed_as_vec: Vec<u8> = row.get(1).expect("Failed to get rng_state");
+            current_seed.copy_from_slice(&seed_as_vec);
+            log::info!("Retrieved RNG state for id: {} seed: {:?}", start_index - 1 , current_seed);
+        } else {
+            log::warn!("No RNG state found in the database. Using default seed.");
+        }
+    }
 
-        let seed_as_vec: Vec<u8> = row.get(1).expect("Failed to get rng_state");
-        current_seed.copy_from_slice(&seed_as_vec);
-        log::info!("Retrieved RNG state for id: {} seed: {:?}", start_index - 1 , current_seed);
-    } else {
-        log::warn!("No RNG state found in the database. Using default seed.");
+    // Report where generation resumes, so the scheduler knows how much work is left.
+    if progress {
+        report_progress(start_index.min(num_chunks), num_chunks);
     }
 
     // Delete excess rows
     if start_index > num_chunks {
-        let delete_rows = format!(
-            "DELETE FROM DB{} WHERE id >= ?", 
-            seed_value
-        );
         log::info!("Deleting excess rows up to id: {}", num_chunks);
-        conn.execute(&delete_rows, params![num_chunks as i64]).expect("Failed to delete excess rows");
+        if let Some(writer) = &writer {
+            writer.truncate(num_chunks);
+        } else if let Some(conn) = &conn {
+            let delete_rows = format!(
+                "DELETE FROM DB{} WHERE id >= ?", 
+                seed_value
+            );
+            conn.execute(&delete_rows, params![num_chunks as i64]).expect("Failed to delete excess rows");
+        }
+        if progress {
+            report_progress(num_chunks, num_chunks);
+        }
     } else {
         // Generate and store chunks
         pb.inc(start_index as u64);
+        let insert_sql = format!(
+            "INSERT INTO DB{} (id, data, hash, rng_state, merkle_root) VALUES (?, ?, ?, ?, ?)", 
+            seed_value
+        );
         for i in start_index..num_chunks {
             let mut prng = StdRng::from_seed(current_seed);
             let chunk_data = generate_string_chunk(&mut prng, chunk_size);
@@ -157,35 +334,27 @@ fn main() {
             let hash_of_data = hash_data(&chunk_data);
             current_seed = combine_seeds(current_seed, hash_of_data);
 
-            // Hash the data for verification
-            let mut hasher = Sha256::new();
-            hasher.update(chunk_data.as_bytes());
-            let hash_bytes = hasher.finalize();
-            let hash_hex = hex::encode(&hash_bytes);
-
-            // Store the id, data, hash, and rng_state
-            let insert_sql = format!(
-                "INSERT INTO DB{} (id, data, hash, rng_state) VALUES (?, ?, ?, ?)", 
-                seed_value
-            );
+            // Merkle root used by validators to check proofs over a few leaves of the chunk.
+            let root = merkle_root(chunk_data.as_bytes(), MERKLE_LEAF_SIZE);
 
             // Optionally only store the data hash
             log::info!("Set in DB id: {} seed: {:?}", i, current_seed );
+            let stored_data = if hash { "" } else { chunk_data.as_str() };
 
-            if hash {
-                // Store only the hash.
-                conn.execute(
-                    &insert_sql, 
-                    params![i as i64, "", hash_hex, current_seed.to_vec()]
-                ).expect("Failed to insert into database");
-            } else {
-                // Store all the data.
+            if let Some(writer) = &mut writer {
+                // Store the data with its hash, rng_state and merkle root in fixed-width entries.
+                writer.append(i, stored_data.as_bytes(), &hash_of_data, &current_seed, &root);
+            } else if let Some(conn) = &conn {
+                // Store the id, data, hash, rng_state and merkle root
                 conn.execute(
                     &insert_sql, 
-                    params![i as i64, chunk_data, hash_hex, current_seed.to_vec()]
+                    params![i as i64, stored_data, hex::encode(&hash_of_data), current_seed.to_vec(), hex::encode(&root)]
                 ).expect("Failed to insert into database");
             }
             pb.inc(1);
+            if progress {
+                report_progress(i + 1, num_chunks);
+            }
 
         };
         pb.finish();
@@ -199,6 +368,14 @@ fn main() {
 
 }
 
+// Progress line parsed by neurons/generation.py.
+fn report_progress(done: usize, total: usize) {
+    let stdout = io::stdout();
+    let mut out = stdout.lock();
+    let _ = writeln!(out, "progress {} {}", done, total);
+    let _ = out.flush();
+}
+
 lazy_static! {
     static ref CHARS: Vec<char> = ('a'..='z').chain('A'..'Z').chain('0'..'9').collect();
 }
@@ -0,0 +1,276 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import typing
+import threading
+import subprocess
+import collections
+import bittensor as bt
+
+# Job states.
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Seconds between concurrency adjustments and telemetry reports.
+INTERVAL = 5.0
+# Relative throughput gain needed to keep an added worker, smaller gains count as the disk being saturated.
+MIN_GAIN = 0.05
+# Relative throughput loss after which a worker is taken away.
+MAX_LOSS = 0.1
+# Intervals concurrency is held after the disk looked saturated, before another worker is tried.
+HOLD_INTERVALS = 6
+# Number of stderr lines kept per job for the failure report.
+STDERR_LINES = 20
+
+class Job:
+    """
+    A single generator process: the allocation it generates, the command which runs it and its live progress,
+    parsed from the "progress <done> <total>" lines the generator prints with --progress.
+    """
+
+    def __init__( self, alloc: dict, cmd: typing.List[ str ], cwd: str, chunk_size: int, priority: typing.Tuple = () ):
+        self.alloc = alloc
+        self.cmd = cmd
+        self.cwd = cwd
+        self.chunk_size = chunk_size
+        self.priority = priority
+        self.state = PENDING
+        self.process: typing.Optional[ subprocess.Popen ] = None
+        self.readers: typing.List[ threading.Thread ] = []
+        self.stderr = collections.deque( maxlen = STDERR_LINES )
+        self.returncode: typing.Optional[ int ] = None
+        # Chunks done when the generator started, i.e. resumed from a previous run, and chunks done since.
+        self.resumed: typing.Optional[ int ] = None
+        self.done = 0
+        self.total = alloc['n_chunks']
+        self.started: typing.Optional[ float ] = None
+        self.finished: typing.Optional[ float ] = None
+
+    @property
+    def generated( self ) -> int:
+        # Chunks generated by this run.
+        return 0 if self.resumed is None else max( 0, self.done - self.resumed )
+
+    @property
+    def elapsed( self ) -> float:
+        if self.started is None: return 0.0
+        return ( self.finished or time.time() ) - self.started
+
+    @property
+    def throughput( self ) -> float:
+        """
+        Bytes generated per second by this run.
+        """
+        elapsed = self.elapsed
+        return self.generated * self.chunk_size / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta( self ) -> typing.Optional[ float ]:
+        """
+        Seconds until the job finishes at its current throughput, None while it is unknown.
+        """
+        if self.state == DONE: return 0.0
+        throughput = self.throughput
+        if throughput <= 0: return None
+        return max( 0, self.total - self.done ) * self.chunk_size / throughput
+
+    def start( self ):
+        self.state = RUNNING
+        self.started = time.time()
+        self.process = subprocess.Popen( self.cmd, cwd = self.cwd, stdout = subprocess.PIPE, stderr = subprocess.PIPE, text = True )
+        self.readers = [
+            threading.Thread( target = self.read_progress, daemon = True ),
+            threading.Thread( target = self.read_stderr, daemon = True ),
+        ]
+        for reader in self.readers:
+            reader.start()
+
+    def read_progress( self ):
+        for line in self.process.stdout:
+            parts = line.split()
+            if len( parts ) == 3 and parts[0] == 'progress':
+                try:
+                    done, total = int( parts[1] ), int( parts[2] )
+                except ValueError:
+                    continue
+                if self.resumed is None:
+                    self.resumed = done
+                self.done, self.total = done, total
+
+    def read_stderr( self ):
+        for line in self.process.stderr:
+            self.stderr.append( line.rstrip() )
+
+    def poll( self ) -> bool:
+        """
+        Check whether the process exited and record its exit status. Returns True once the job is finished.
+        """
+        if self.state != RUNNING: return self.state in [ DONE, FAILED ]
+        returncode = self.process.poll()
+        if returncode is None: return False
+        # Drain the last progress and stderr lines.
+        for reader in self.readers:
+            reader.join( timeout = 1.0 )
+        self.returncode = returncode
+        self.finished = time.time()
+        self.state = DONE if returncode == 0 else FAILED
+        return True
+
+    def stop( self ):
+        if self.state == RUNNING and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+    def status( self ) -> dict:
+        """
+        Return the job's path, state, progress, throughput in bytes per second, ETA in seconds and exit status.
+        """
+        return {
+            'path': self.alloc['path'],
+            'state': self.state,
+            'done': self.done,
+            'total': self.total,
+            'throughput': self.throughput,
+            'eta': self.eta,
+            'returncode': self.returncode,
+        }
+
+class Scheduler:
+    """
+    Runs generator jobs highest priority first, with a number of concurrent processes tuned to the measured throughput.
+
+    Generation starts with min_workers processes. Every interval the aggregate throughput is measured and a worker is
+    added while the last one raised throughput by more than MIN_GAIN. A worker which did not pay off is given back,
+    as is one more whenever throughput falls by more than MAX_LOSS, i.e. when the disk starts thrashing, and
+    concurrency is then held for HOLD_INTERVALS before another worker is tried. Intervals in which fewer processes ran
+    than in the previous one, i.e. while the queue drains, are not judged. It never exceeds max_workers.
+    """
+
+    def __init__( self, max_workers: int = 10, min_workers: int = 1, interval: float = INTERVAL ):
+        self.max_workers = max( 1, max_workers )
+        self.min_workers = max( 1, min( min_workers, self.max_workers ) )
+        self.interval = interval
+        self.target = self.min_workers
+        self.jobs: typing.List[ Job ] = []
+        # Throughput and running processes measured at the previous adjustment, and whether that adjustment added a worker.
+        self.previous_throughput = 0.0
+        self.previous_running = 0
+        self.grew = False
+        self.hold = 0
+        self.measured_generated = 0
+        self.measured_at = 0.0
+
+    def generated_bytes( self ) -> int:
+        return sum( job.generated * job.chunk_size for job in self.jobs )
+
+    def adjust( self, throughput: float, running: int, pending: int ):
+        # Hill climb on throughput: keep adding workers while they pay off, back off when they hurt.
+        if running < self.previous_running:
+            # Generators finished and were not replaced, i.e. the queue is draining. Throughput fell with the number
+            # of processes rather than because the disk is thrashing, so this interval tells nothing about the target.
+            self.grew = False
+        elif self.grew:
+            self.grew = False
+            if throughput < self.previous_throughput * ( 1 + MIN_GAIN ):
+                # The added worker did not pay off, the disk is saturated: give it back and hold.
+                self.target = max( self.min_workers, self.target - 1 )
+                self.hold = HOLD_INTERVALS
+        elif throughput < self.previous_throughput * ( 1 - MAX_LOSS ) and self.target > self.min_workers:
+            self.target -= 1
+            self.hold = HOLD_INTERVALS
+        elif self.hold > 0:
+            self.hold -= 1
+        elif pending and running >= self.target and self.target < self.max_workers:
+            self.target += 1
+            self.grew = True
+        self.previous_throughput = throughput
+        self.previous_running = running
+
+    def report( self, throughput: float ):
+        running = [ job for job in self.jobs if job.state == RUNNING ]
+        remaining = sum( max( 0, job.total - job.done ) for job in self.jobs if job.state in [ PENDING, RUNNING ] ) * ( self.jobs[0].chunk_size if self.jobs else 0 )
+        eta = f"{remaining / throughput:.0f}s" if throughput > 0 else "unknown"
+        finished = sum( job.state in [ DONE, FAILED ] for job in self.jobs )
+        bt.logging.info(f"Generation: {finished}/{len( self.jobs )} jobs finished, {len( running )} running (target {self.target}), {throughput / ( 1 << 20 ):.2f} MB/s, ETA {eta}")
+        for job in running:
+            status = job.status()
+            bt.logging.debug(f"Generating {status['path']}: {status['done']}/{status['total']} chunks, {status['throughput'] / ( 1 << 20 ):.2f} MB/s, ETA {status['eta'] if status['eta'] is None else round( status['eta'] )}s")
+
+    def stats( self ) -> dict:
+        """
+        Return the target concurrency, the last measured throughput and the status of every job.
+        """
+        return {
+            'target': self.target,
+            'throughput': self.previous_throughput,
+            'jobs': [ job.status() for job in self.jobs ],
+        }
+
+    def run( self, jobs: typing.List[ Job ], on_done: typing.Optional[ typing.Callable[ [ Job ], None ] ] = None ) -> typing.List[ Job ]:
+        """
+        Run the jobs to completion.
+
+        Args:
+        - jobs (list): The jobs, started in descending priority order.
+        - on_done (callable): Called with each job as it finishes, successfully or not.
+
+        Returns:
+        - list: The jobs, with their final state and exit status.
+        """
+        self.jobs = list( jobs )
+        pending = collections.deque( sorted( self.jobs, key = lambda job: job.priority, reverse = True ) )
+        running: typing.List[ Job ] = []
+        self.measured_generated, self.measured_at = 0, time.time()
+        try:
+            while pending or running:
+                while pending and len( running ) < self.target:
+                    job = pending.popleft()
+                    bt.logging.debug( job.cmd )
+                    job.start()
+                    running.append( job )
+
+                # Sleep until the next adjustment, collecting finished jobs as they exit.
+                deadline = time.time() + self.interval
+                while running and time.time() < deadline:
+                    for job in [ job for job in running if job.poll() ]:
+                        running.remove( job )
+                        if job.state == FAILED:
+                            bt.logging.error(f"Failed to generate database: {job.alloc['path']} exit status: {job.returncode} stderr: {' | '.join( job.stderr )}")
+                        else:
+                            bt.logging.debug(f"Generated database: {job.alloc['path']} in {job.elapsed:.1f}s")
+                        if on_done is not None:
+                            on_done( job )
+                    if pending and len( running ) < self.target: break
+                    time.sleep( min( 0.1, self.interval ) )
+
+                now = time.time()
+                if now - self.measured_at >= self.interval:
+                    generated = self.generated_bytes()
+                    throughput = ( generated - self.measured_generated ) / ( now - self.measured_at )
+                    self.measured_generated, self.measured_at = generated, now
+                    self.adjust( throughput, len( running ), len( pending ) )
+                    self.report( throughput )
+        finally:
+            # Interrupted: stop the generators, they resume from their last chunk on the next run.
+            for job in running:
+                job.stop()
+        return self.jobs
@@ -23,6 +23,7 @@
 # Step 1: Import necessary libraries and modules
 import os
 import time
+import random
 import argparse
 import traceback
 import bittensor as bt
@@ -31,14 +32,22 @@ import bittensor as bt
 import json
 import torch
 import typing
+import hashlib
+import collections
 import allocate
-import sqlite3
+import chunkstore
+import cache
+import executor
+import functools
 from tqdm import tqdm
 
 # import this repo
 import storage
 import threading
 
+# Maximum number of streamed payloads tracked at once, older unfinished streams are dropped.
+MAX_OPEN_STREAMS = 1024
+
 def get_config():
     # Step 2: Set up the configuration parser
     # This function initializes the necessary command-line arguments.
@@ -50,10 +59,21 @@ def get_config():
     parser.add_argument( '--netuid', type = int, default = 1, help = "The chain subnet uid." )
     # The number of steps between reallocations.
     parser.add_argument( '--steps_per_reallocate', type = int, default = 1000, help = "The number of steps between reallocations." )
+    # How far the chain advances between metagraph syncs, which happen in the background.
+    parser.add_argument( '--metagraph_interval', type = int, default = storage.metagraph.BLOCK_INTERVAL, help = "The number of blocks between metagraph syncs." )
     # The proportion of available space used to store data. 
     parser.add_argument("--threshold", type=float, default=0.001, required=False, help="Size of path to fill")
     # If set, the miner will realocate its DB entirely (this is expensive and not recommended)
     parser.add_argument("--restart", action='store_true', default=False, help="Restart the db.")
+    # The maximum number of keys served from a single batched retrieve.
+    parser.add_argument( '--max_batch_size', type = int, default = 64, help = "The maximum number of keys served per batched retrieve." )
+    # The memory budget for recently retrieved chunks.
+    parser.add_argument( '--cache_size', type = int, default = 1 << 28, help = "The number of bytes of recently retrieved chunks kept in memory, 0 disables the cache." )
+    # The number of threads serving storage calls and the number of requests allowed to queue for them.
+    parser.add_argument( '--storage_workers', type = int, default = 8, help = "The number of threads serving storage calls." )
+    parser.add_argument( '--max_pending_requests', type = int, default = 256, help = "The number of requests queued or running before new ones are rejected as overloaded." )
+    # The backend holding the generated and stored chunks.
+    parser.add_argument( '--chunk_store', type = str, default = chunkstore.SQLITE, choices = chunkstore.BACKENDS, help = "Store chunks as SQLite rows or in append-only memory mapped segment files." )
     # Adds subtensor specific arguments i.e. --subtensor.chain_endpoint ... --subtensor.network ...
     bt.subtensor.add_args(parser)
     # Adds logging specific arguments i.e. --logging.debug ..., --logging.trace .. or --logging.logging_dir ...
@@ -82,6 +102,248 @@ def get_config():
     return config
 
 
+class Miner:
+    """
+    The storage side of a miner: the chunk stores of its allocations, the chunk cache, the bounded storage pool and
+    the axon handlers serving them. It does not touch the chain, so the handlers can also be driven locally, i.e.
+    by the benchmarks.
+
+    Args:
+    - config (bt.config): The miner config, see get_config.
+    - allocations (allocation_table.AllocationTable): The miner's allocations, looked up by validator hotkey.
+    """
+
+    def __init__( self, config, allocations ):
+        self.config = config
+        self.allocations = allocations
+        # Open the chunk store of each validator's allocation on first use.
+        self.stores = {}
+        self.stores_lock = threading.Lock()
+        # Recently retrieved chunks, served from memory until they are written or evicted.
+        self.chunk_cache = cache.ChunkCache( config.cache_size )
+        # Storage calls run on a sized thread pool with a bounded queue, so a slow disk read never stalls the axon.
+        self.storage_executor = executor.BoundedExecutor( config.storage_workers, config.max_pending_requests )
+        # Running hashes of the payloads being streamed in, keyed by (dendrite hotkey, key).
+        self.stream_hashers = collections.OrderedDict()
+        self.stream_lock = threading.Lock()
+
+    def handlers( self ) -> typing.List[ typing.Callable ]:
+        """
+        Return the forward functions to attach to an axon, storage calls wrapped to run on the storage pool.
+        """
+        return [ self.ping ] + [ self.bounded( handler ) for handler in [ self.retrieve, self.retrieve_batch, self.retrieve_frame, self.prove, self.store, self.store_frame ] ]
+
+    def shutdown( self ):
+        self.storage_executor.shutdown()
+        self.close_stores()
+
+    def close_stores( self ):
+        with self.stores_lock:
+            for validator, store in self.stores.items():
+                store.close()
+                bt.logging.info(f"Closed chunk store for validator: {validator}")
+
+    def reopen_store( self, validator: str, path: str ):
+        # Close the store of a validator and its pooled connections so they are reopened against the regenerated files.
+        with self.stores_lock:
+            store = self.stores.pop( validator, None )
+        if store is not None:
+            store.close()
+        storage.connections.manager.close( path )
+        # The cached chunks were read from the old files.
+        self.chunk_cache.invalidate_all( validator )
+
+    def get_store( self, validator: str ) -> chunkstore.ChunkStore:
+        with self.stores_lock:
+            if validator not in self.stores:
+                self.stores[ validator ] = chunkstore.open_store( self.allocations[ validator ], self.config.chunk_store )
+            return self.stores[ validator ]
+
+    def assign_key( self, store: chunkstore.ChunkStore, validator: str ) -> typing.Optional[ str ]:
+        # Reserve a random chunk id of the validator's allocation which holds no stored data yet.
+        key = store.assign_key( self.allocations[validator]['n_chunks'] )
+        if key is None:
+            bt.logging.error(f"Failed to assign a free key for validator: {validator}")
+        return key
+
+    def load( self, validator: str, key: str ) -> typing.Optional[ str ]:
+        # Serve a chunk from the cache, reading and caching it on a miss.
+        data = self.chunk_cache.get( validator, key )
+        if data is None:
+            stamp = self.chunk_cache.stamp()
+            data = self.get_store( validator ).get( key )
+            if data is not None:
+                self.chunk_cache.put( validator, key, data, stamp )
+        return data
+
+    def load_many( self, validator: str, keys: typing.List[ str ] ) -> typing.Dict[ str, str ]:
+        # Serve cached chunks from memory and read all missing ones with a single store lookup.
+        rows, missing = {}, []
+        for key in keys:
+            data = self.chunk_cache.get( validator, key )
+            if data is None:
+                missing.append( key )
+            else:
+                rows[ key ] = data
+        stamp = self.chunk_cache.stamp()
+        for key, data in self.get_store( validator ).get_many( missing ).items():
+            self.chunk_cache.put( validator, key, data, stamp )
+            rows[ key ] = data
+        return rows
+
+    def bounded( self, handler ):
+        # Wrap a blocking handler to run on the storage pool, answering with an overload response when its queue is full.
+        @functools.wraps( handler )
+        async def forward( synapse ):
+            synapse.queue_depth = self.storage_executor.depth
+            try:
+                return await self.storage_executor.run( handler, synapse )
+            except executor.Overloaded:
+                bt.logging.warning(f"Overloaded with {synapse.queue_depth} pending requests, rejecting {type( synapse ).__name__} from dendrite: {synapse.dendrite.hotkey}")
+                synapse.overloaded = True
+                # Return without echoing any payload back to the sender.
+                if isinstance( synapse, ( storage.protocol.Store, storage.protocol.StoreFrame ) ):
+                    synapse.data = ''
+                return synapse
+        return forward
+
+    async def ping( self, synapse: storage.protocol.Ping ) -> storage.protocol.Ping:
+        synapse.data = "OK"
+        return synapse
+
+    def retrieve( self, synapse: storage.protocol.Retrieve ) -> storage.protocol.Retrieve:
+        # Check if we have the data connection locally
+        bt.logging.info(f'Got request for key: {synapse.key} from dendrite: {synapse.dendrite.hotkey}')
+        data_value = self.load( synapse.dendrite.hotkey, synapse.key )
+
+        # Set data to None if key not found
+        if data_value is not None:
+            synapse.data = data_value
+            synapse.encoding = self.get_store( synapse.dendrite.hotkey ).encoding( synapse.key )
+            bt.logging.success(f"Found data for key {synapse.key}!")
+        else:
+            synapse.data = None
+            bt.logging.error(f"Data not found for key {synapse.key}!")
+        return synapse
+
+    def retrieve_batch( self, synapse: storage.protocol.RetrieveBatch ) -> storage.protocol.RetrieveBatch:
+        # Keys past the batch limit are answered with None.
+        keys = synapse.keys[ :self.config.max_batch_size ]
+        bt.logging.info(f'Got batch request for {len(synapse.keys)} keys from dendrite: {synapse.dendrite.hotkey}')
+        rows = self.load_many( synapse.dendrite.hotkey, keys )
+        synapse.data = [ rows.get( key ) for key in keys ] + [ None ] * ( len( synapse.keys ) - len( keys ) )
+        store = self.get_store( synapse.dendrite.hotkey )
+        synapse.encodings = [ store.encoding( key ) if key in rows else None for key in keys ] + [ None ] * ( len( synapse.keys ) - len( keys ) )
+        bt.logging.success(f"Found data for {len(rows)} of {len(synapse.keys)} keys!")
+        return synapse
+
+    def prove( self, synapse: storage.protocol.Prove ) -> storage.protocol.Prove:
+        # Answer with a range of merkle leaves and their authentication path instead of whole chunks.
+        keys = synapse.keys[ :self.config.max_batch_size ]
+        bt.logging.info(f'Got proof request for {len(synapse.keys)} keys from dendrite: {synapse.dendrite.hotkey}')
+        rows = self.load_many( synapse.dendrite.hotkey, keys )
+
+        synapse.n_leaves, synapse.leaves, synapse.proofs = [], [], []
+        for key, start in zip( synapse.keys, synapse.starts ):
+            data = rows.get( key )
+            if data is None:
+                synapse.n_leaves.append( None ); synapse.leaves.append( None ); synapse.proofs.append( None )
+                continue
+            data = data.encode( 'utf-8' )
+            levels = storage.merkle.build_tree( data )
+            start = start % len( levels[0] )
+            stop = min( start + max( synapse.count, 1 ), len( levels[0] ) )
+            synapse.n_leaves.append( len( levels[0] ) )
+            synapse.leaves.append( [ leaf.decode( 'latin-1' ) for leaf in storage.merkle.split( data )[ start: stop ] ] )
+            synapse.proofs.append( [ node.hex() for node in storage.merkle.prove( levels, start, stop ) ] )
+        bt.logging.success(f"Proved {len(rows)} of {len(synapse.keys)} keys!")
+        return synapse
+
+    def retrieve_frame( self, synapse: storage.protocol.RetrieveFrame ) -> storage.protocol.RetrieveFrame:
+        # Serve a single bounded frame of the payload so neither side buffers the whole chunk.
+        bt.logging.info(f'Got frame request for key: {synapse.key} at offset: {synapse.offset} from dendrite: {synapse.dendrite.hotkey}')
+        # Fetch only the requested range of the chunk.
+        length = max( 0, min( synapse.length, storage.protocol.FRAME_SIZE ) )
+        data = self.chunk_cache.get( synapse.dendrite.hotkey, synapse.key )
+        if data is not None:
+            synapse.data, synapse.size = data[ synapse.offset: synapse.offset + length ], len( data )
+        else:
+            synapse.data, synapse.size = self.get_store( synapse.dendrite.hotkey ).read( synapse.key, synapse.offset, length )
+        if synapse.data is None:
+            bt.logging.error(f"Data not found for key {synapse.key}!")
+        else:
+            synapse.encoding = self.get_store( synapse.dendrite.hotkey ).encoding( synapse.key )
+        return synapse
+
+    def store_frame( self, synapse: storage.protocol.StoreFrame ) -> storage.protocol.StoreFrame:
+        # Write each frame as it arrives, a frame at offset 0 replaces the stored payload.
+        bt.logging.info(f'Got frame of {len(synapse.data)} characters for key: {synapse.key} at offset: {synapse.offset} from dendrite: {synapse.dendrite.hotkey}')
+        store = self.get_store( synapse.dendrite.hotkey )
+        synapse.size = None
+        if synapse.key is None and synapse.offset == 0:
+            synapse.key = self.assign_key( store, synapse.dendrite.hotkey )
+        stream = ( synapse.dendrite.hotkey, synapse.key )
+        try:
+            hasher = None
+            if synapse.offset == 0 and synapse.key is not None:
+                # The encoding is recorded with the first frame, payloads in an unknown encoding are rejected.
+                if synapse.encoding in storage.protocol.ENCODINGS and store.put( synapse.key, synapse.data, synapse.encoding ):
+                    hasher = hashlib.sha256()
+            else:
+                with self.stream_lock:
+                    hasher = self.stream_hashers.get( stream )
+                # Only append a frame which continues the payload held so far.
+                if hasher is not None and not store.append( synapse.key, synapse.offset, synapse.data, synapse.final ):
+                    hasher = None
+            with self.stream_lock:
+                if hasher is not None:
+                    self.chunk_cache.invalidate( synapse.dendrite.hotkey, synapse.key )
+                    hasher.update( synapse.data.encode( 'utf-8' ) )
+                    self.stream_hashers[ stream ] = hasher
+                    self.stream_hashers.move_to_end( stream )
+                    synapse.size = synapse.offset + len( synapse.data )
+                    if synapse.final:
+                        synapse.hash = self.stream_hashers.pop( stream ).hexdigest()
+                        bt.logging.success(f"Stored {synapse.size} characters for key {synapse.key}!")
+                else:
+                    self.stream_hashers.pop( stream, None )
+                    bt.logging.error(f"Rejected frame at offset: {synapse.offset} for key {synapse.key}!")
+
+                # Forget the oldest streams which were abandoned before their final frame.
+                while len( self.stream_hashers ) > MAX_OPEN_STREAMS:
+                    self.stream_hashers.popitem( last = False )
+        except Exception as e:
+            bt.logging.error(f"Error updating database: {e}")
+
+        # Return without echoing the frame back to the sender.
+        synapse.data = ''
+        return synapse
+
+    def store( self, synapse: storage.protocol.Store ) -> storage.protocol.Store:
+        # Check if we have the data connection locally
+        bt.logging.info(f'Got request for key: {synapse.key} from dendrite: {synapse.dendrite.hotkey}')        
+        store = self.get_store( synapse.dendrite.hotkey )
+        bt.logging.info(f'Got request to store {len(synapse.data)} characters of {synapse.encoding} encoded data under key: {synapse.key}')
+
+        # Assign a free key when the sender leaves the choice to us.
+        if synapse.key is None:
+            synapse.key = self.assign_key( store, synapse.dendrite.hotkey )
+
+        # Replace the chunk held under the key, recording its encoding for retrieval.
+        try:
+            synapse.stored = synapse.key is not None and synapse.encoding in storage.protocol.ENCODINGS and store.put( synapse.key, synapse.data, synapse.encoding )
+            if synapse.stored:
+                self.chunk_cache.invalidate( synapse.dendrite.hotkey, synapse.key )
+        except Exception as e:
+            bt.logging.error(f"Error updating database: {e}")
+
+        # Return without echoing the payload back to the sender.
+        if synapse.stored:
+            bt.logging.success(f"Stored data for key {synapse.key}!")
+        synapse.data = ''
+        return synapse
+
+
 # Main takes the config and starts the miner.
 def main( config ):
 
@@ -106,7 +368,9 @@ def main( config ):
     bt.logging.info(f"Subtensor: {subtensor}")
 
     # metagraph provides the network's current state, holding state about other participants in a subnet.
-    metagraph = subtensor.metagraph(config.netuid)
+    # It is synced on a background thread, with a chain connection of its own, once the chain advanced by --metagraph_interval blocks.
+    metagraph_cache = storage.metagraph.MetagraphCache( bt.subtensor( config = config ), config.netuid, block_interval = config.metagraph_interval ).start()
+    metagraph = metagraph_cache.metagraph
     bt.logging.info(f"Metagraph: {metagraph}")
 
     if wallet.hotkey.ss58_address not in metagraph.hotkeys:
@@ -118,79 +382,28 @@ def main( config ):
         bt.logging.info(f"Running miner on uid: {my_subnet_uid}")
 
     # Create DBs
-    allocations = { a['validator']: a for a in allocate.allocate( 
+    # The allocation of each validator, rows are looked up by validator hotkey.
+    allocations = allocate.allocate( 
         db_root_path = config.db_root_path,
         wallet = wallet,
         metagraph = metagraph,
         threshold = config.threshold,
         hash = False,
-    )}
-    bt.logging.info(f'Creating: {len(allocations)} with details: {json.dumps(allocations, indent=4, sort_keys=True)}')
-    # Generate the data allocations.
-    allocate.generate( 
-        allocations = list( allocations.values() ),  # The allocations to generate.
+        store = config.chunk_store,
+    )
+    bt.logging.info(f'Creating: {len(allocations)} with details: {json.dumps(allocations.to_dicts(), indent=4, sort_keys=True)}')
+    # Generate the data allocations which changed since the manifest was written.
+    manifest = allocate.manifest_path( os.path.join( config.db_root_path, wallet.name, wallet.hotkey_str ) )
+    allocate.reallocate( 
+        allocations = allocations,  # The allocations to generate.
+        manifest = manifest,  # The manifest of the previous allocation pass.
         no_prompt = True,  # If True, no prompt will be shown
         workers = 10,  # The number of concurrent workers to use for generation. Default is 10.
         restart = config.restart # If true, the miner will realocate its DB entirely (this is expensive and not recommended)
     )
 
-    # Connect to SQLite databases.
-    local_storage = threading.local()
-    def close_db_connections():
-        # Iterate over all connections in local_storage and close them
-        for attr in dir(local_storage):
-            if attr.startswith("connection_"):
-                connection = getattr(local_storage, attr)
-                connection.close()
-                bt.logging.info(f"Closed database connection: {attr}")
-
-    def get_db_connection(alloc):
-        # Check if we have a connection for this thread
-        if not hasattr(local_storage, f"connection_{alloc['validator']}"):
-            bt.logging.info(f"Connecting to database under path: {alloc['path']}")
-            setattr(local_storage, f"connection_{alloc['validator']}", sqlite3.connect(alloc['path']))
-        return getattr(local_storage, f"connection_{alloc['validator']}")
-
-
-    async def retrieve( synapse: storage.protocol.Retrieve ) -> storage.protocol.Retrieve:
-        # Check if we have the data connection locally
-        bt.logging.info(f'Got request for key: {synapse.key} from dendrite: {synapse.dendrite.hotkey}')        # Connect to SQLite databases
-        db = get_db_connection( allocations[synapse.dendrite.hotkey] )
-        cursor = db.cursor()
-
-        # Fetch data from SQLite databases
-        query = f"SELECT data FROM DB{wallet.hotkey.ss58_address}{synapse.dendrite.hotkey} WHERE id=?"
-        cursor.execute(query, (synapse.key,))
-        data_value = cursor.fetchone()
-        
-        # Set data to None if key not found
-        if data_value:
-            synapse.data = data_value[0]
-            bt.logging.success(f"Found data for key {synapse.key}!")
-        else:
-            synapse.data = None
-            bt.logging.error(f"Data not found for key {synapse.key}!")
-        return synapse
-
-    async def store( synapse: storage.protocol.Store ) -> storage.protocol.Store:
-        # Check if we have the data connection locally
-        bt.logging.info(f'Got request for key: {synapse.key} from dendrite: {synapse.dendrite.hotkey}')        
-        # Connect to SQLite databases
-        db = get_db_connection( allocations[synapse.dendrite.hotkey] )
-        cursor = db.cursor()
-        bt.logging.info(f'Got request to store data: {synapse.data} under key: {synapse.key}')
-
-        # Insert data into SQLite databases
-        try:
-            update_request = f"UPDATE DB{wallet.hotkey.ss58_address}{synapse.dendrite.hotkey} SET data = ? WHERE id = ?"
-            cursor.execute(update_request, (synapse.data, synapse.key))
-            db.commit()
-        except Exception as e:
-            bt.logging.error(f"Error updating database: {e}")
-
-        # Return
-        bt.logging.success(f"Stored data for key {synapse.key}!")
-        return synapse
+    # The chunk stores, cache and storage pool behind the axon's handlers.
+    miner = Miner( config, allocations )
 
     # Step 5: Build and link miner functions to the axon.
     # The axon handles request processing, allowing validators to send this process requests.
@@ -199,11 +412,12 @@ def main( config ):
 
     # Attach determiners which functions are called when servicing a request.
     bt.logging.info(f"Attaching forward function to axon.")
-    axon.attach( retrieve ).attach( store )
+    for handler in miner.handlers():
+        axon.attach( handler )
 
     # Serve passes the axon information to the network + netuid we are hosting on.
     # This will auto-update if the axon port of external ip have changed.
-    bt.logging.info(f"Serving axon {store} and {retrieve} on network: {config.subtensor.chain_endpoint} with netuid: {config.netuid}")
+    bt.logging.info(f"Serving axon {miner.store}, {miner.store_frame}, {miner.retrieve}, {miner.retrieve_batch}, {miner.retrieve_frame} and {miner.prove} on network: {config.subtensor.chain_endpoint} with netuid: {config.netuid}")
     axon.serve( netuid = config.netuid, subtensor = subtensor )
 
     # Start  starts the miner's axon, making it active on the network.
@@ -217,9 +431,11 @@ def main( config ):
     while True:
         try:
             # TODO(developer): Define any additional operations to be performed by the miner.
-            # Below: Periodically update our knowledge of the network graph.
+            # Below: Periodically update our knowledge of the network graph, synced in the background.
+            for changes in metagraph_cache.changes():
+                bt.logging.debug(f"Metagraph changes: {changes.to_dict()}")
             if step % 5 == 0:
-                metagraph = subtensor.metagraph(config.netuid)
+                metagraph = metagraph_cache.metagraph
                 log =  (f'Step:{step} | '\
                         f'Block:{metagraph.block.item()} | '\
                         f'Stake:{metagraph.S[my_subnet_uid]} | '\
@@ -229,24 +445,37 @@ def main( config ):
                         f'Incentive:{metagraph.I[my_subnet_uid]} | '\
                         f'Emission:{metagraph.E[my_subnet_uid]}')
                 bt.logging.info(log)
+                bt.logging.debug(f"Connections: {storage.connections.stats()}")
+                bt.logging.debug(f"Chunk cache: {miner.chunk_cache.stats()}")
+                bt.logging.debug(f"Storage queue: {miner.storage_executor.stats()}")
+                bt.logging.debug(f"Metagraph: {metagraph_cache.stats()}")
 
+            # Reallocate even when the metagraph is unchanged, free disk space also moves the allocations.
+            # Only the allocations which differ from the manifest are regenerated, so this is cheap otherwise.
             if step % config.steps_per_reallocate == 0:
-                metagraph = subtensor.metagraph( config.netuid )
-                allocations = { a['validator']: a for a in allocate.allocate( 
+                metagraph = metagraph_cache.metagraph
+                # The allocation of each validator, rows are looked up by validator hotkey.
+                allocations = allocate.allocate( 
                     db_root_path = config.db_root_path,
                     wallet = wallet,
                     metagraph = metagraph,
                     threshold = config.threshold,
                     hash = False,
-                )}
-                bt.logging.info(f'Reallocating: {len(allocations)} with details: {json.dumps(allocations, indent=4, sort_keys=True)}')
-                # Generate the data allocations.
-                allocate.generate( 
-                    allocations = list( allocations.values() ),  # The allocations to generate.
+                    store = config.chunk_store,
+                )
+                bt.logging.debug(f'Reallocating: {len(allocations)} with details: {json.dumps(allocations.to_dicts(), indent=4, sort_keys=True)}')
+                # Generate only the data allocations which were added, resized or removed.
+                jobs = allocate.reallocate( 
+                    allocations = allocations,  # The allocations to generate.
+                    manifest = manifest,  # The manifest of the previous allocation pass.
                     no_prompt = True,  # If True, no prompt will be shown
                     workers = 10,  # The number of concurrent workers to use for generation. Default is 10.
                     restart = False # If true, the miner will realocate its DB entirely (this is expensive and not recommended)
                 )
+                # Serve the new allocations, reopening the stores of regenerated ones on next use.
+                miner.allocations = allocations
+                for job in jobs:
+                    miner.reopen_store( job['alloc']['validator'], job['alloc']['path'] )
 
             step += 1
             time.sleep(1)
@@ -254,7 +483,8 @@ def main( config ):
         # If someone intentionally stops the miner, it'll safely terminate operations.
         except KeyboardInterrupt:
             axon.stop()
-            close_db_connections() # Close all db connections
+            metagraph_cache.stop()
+            miner.shutdown() # Drain the storage pool and close all chunk stores
             bt.logging.success('Miner killed by keyboard interrupt.')
             break
         # In case of unforeseen errors, the miner will log the error and continue operations.
@@ -0,0 +1,180 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import typing
+import zipfile
+import numpy as np
+import bittensor as bt
+import allocation_table
+
+# Name of the checkpoint file, written next to the validator's partition.json.
+STATE_NAME = 'validator_state.npz'
+# Bumped when the layout of the checkpoint changes, older checkpoints are then ignored.
+VERSION = 1
+# Estimated number of chunks and score of a miner the validator knows nothing about.
+DEFAULT_CHUNKS = 100
+DEFAULT_SCORE = 1.0
+
+def save( path: str, allocations: allocation_table.AllocationTable, scores: np.ndarray, step: int ):
+    """
+    Checkpoint the validator's per miner estimates, verified sizes and scores with the step counter.
+    The file is replaced atomically so a crash never leaves a partial checkpoint.
+
+    Args:
+    - path (str): The checkpoint path.
+    - allocations (allocation_table.AllocationTable): The estimated (n_chunks) and verified allocations of the miners.
+    - scores (np.ndarray): The score of each miner, indexed like the allocations.
+    - step (int): The validator's step counter.
+    """
+    if not os.path.exists( os.path.dirname( path ) ):
+        os.makedirs( os.path.dirname( path ) )
+    temporary = path + '.tmp'
+    # Written through a file object, np.savez would otherwise append .npz to the temporary name.
+    with open( temporary, 'wb' ) as f:
+        np.savez(
+            f,
+            version = np.int64( VERSION ),
+            owner = np.str_( allocations.owner ),
+            step = np.int64( step ),
+            hotkeys = np.array( allocations.peers, dtype = np.str_ ),
+            n_chunks = allocations.n_chunks,
+            verified = allocations.verified,
+            scores = np.asarray( scores, dtype = np.float32 ),
+        )
+        f.flush()
+        os.fsync( f.fileno() )
+    os.replace( temporary, path )
+
+def load( path: str ) -> typing.Optional[ dict ]:
+    """
+    Read a checkpoint written by save.
+
+    Args:
+    - path (str): The checkpoint path.
+
+    Returns:
+    - dict: The 'owner', 'step', 'hotkeys', 'n_chunks', 'verified' and 'scores' of the checkpoint, None if there is
+        no checkpoint or it cannot be read.
+    """
+    if not os.path.exists( path ):
+        return None
+    try:
+        with np.load( path, allow_pickle = False ) as arrays:
+            if int( arrays['version'] ) != VERSION:
+                bt.logging.warning(f"Ignoring validator state {path} with version {int( arrays['version'] )}")
+                return None
+            checkpoint = {
+                'owner': str( arrays['owner'] ),
+                'step': int( arrays['step'] ),
+                'hotkeys': arrays['hotkeys'].tolist(),
+                'n_chunks': arrays['n_chunks'],
+                'verified': arrays['verified'],
+                'scores': arrays['scores'],
+            }
+    except ( OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile ) as e:
+        bt.logging.warning(f"Ignoring unreadable validator state {path}: {e}")
+        return None
+    n = len( checkpoint['hotkeys'] )
+    if any( len( checkpoint[ column ] ) != n for column in [ 'n_chunks', 'verified', 'scores' ] ):
+        bt.logging.warning(f"Ignoring inconsistent validator state {path}")
+        return None
+    return checkpoint
+
+def reconcile(
+        allocations: allocation_table.AllocationTable,
+        scores: np.ndarray,
+        hotkeys: typing.List[ str ],
+    ) -> typing.Tuple[ allocation_table.AllocationTable, np.ndarray, int ]:
+    """
+    Carry the estimates, verified sizes and scores of the miners over to the current metagraph.
+
+    Rows are matched by hotkey rather than uid: a miner keeps its state if its uid moved, and a uid whose hotkey was
+    replaced starts over from DEFAULT_CHUNKS, nothing verified and DEFAULT_SCORE, as does any new uid. A new table is
+    returned, the hotkeys of the given one may be shared with its snapshots.
+
+    Args:
+    - allocations (allocation_table.AllocationTable): The allocations of the miners the state was learnt for.
+    - scores (np.ndarray): The score of each miner, indexed like the allocations.
+    - hotkeys (list): The hotkeys of the current metagraph, indexed by uid.
+
+    Returns:
+    - allocation_table.AllocationTable: The allocations indexed by the current uids.
+    - np.ndarray: The scores indexed by the current uids.
+    - int: The number of uids whose state was reset.
+    """
+    source = np.array( [ allocations.positions.get( hotkey, -1 ) for hotkey in hotkeys ], dtype = np.int64 )
+    known = source >= 0
+    n_chunks = np.full( len( hotkeys ), DEFAULT_CHUNKS, dtype = np.int64 )
+    n_chunks[ known ] = allocations.n_chunks[ source[ known ] ]
+    verified = np.zeros( len( hotkeys ), dtype = np.int64 )
+    verified[ known ] = allocations.verified[ source[ known ] ]
+    reconciled_scores = np.full( len( hotkeys ), DEFAULT_SCORE, dtype = np.float32 )
+    reconciled_scores[ known ] = np.asarray( scores, dtype = np.float32 )[ source[ known ] ]
+    reconciled = allocation_table.AllocationTable(
+        root = allocations.root,
+        owner = allocations.owner,
+        peers = hotkeys,
+        role = allocations.role,
+        n_chunks = n_chunks,
+        verified = verified,
+        hash = allocations.hash,
+        store = allocations.store,
+    )
+    return reconciled, reconciled_scores, int( ( ~known ).sum() )
+
+def restore(
+        path: typing.Optional[ str ],
+        root: str,
+        owner: str,
+        hotkeys: typing.List[ str ],
+    ) -> typing.Tuple[ allocation_table.AllocationTable, np.ndarray, int ]:
+    """
+    Build the validator's allocations and scores for the current metagraph, from the checkpoint if there is one.
+
+    Args:
+    - path (str): The checkpoint path, None to start over.
+    - root (str): The directory holding the validator's hash databases.
+    - owner (str): The validator's hotkey.
+    - hotkeys (list): The hotkeys of the current metagraph, indexed by uid.
+
+    Returns:
+    - allocation_table.AllocationTable: The allocations, indexed by uid.
+    - np.ndarray: The scores, indexed by uid.
+    - int: The step to resume from, 0 without a checkpoint.
+    """
+    checkpoint = load( path ) if path is not None else None
+    if checkpoint is not None and checkpoint['owner'] != owner:
+        bt.logging.warning(f"Ignoring validator state {path} written for hotkey {checkpoint['owner']}")
+        checkpoint = None
+    if checkpoint is None:
+        checkpoint = { 'step': 0, 'hotkeys': [], 'n_chunks': [], 'verified': [], 'scores': [] }
+    saved = allocation_table.AllocationTable(
+        root = root,
+        owner = owner,
+        peers = checkpoint['hotkeys'],
+        role = allocation_table.VALIDATOR,
+        n_chunks = checkpoint['n_chunks'],
+        verified = checkpoint['verified'],
+        hash = True,
+    )
+    allocations, scores, reset = reconcile( saved, checkpoint['scores'], hotkeys )
+    if len( saved ):
+        bt.logging.info(f"Restored validator state from step {checkpoint['step']}: {len( hotkeys ) - reset} miners restored, {reset} reset")
+    return allocations, scores, checkpoint['step']
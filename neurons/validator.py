@@ -25,19 +25,21 @@ import os
 import time
 import torch
 import random
+import asyncio
 import argparse
 import traceback
 import bittensor as bt
 
 # Custom modules
-import copy
+import typing
 import hashlib
-import sqlite3
-from tqdm import tqdm
 
 # import this repo
 import storage
 import allocate
+import allocation_table
+import state
+import challenges
 
 # Step 2: Set up the configuration parser
 # This function is responsible for setting up and parsing command-line arguments.
@@ -49,6 +51,30 @@ def get_config():
     parser.add_argument('--no_bridge', action='store_true', help='Run without bridging to the network.')
     # Adds override arguments for network and netuid.
     parser.add_argument( '--netuid', type = int, default = 1, help = "The chain subnet uid." )
+    # The maximum number of challenges in flight at once during a sweep.
+    parser.add_argument( '--max_concurrent_challenges', type = int, default = 64, help = "The maximum number of miners challenged concurrently." )
+    # The time a miner has to answer a challenge.
+    parser.add_argument( '--challenge_timeout', type = float, default = 12.0, help = "Per miner challenge timeout in seconds." )
+    # The number of chunks checked per challenge, all sent in a single batched request.
+    parser.add_argument( '--chunks_per_challenge', type = int, default = 1, help = "The number of chunks checked per miner per sweep." )
+    # Challenge with merkle proofs over a few leaves, or by retrieving whole chunks.
+    parser.add_argument( '--challenge_mode', type = str, default = 'proof', choices = [ 'proof', 'full', 'stream' ], help = "Whether miners prove chunks with merkle proofs, return them in full, or stream them in frames." )
+    # The number of consecutive merkle leaves requested per chunk in proof mode.
+    parser.add_argument( '--proof_leaves', type = int, default = 4, help = "The number of merkle leaves requested per chunk in proof mode." )
+    # The per round challenge budget, spent on the miners whose capacity is known least precisely.
+    parser.add_argument( '--challenge_budget', type = int, default = 0, help = "The maximum number of miners challenged per sweep, 0 for no limit." )
+    # Miners whose capacity is known this precisely are not challenged.
+    parser.add_argument( '--challenge_tolerance', type = float, default = challenges.TOLERANCE, help = "The relative width of a miner's capacity interval below which it is only audited." )
+    # How quickly converged miners become due for a challenge again.
+    parser.add_argument( '--challenge_decay', type = float, default = challenges.DECAY, help = "The factor the capacity bounds are loosened by each sweep." )
+    # How far the chain advances between metagraph syncs, which happen in the background.
+    parser.add_argument( '--metagraph_interval', type = int, default = storage.metagraph.BLOCK_INTERVAL, help = "The number of blocks between metagraph syncs." )
+    # The threads extending the miners' hash chains after each sweep.
+    parser.add_argument( '--chain_workers', type = int, default = None, help = "The number of threads extending hash chains, defaults to the number of CPUs." )
+    # How often the per miner estimates and scores are checkpointed, they are restored from the checkpoint on start.
+    parser.add_argument( '--checkpoint_steps', type = int, default = 1, help = "The number of steps between validator state checkpoints, 0 only checkpoints on exit." )
+    # Start over from the default estimates instead of the checkpoint.
+    parser.add_argument( '--fresh_state', action = 'store_true', help = "Ignore the validator state checkpoint on start." )
     # Adds subtensor specific arguments i.e. --subtensor.chain_endpoint ... --subtensor.network ...
     bt.subtensor.add_args(parser)
     # Adds logging specific arguments i.e. --logging.debug ..., --logging.trace .. or --logging.logging_dir ...
@@ -76,6 +102,248 @@ def get_config():
     # Return the parsed config.
     return config
 
+async def challenge_proof( dendrite: bt.dendrite, axon, keys: typing.List[ str ], roots: typing.List[ bytes ], timeout: float, proof_leaves: int ) -> typing.Optional[ typing.List[ bool ] ]:
+    """
+    Challenge a miner to prove a random range of merkle leaves for each chunk against the stored roots.
+
+    Args:
+    - dendrite (bt.dendrite): The dendrite used to query the miner.
+    - axon (bt.axon_info): The axon of the miner.
+    - keys (List[str]): The chunks to prove.
+    - roots (List[bytes]): The merkle roots of the chunks.
+    - timeout (float): The time the miner has to respond.
+    - proof_leaves (int): The number of consecutive leaves requested per chunk.
+
+    Returns:
+    - Optional[List[bool]]: Whether the range of each chunk verified against its root, None if the miner was overloaded.
+    """
+    expected_leaves = storage.merkle.n_leaves( allocate.CHUNK_SIZE )
+    starts = [ random.randrange( expected_leaves ) for _ in keys ]
+    response = await dendrite.forward( axon, storage.protocol.Prove( keys = keys, starts = starts, count = proof_leaves ), timeout = timeout, deserialize = False )
+    if response.overloaded:
+        # The miner turned the request away, this says nothing about the data it holds.
+        bt.logging.debug(f"Miner {axon.hotkey} is overloaded with {response.queue_depth} pending requests")
+        return None
+    results = ( response.n_leaves, response.leaves, response.proofs )
+    if any( result == None or len( result ) != len( keys ) for result in results ):
+        # The miner could not respond with the proofs.
+        return [ False ] * len( keys )
+
+    verified = []
+    for key, start, root, n_leaves, leaves, proof in zip( keys, starts, roots, *results ):
+        try:
+            # The miner answers the range starting at start modulo its number of leaves, which is bound into the root.
+            start = start % n_leaves
+            ok = len( leaves ) == min( proof_leaves, n_leaves - start ) and storage.merkle.verify( root, n_leaves, start, [ leaf.encode( 'latin-1' ) for leaf in leaves ], [ bytes.fromhex( node ) for node in proof ] )
+        except ( TypeError, ValueError, ZeroDivisionError, UnicodeEncodeError ):
+            # The miner responded with a malformed proof.
+            ok = False
+        bt.logging.debug(f"   Key: {key}, Start: {start}, Verified: {ok}")
+        verified.append( ok )
+    return verified
+
+async def challenge(
+        dendrite: bt.dendrite,  # The dendrite used to query the miner.
+        axon,  # The axon of the miner.
+        alloc: dict,  # The allocation of the miner.
+        hash_index: storage.hash_index.HashIndex,  # The index of expected chunk hashes.
+        timeout: float,  # The time the miner has to respond.
+        n_keys: int = 1,  # The number of chunks to check in a single round trip.
+        mode: str = 'proof',  # 'proof' to check merkle proofs, 'full' to retrieve whole chunks, 'stream' to retrieve them in frames.
+        proof_leaves: int = 4,  # The number of merkle leaves requested per chunk in proof mode.
+        chunk_ids: typing.Optional[ typing.List[ int ] ] = None,  # The chunks to check, n_keys random chunks if None.
+    ) -> typing.Optional[ typing.List[ bool ] ]:
+    """
+    Challenge a single miner on a batch of chunks. In proof mode the miner returns a few merkle
+    leaves per chunk and their authentication path, chunks without a recorded root are retrieved in full.
+
+    Returns:
+    - Optional[List[bool]]: Whether the miner proved each chunk, in the order of the keys, None if the
+      challenge could not be issued or the miner reported it was overloaded.
+    """
+    # Select random chunks to validate, unless the scheduler chose them.
+    if chunk_ids is None:
+        chunk_ids = random.sample( range( alloc['n_chunks'] ), min( n_keys, alloc['n_chunks'] ) )
+    keys = [ str( chunk_i ) for chunk_i in chunk_ids ]
+    bt.logging.debug(f"Validating chunks: {keys} for miner: {alloc['miner']}")
+    results = await check( dendrite, axon, alloc, hash_index, keys, timeout, mode, proof_leaves )
+    if results is None or all( results ):
+        return results
+
+    # The bridge rewrites the hashes of the chunks it stores from another process. If any failed chunk's hash
+    # changed since the index loaded it, check those chunks again against the hashes now in the database.
+    failed = [ key for key, ok in zip( keys, results ) if not ok ]
+    if not hash_index.reload( alloc, failed ):
+        return results
+    bt.logging.debug(f"Hashes of chunks: {failed} changed for miner: {alloc['miner']}, checking them again")
+    retried = await check( dendrite, axon, alloc, hash_index, failed, timeout, mode, proof_leaves )
+    if retried is None:
+        return results
+    retried = dict( zip( failed, retried ) )
+    return [ ok or retried[ key ] for key, ok in zip( keys, results ) ]
+
+async def check(
+        dendrite: bt.dendrite,  # The dendrite used to query the miner.
+        axon,  # The axon of the miner.
+        alloc: dict,  # The allocation of the miner.
+        hash_index: storage.hash_index.HashIndex,  # The index of expected chunk hashes.
+        keys: typing.List[ str ],  # The chunks to check.
+        timeout: float,  # The time the miner has to respond.
+        mode: str,  # 'proof' to check merkle proofs, 'full' to retrieve whole chunks, 'stream' to retrieve them in frames.
+        proof_leaves: int,  # The number of merkle leaves requested per chunk in proof mode.
+    ) -> typing.Optional[ typing.List[ bool ] ]:
+    """
+    Check the given chunks of a miner against the expected hashes in a single round trip, see challenge.
+    """
+    # Prove the chunks against their merkle roots when all of them have one.
+    roots = [ hash_index.root( alloc, key ) for key in keys ]
+    if mode == 'proof' and keys and None not in roots:
+        return await challenge_proof( dendrite, axon, keys, roots, timeout, proof_leaves )
+
+    # Get the hashes of the data to validate from the index.
+    validation_hashes = [ hash_index.hexdigest( alloc, key ) for key in keys ]
+    if not keys or None in validation_hashes:
+        bt.logging.error(f"Failed to get validation hashes for chunks: {keys} from db: {alloc['path']}")
+        return None
+    bt.logging.debug(f"Validation hashes: {validation_hashes}")
+
+    if mode == 'stream':
+        # Hash each frame as it arrives so at most one frame per chunk is held in memory.
+        async def check_streamed( key: str, validation_hash: str ) -> bool:
+            hasher = hashlib.sha256()
+            received = await storage.stream.receive( dendrite, axon, key, lambda frame: hasher.update( frame.encode() ), timeout = timeout )
+            return None if received is None else received and hasher.hexdigest() == validation_hash
+        results = await asyncio.gather( *[ check_streamed( key, validation_hash ) for key, validation_hash in zip( keys, validation_hashes ) ] )
+        return None if None in results else list( results )
+
+    # Query the miner for the data.
+    response = await dendrite.forward( axon, storage.protocol.RetrieveBatch( keys = keys ), timeout = timeout, deserialize = False )
+    if response.overloaded:
+        bt.logging.debug(f"Miner {axon.hotkey} is overloaded with {response.queue_depth} pending requests")
+        return None
+    miner_data = response.data
+    if miner_data == None or len( miner_data ) != len( keys ):
+        # The miner could not respond with the data.
+        return [ False ] * len( keys )
+
+    # The miner was able to respond with the data, but we need to verify every chunk.
+    verified = []
+    for key, data, validation_hash in zip( keys, miner_data, validation_hashes ):
+        computed_hash = hashlib.sha256( data.encode() ).hexdigest() if data != None else None
+        bt.logging.debug(f"   Key: {key}, Computed hash: {computed_hash}, Validation hash: {validation_hash} ")
+        verified.append( computed_hash == validation_hash )
+    return verified
+
+async def sweep(
+        dendrite: bt.dendrite,  # The dendrite used to query the miners.
+        axons: list,  # The axons of the miners, indexed by uid.
+        allocations: allocation_table.AllocationTable,  # The estimated allocations of the miners, indexed by uid.
+        hash_index: storage.hash_index.HashIndex,  # The index of expected chunk hashes.
+        on_result: typing.Callable[ [int, typing.List[ bool ]], None ],  # Called with (uid, per key results) as each challenge completes.
+        skip_hotkey: str = None,  # Hotkey which is not challenged, i.e. our own.
+        max_concurrent: int = 64,  # The maximum number of challenges in flight.
+        timeout: float = 12.0,  # The per miner challenge timeout.
+        n_keys: int = 1,  # The number of chunks checked per miner.
+        mode: str = 'proof',  # 'proof' to check merkle proofs, 'full' to retrieve whole chunks, 'stream' to retrieve them in frames.
+        proof_leaves: int = 4,  # The number of merkle leaves requested per chunk in proof mode.
+        plan: typing.Optional[ typing.Dict[ int, typing.List[ int ] ] ] = None,  # The chunks to check by uid, every miner on random chunks if None.
+    ):
+    """
+    Challenge every miner, or the miners of the plan, concurrently. At most max_concurrent challenges
+    are in flight at once and results are passed to on_result as they arrive, so a sweep takes as long
+    as the slowest miner rather than the sum over all miners.
+    """
+    semaphore = asyncio.Semaphore( max_concurrent )
+
+    async def run( i: int, alloc: dict, chunk_ids: typing.Optional[ typing.List[ int ] ] ):
+        async with semaphore:
+            try:
+                return i, await challenge( dendrite, axons[i], alloc, hash_index, timeout, n_keys, mode, proof_leaves, chunk_ids )
+            except Exception as e:
+                # A failing challenge skips its miner for this sweep rather than ending the sweep.
+                bt.logging.error(f"Failed to challenge miner {alloc['miner']}: {e}")
+                return i, None
+
+    if plan is None:
+        tasks = [ run( i, alloc, None ) for i, alloc in enumerate( allocations ) if alloc['miner'] != skip_hotkey ]
+    else:
+        tasks = [ run( i, allocations[i], chunk_ids ) for i, chunk_ids in plan.items() if allocations[i]['miner'] != skip_hotkey ]
+    for next_result in asyncio.as_completed( tasks ):
+        i, results = await next_result
+        if results is not None:
+            on_result( i, results )
+
+def validate(
+        loop: asyncio.AbstractEventLoop,  # The event loop the sweep runs on.
+        dendrite: bt.dendrite,  # The dendrite used to query the miners.
+        axons: list,  # The axons of the miners, indexed by uid.
+        allocations: allocation_table.AllocationTable,  # The estimated allocations of the miners, indexed by uid.
+        scheduler: challenges.ChallengeScheduler,  # Chooses the miners and chunks challenged.
+        hash_index: storage.hash_index.HashIndex,  # The index of expected chunk hashes.
+        chains: storage.chains.HashChains,  # Resizes the hash tables.
+        manifest: str,  # The manifest of the previous allocation pass.
+        config,  # The validator config, see get_config.
+        own_hotkey: str,  # Our own hotkey, which is never challenged.
+    ) -> dict:
+    """
+    Run one round of the validator: challenge the miners chosen by the scheduler, apply the results as they arrive,
+    then resize the hash tables and the in-memory hash index to the new estimates.
+
+    Returns:
+    - dict: The number of miners challenged, the reallocation jobs run and the seconds the sweep and reallocation took.
+    """
+    # Load the hashes of miners which joined since the last round, so no challenge reads a whole table on the event loop.
+    for alloc in allocations:
+        if not hash_index.holds( alloc, 0 ):
+            hash_index.update( alloc )
+
+    # Challenge the miners with the least certain capacity concurrently and apply the results as they arrive.
+    previous_allocations = allocations.snapshot()
+    plan = scheduler.plan( n_keys = config.chunks_per_challenge, exclude = own_hotkey )
+    start_time = time.time()
+    loop.run_until_complete( sweep(
+        dendrite = dendrite,
+        axons = axons,
+        allocations = allocations,
+        hash_index = hash_index,
+        on_result = lambda i, results: scheduler.record( i, plan[i], results ),
+        skip_hotkey = own_hotkey,
+        max_concurrent = config.max_concurrent_challenges,
+        timeout = config.challenge_timeout,
+        n_keys = config.chunks_per_challenge,
+        mode = config.challenge_mode,
+        proof_leaves = config.proof_leaves,
+        plan = plan,
+    ))
+    sweep_seconds = time.time() - start_time
+    bt.logging.info(f"Sweep over {len( plan )} of {len( allocations )} miners took: {sweep_seconds:.2f}s")
+    bt.logging.debug(f"Challenges: {scheduler.stats()}")
+    bt.logging.debug(f"Connections: {storage.connections.stats()}")
+    bt.logging.debug(f"Hash chains: {chains.stats()}")
+
+    # Reallocate the validator's chunks.
+    bt.logging.debug(f"Prev allocations: {previous_allocations.n_chunks.tolist()}")
+    start_time = time.time()
+    jobs = allocate.reallocate( 
+        allocations = allocations,  # The allocations to generate.
+        manifest = manifest,  # The manifest of the previous allocation pass.
+        no_prompt = True,  # If True, no prompt will be shown
+        restart = False, # Dont restart the generation from empty files.
+        chains = chains,  # Resize the hash tables in-process.
+    )
+    # Extend or truncate the in-memory hashes to match the regenerated tables.
+    for job in jobs:
+        if job['action'] == allocate.REMOVE:
+            hash_index.drop( job['alloc'] )
+        else:
+            hash_index.update( job['alloc'] )
+    return {
+        'challenged': len( plan ),
+        'jobs': len( jobs ),
+        'sweep_seconds': sweep_seconds,
+        'reallocate_seconds': time.time() - start_time,
+    }
+
 def main( config ):
     # Set up logging with the provided configuration and directory.
     bt.logging(config=config, logging_dir=config.full_path)
@@ -100,7 +368,9 @@ def main( config ):
     bt.logging.info(f"Dendrite: {dendrite}")
 
     # The metagraph holds the state of the network, letting us know about other miners.
-    metagraph = subtensor.metagraph( config.netuid )
+    # It is synced on a background thread, with a chain connection of its own, once the chain advanced by --metagraph_interval blocks.
+    metagraph_cache = storage.metagraph.MetagraphCache( bt.subtensor( config = config ), config.netuid, block_interval = config.metagraph_interval ).start()
+    metagraph = metagraph_cache.metagraph
     bt.logging.info(f"Metagraph: {metagraph}")
 
     # Step 5: Connect the validator to the network
@@ -112,105 +382,58 @@ def main( config ):
         my_subnet_uid = metagraph.hotkeys.index(wallet.hotkey.ss58_address)
         bt.logging.info(f"Running validator on uid: {my_subnet_uid}")
 
-    # Step 6: Set up initial scoring weights for validation
+    # Step 6: Set up initial scoring weights and allocations for validation
+    # Miners start from the estimates, verified sizes and scores of the last checkpoint, reconciled against the
+    # metagraph by hotkey. Miners without a checkpointed state get an estimated 100 chunks, none verified yet.
     bt.logging.info("Building validation weights.")
     alpha = 0.9
-    scores = torch.ones_like(metagraph.S, dtype=torch.float32)
+    root = os.path.expanduser(f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}")
+    state_path = os.path.join( root, state.STATE_NAME )
+    next_allocations, scores, step = state.restore(
+        path = None if config.fresh_state else state_path,
+        root = root,
+        owner = wallet.hotkey.ss58_address,
+        hotkeys = metagraph.hotkeys,
+    )
+    scores = torch.from_numpy( scores )
     bt.logging.info(f"Weights: {scores}")
 
-    # Generate allocations for the validator.
-    next_allocations = []
-    verified_allocations = []
-    for hotkey in tqdm( metagraph.hotkeys ):
-        db_path = os.path.expanduser(f"{config.db_root_path}/{config.wallet.name}/{config.wallet.hotkey}/DB-{hotkey}-{wallet.hotkey.ss58_address}")
-        next_allocations.append({
-            'path': db_path,
-            'n_chunks': 100,
-            'seed': f"{hotkey}{wallet.hotkey.ss58_address}",
-            'miner': hotkey,
-            'validator': wallet.hotkey.ss58_address,
-            'hash': True,
-        })
-        verified_allocations.append( {
-            'path': db_path,
-            'n_chunks': 0,
-            'seed': f"{hotkey}{wallet.hotkey.ss58_address}",
-            'miner': hotkey,
-            'validator': wallet.hotkey.ss58_address,
-            'hash': True,
-        })
-    
-    # Generate the hash allocations.
-    allocate.generate( 
+    # Challenges go where the capacity of the miners is least certain, see challenges.ChallengeScheduler.
+    scheduler = challenges.ChallengeScheduler(
+        allocations = next_allocations,
+        budget = config.challenge_budget,
+        tolerance = config.challenge_tolerance,
+        decay = config.challenge_decay,
+    )
+
+    # Generate the hash allocations which changed since the manifest was written. The hash tables are extended and
+    # truncated in-process, the tip of every miner's chain kept in memory between rounds.
+    manifest = os.path.join( root, allocate.MANIFEST_NAME )
+    chains = storage.chains.HashChains( size = allocate.CHUNK_SIZE, workers = config.chain_workers )
+    allocate.reallocate( 
         allocations = next_allocations,  # The allocations to generate.
+        manifest = manifest,  # The manifest of the previous allocation pass.
         no_prompt = True,  # If True, no prompt will be shown
         workers = 10,  # The number of concurrent workers to use for generation. Default is 10.
-        restart = False # Dont restart the generation from empty files.
+        restart = False, # Dont restart the generation from empty files.
+        chains = chains,  # Resize the hash tables in-process.
     )
 
+    # Load the generated hashes into memory so challenges do not touch the databases.
+    hash_index = storage.hash_index.HashIndex()
+    for alloc in next_allocations:
+        hash_index.update( alloc )
+    bt.logging.info(f"Loaded hash index: {allocate.human_readable_size( hash_index.nbytes() )}")
+
     # Step 7: The Main Validation Loop
     bt.logging.info("Starting validator loop.")
-    step = 0
+    loop = asyncio.get_event_loop()
     while True:
         try:
-            # Iterate over all miners on the network and validate them.
-            previous_allocations = copy.deepcopy( next_allocations )
-            for i, alloc in tqdm( enumerate( next_allocations ) ):
-                # Dont self validate.
-                if alloc['miner'] == wallet.hotkey.ss58_address: continue
-                print(f"Validating miner: {alloc}")
-
-                # Select a random chunk to validate.
-                chunk_i = str( random.randint( 1, alloc['n_chunks'] ) )
-                bt.logging.debug(f"Validating chunk: {chunk_i}")
-
-                # Get the hash of the data to validate from the database.
-                db = sqlite3.connect(alloc['path'])
-                try:
-                    validation_hash = db.cursor().execute(f"SELECT hash FROM DB{alloc['seed']} WHERE id=?", (chunk_i,)).fetchone()[0]
-                except:
-                    bt.logging.error(f"Failed to get validation hash for chunk: {chunk_i} from db: {alloc['path']}")
-                    continue
-                bt.logging.debug(f"Validation hash: {validation_hash}")
-                db.close()
-
-                # Query the miner for the data.
-                miner_data = dendrite.query( metagraph.axons[i], storage.protocol.Retrieve( key = chunk_i ), deserialize = True )
-
-                if miner_data == None:
-                    # The miner could not respond with the data.
-                    # We reduce the estimated allocation for the miner.
-                    next_allocations[i]['n_chunks'] = max( int( next_allocations[i]['n_chunks'] * 0.9 ), 25 )
-                    verified_allocations[i]['n_chunks'] = min( next_allocations[i]['n_chunks'], verified_allocations[i]['n_chunks'] )
-                    bt.logging.debug(f"Miner did not respond with data, reducing allocation to: {next_allocations[i]['n_chunks']}")
-
-                elif miner_data != None:
-                    # The miner was able to respond with the data, but we need to verify it.
-                    computed_hash = hashlib.sha256( miner_data.encode() ).hexdigest()
-                    bt.logging.debug(f"   Computed hash: {computed_hash}, Validation hash: {validation_hash} ")
-
-                    # Check if the miner has provided the correct response by doubling the dummy input.
-                    if computed_hash == validation_hash:
-                        # The miner has provided the correct response we can increase our known verified allocation.
-                        # We can also increase our estimated allocation for the miner.
-                        verified_allocations[i]['n_chunks'] = next_allocations[i]['n_chunks']
-                        next_allocations[i]['n_chunks'] = int( next_allocations[i]['n_chunks'] * 1.1 )
-                        bt.logging.debug(f"Miner provided correct response, increasing allocation to: {next_allocations[i]['n_chunks']}")
-                    else:
-                        # The miner has provided an incorrect response.
-                        # We need to decrease our estimation..
-                        next_allocations[i]['n_chunks'] = max( int( next_allocations[i]['n_chunks'] * 0.9 ), 25 )
-                        verified_allocations[i]['n_chunks'] = min( next_allocations[i]['n_chunks'], verified_allocations[i]['n_chunks'] )
-                        bt.logging.debug(f"Miner provided incorrect response, reducing allocation to: {next_allocations[i]['n_chunks']}")
-
-            # Reallocate the validator's chunks.
-            bt.logging.debug(f"Prev allocations: {[ a['n_chunks'] for a in previous_allocations ]  }")
-            allocate.generate( 
-                allocations = next_allocations,  # The allocations to generate.
-                no_prompt = True,  # If True, no prompt will be shown
-                restart = False # Dont restart the generation from empty files.
-            )
-            bt.logging.info(f"Allocations: {[ allocate.human_readable_size( a['n_chunks'] * allocate.CHUNK_SIZE ) for a in next_allocations ] }")
+            # Challenge the miners and bring the hash tables in line with the new estimates.
+            validate( loop, dendrite, metagraph.axons, next_allocations, scheduler, hash_index, chains, manifest, config, wallet.hotkey.ss58_address )
+            bt.logging.debug(f"Metagraph: {metagraph_cache.stats()}")
+            bt.logging.info(f"Allocations: {[ allocate.human_readable_size( n_chunks * allocate.CHUNK_SIZE ) for n_chunks in next_allocations.n_chunks.tolist() ] }")
 
             # Periodically update the weights on the Bittensor blockchain.
             if (step + 1) % 1000 == 0:
@@ -231,8 +454,18 @@ def main( config ):
 
             # End the current step and prepare for the next iteration.
             step += 1
-            # Resync our local state with the latest state from the blockchain.
-            metagraph = subtensor.metagraph(config.netuid)
+            if config.checkpoint_steps > 0 and step % config.checkpoint_steps == 0:
+                state.save( state_path, next_allocations, scores.numpy(), step )
+            # Pick up the latest metagraph synced in the background.
+            for changes in metagraph_cache.changes():
+                bt.logging.debug(f"Metagraph changes: {changes.to_dict()}")
+            metagraph = metagraph_cache.metagraph
+            if list( metagraph.hotkeys ) != next_allocations.peers:
+                # Uids were registered or their hotkeys replaced: their state starts over, the hashes follow on the next reallocation.
+                next_allocations, reconciled_scores, reset = state.reconcile( next_allocations, scores.numpy(), metagraph.hotkeys )
+                scores = torch.from_numpy( reconciled_scores )
+                scheduler.sync( next_allocations )
+                bt.logging.info(f"Metagraph changed, reset the state of {reset} miners")
             # Wait a block step.
             time.sleep(1)
 
@@ -243,6 +476,8 @@ def main( config ):
 
         # If the user interrupts the program, gracefully exit.
         except KeyboardInterrupt:
+            state.save( state_path, next_allocations, scores.numpy(), step )
+            metagraph_cache.stop()
             bt.logging.success("Keyboard interrupt detected. Exiting validator.")
             exit()
 
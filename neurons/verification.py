@@ -0,0 +1,188 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import time
+import random
+import typing
+import hashlib
+import threading
+import bittensor as bt
+import chunkstore
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of chunks read per query.
+BATCH_SIZE = 64
+# Number of chunk ids verified per task, so large allocations are split across workers.
+RANGE_SIZE = 1024
+# Number of mismatched ids listed per allocation in the report, the rest are only counted.
+MAX_REPORTED = 100
+
+class Report:
+    """
+    Verification result of a single allocation: the chunks checked, and the ids whose data did not match the
+    recorded hash or which were missing from the data or the hash store.
+    """
+
+    def __init__( self, data_alloc: dict, hash_alloc: typing.Optional[ dict ] ):
+        self.path = data_alloc['path']
+        self.hash_path = hash_alloc['path'] if hash_alloc is not None else None
+        self.checked = 0
+        self.mismatches = 0
+        self.missing = 0
+        self.mismatched: typing.List[ int ] = []
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def ok( self ) -> bool:
+        return self.hash_path is not None and self.mismatches == 0 and self.missing == 0
+
+    def add( self, checked: int, mismatched: typing.List[ int ], missing: int, seconds: float ):
+        with self.lock:
+            self.checked += checked
+            self.mismatches += len( mismatched )
+            self.missing += missing
+            self.mismatched = sorted( self.mismatched + mismatched )[ :MAX_REPORTED ]
+            self.seconds += seconds
+
+    def to_dict( self ) -> dict:
+        return {
+            'path': self.path,
+            'hash_path': self.hash_path,
+            'ok': self.ok,
+            'checked': self.checked,
+            'mismatches': self.mismatches,
+            'missing': self.missing,
+            'mismatched': self.mismatched,
+            'seconds': self.seconds,
+        }
+
+def check( data_store: chunkstore.ChunkStore, hash_store: chunkstore.ChunkStore, ids: typing.Optional[ typing.List[ int ] ], start: int, stop: int ) -> typing.Tuple[ int, typing.List[ int ], int ]:
+    """
+    Verify a range of chunk ids, or the given sampled ids, against the hash store.
+
+    Returns:
+    - int: The number of chunks checked.
+    - list: The ids whose data did not match the recorded hash.
+    - int: The number of ids missing from the data or the hash store.
+    """
+    checked, mismatched, missing = 0, [], 0
+    batches = [ ids[ i: i + BATCH_SIZE ] for i in range( 0, len( ids ), BATCH_SIZE ) ] if ids is not None else range( start, stop, BATCH_SIZE )
+    for batch in batches:
+        if ids is None:
+            expected_ids = range( batch, min( batch + BATCH_SIZE, stop ) )
+            rows = data_store.scan( batch, len( expected_ids ) )
+        else:
+            expected_ids = batch
+            rows = data_store.rows( batch )
+        # Expected hashes come with the data when the store holds both, otherwise from the hash store's rows of the same ids.
+        if hash_store is data_store:
+            expected = { id: hash for id, _, hash in rows }
+        elif ids is None:
+            expected = { id: hash for id, _, hash in hash_store.scan( batch, len( expected_ids ) ) }
+        else:
+            expected = { id: hash for id, _, hash in hash_store.rows( batch ) }
+        missing += len( expected_ids ) - len( rows )
+        for id, data, _ in rows:
+            stored_hash = expected.get( id )
+            if stored_hash is None:
+                missing += 1
+                continue
+            # hashlib releases the GIL while hashing large buffers, so workers hash in parallel.
+            if hashlib.sha256( data ).hexdigest() != stored_hash:
+                mismatched.append( id )
+            checked += 1
+    return checked, mismatched, missing
+
+def verify(
+        data_allocations: typing.List[ dict ],
+        hash_allocations: typing.List[ dict ],
+        workers: typing.Optional[ int ] = None,
+        sample: int = 0,
+    ) -> typing.List[ Report ]:
+    """
+    Verify the data of many allocations against their recorded hashes concurrently.
+
+    Each data allocation is paired with the hash allocation of the same seed. Allocations are split into ranges of
+    RANGE_SIZE ids which a pool of threads reads in ordered batches of BATCH_SIZE and hashes. Threads rather than
+    processes do the hashing: SQLite reads and sha256 over large buffers both release the GIL, and the chunks do
+    not have to be copied between processes.
+
+    Args:
+    - data_allocations (list): Allocations whose chunk stores hold the data.
+    - hash_allocations (list): Allocations whose chunk stores hold the expected hashes.
+    - workers (int): The number of threads, defaults to the number of CPUs.
+    - sample (int): If above 0, verify this many random ids per allocation instead of every id.
+
+    Returns:
+    - list: A Report per data allocation.
+    """
+    workers = workers or os.cpu_count() or 1
+    hash_by_seed = { alloc['seed']: alloc for alloc in hash_allocations }
+    stores: typing.Dict[ str, chunkstore.ChunkStore ] = {}
+    reports = []
+    tasks = []
+    try:
+        for data_alloc in data_allocations:
+            hash_alloc = hash_by_seed.get( data_alloc['seed'] )
+            report = Report( data_alloc, hash_alloc )
+            reports.append( report )
+            if hash_alloc is None:
+                bt.logging.error(f"No hash allocation for {data_alloc['path']}")
+                continue
+            for alloc in [ data_alloc, hash_alloc ]:
+                if alloc['path'] not in stores:
+                    stores[ alloc['path'] ] = chunkstore.open_store( alloc, alloc.get( 'store', chunkstore.SQLITE ) )
+            data_store, hash_store = stores[ data_alloc['path'] ], stores[ hash_alloc['path'] ]
+            count = data_store.count()
+            if 'n_chunks' in data_alloc:
+                # Chunks which were never generated count as missing.
+                report.missing += max( 0, data_alloc['n_chunks'] - count )
+                count = min( count, data_alloc['n_chunks'] )
+            if sample > 0:
+                ids = sorted( random.sample( range( count ), min( sample, count ) ) )
+                for i in range( 0, len( ids ), RANGE_SIZE ):
+                    tasks.append( ( report, data_store, hash_store, ids[ i: i + RANGE_SIZE ], 0, 0 ) )
+            else:
+                for start in range( 0, count, RANGE_SIZE ):
+                    tasks.append( ( report, data_store, hash_store, None, start, min( start + RANGE_SIZE, count ) ) )
+
+        def run( report, data_store, hash_store, ids, start, stop ):
+            began = time.time()
+            checked, mismatched, missing = check( data_store, hash_store, ids, start, stop )
+            report.add( checked, mismatched, missing, time.time() - began )
+
+        began = time.time()
+        with ThreadPoolExecutor( max_workers = workers ) as executor:
+            for future in [ executor.submit( run, *task ) for task in tasks ]:
+                future.result()
+        elapsed = time.time() - began
+    finally:
+        for store in stores.values():
+            store.close()
+
+    for report in reports:
+        if report.ok:
+            bt.logging.success(f"Verified {report.checked} chunks of {report.path} with hashes from {report.hash_path}")
+        else:
+            bt.logging.error(f"Verification failed for {report.path}: {report.to_dict()}")
+    checked = sum( report.checked for report in reports )
+    bt.logging.info(f"Verified {checked} chunks of {len( reports )} allocations in {elapsed:.2f}s, {sum( not report.ok for report in reports )} failed")
+    return reports
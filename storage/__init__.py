@@ -25,3 +25,11 @@ __spec_version__ = (1000 * int(version_split[0])) + (10 * int(version_split[1]))
 
 # Import all submodules.
 from . import protocol
+from . import stream
+from . import erasure
+from . import merkle
+from . import connections
+from . import hash_index
+from . import generator
+from . import metagraph
+from . import chains
@@ -0,0 +1,171 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import time
+import typing
+import threading
+import bittensor as bt
+from concurrent.futures import ThreadPoolExecutor
+from . import merkle
+from . import generator
+from . import connections
+
+class HashChains:
+    """
+    Long lived, in-process replacement for running the generate_db binary once per allocation: extends and truncates
+    many hash tables, the rows generate_db writes with empty data, without launching a process per table.
+
+    The tip of every chain, its number of chunks and the rng_state of its last chunk, is kept in memory after it was
+    first read, so extending a table resumes the chain without touching the database and a round costs the chunks
+    generated rather than the number of tables. Chains are extended on a pool of threads, the chunk generation is
+    numpy bound, and the rows of each database file are written in a single transaction.
+
+    The service must be the only writer of its tables, a table changed behind its back is picked up only after drop.
+
+    Args:
+    - size (int): The chunk size in characters.
+    - workers (int): The number of threads extending chains, defaults to the number of CPUs.
+    """
+
+    def __init__( self, size: int, workers: typing.Optional[ int ] = None ):
+        self.size = size
+        self.executor = ThreadPoolExecutor( max_workers = workers or os.cpu_count() or 1, thread_name_prefix = 'chains' )
+        # Maps (path, seed) to the number of chunks of the table and the rng_state of its last chunk.
+        self.tips: typing.Dict[ typing.Tuple[ str, str ], typing.Tuple[ int, typing.Optional[ bytes ] ] ] = {}
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.truncated = 0
+        self.transactions = 0
+        self.seconds = 0.0
+
+    @staticmethod
+    def _key( alloc: dict ) -> typing.Tuple[ str, str ]:
+        return ( alloc['path'], alloc['seed'] )
+
+    def tip( self, alloc: dict ) -> typing.Tuple[ int, typing.Optional[ bytes ] ]:
+        """
+        Return the number of chunks of an allocation's table and the rng_state of its last chunk, reading them once.
+        """
+        key = self._key( alloc )
+        with self.lock:
+            tip = self.tips.get( key )
+        if tip is not None:
+            return tip
+        table = generator.table_name( alloc['seed'] )
+        with connections.writer( alloc['path'] ) as db:
+            generator.create_table( db, table )
+            row = db.execute( f"SELECT id, rng_state FROM {table} ORDER BY id DESC LIMIT 1" ).fetchone()
+        tip = ( row[0] + 1, bytes( row[1] ) ) if row else ( 0, None )
+        with self.lock:
+            self.tips[ key ] = tip
+        return tip
+
+    def extend( self, alloc: dict ) -> typing.List[ tuple ]:
+        """
+        Generate the rows an allocation's table is missing, from the tip of its chain.
+        """
+        start, rng_state = self.tip( alloc )
+        rows = []
+        for i, data, digest, state in generator.generate( alloc['seed'], alloc['n_chunks'], self.size, start = start, rng_state = rng_state ):
+            rows.append( ( i, '' if alloc.get( 'hash' ) else data.decode(), digest.hex(), state, merkle.root( data ).hex() ) )
+        return rows
+
+    def resize( self, allocations: typing.List[ dict ] ) -> typing.List[ dict ]:
+        """
+        Extend or truncate the tables of the allocations to their n_chunks.
+
+        Args:
+        - allocations (list): The allocations, SQLite stores only.
+
+        Returns:
+        - list: The allocations whose tables now hold n_chunks chunks.
+        """
+        began = time.time()
+        tips = { self._key( alloc ): self.tip( alloc ) for alloc in allocations }
+        grown = [ alloc for alloc in allocations if tips[ self._key( alloc ) ][0] < alloc['n_chunks'] ]
+        shrunk = [ alloc for alloc in allocations if tips[ self._key( alloc ) ][0] > alloc['n_chunks'] ]
+
+        # Chains are sequential, so each is extended by one thread, the tables in parallel.
+        futures = [ ( alloc, self.executor.submit( self.extend, alloc ) ) for alloc in grown ]
+        by_path: typing.Dict[ str, typing.List[ typing.Tuple[ dict, typing.List[ tuple ] ] ] ] = {}
+        for alloc in shrunk:
+            by_path.setdefault( alloc['path'], [] ).append( ( alloc, None ) )
+        for alloc, future in futures:
+            try:
+                by_path.setdefault( alloc['path'], [] ).append( ( alloc, future.result() ) )
+            except Exception as e:
+                # The allocation is left as it was and picked up again by the next resize.
+                bt.logging.error(f"Failed to extend hash chain {alloc['path']}: {e}")
+
+        done = [ alloc for alloc in allocations if tips[ self._key( alloc ) ][0] == alloc['n_chunks'] ]
+        for path, changes in by_path.items():
+            # All tables of a database file change in one transaction.
+            tips_after = {}
+            try:
+                with connections.writer( path ) as db:
+                    for alloc, rows in changes:
+                        table = generator.table_name( alloc['seed'] )
+                        if rows is None:
+                            db.execute( f"DELETE FROM {table} WHERE id >= ?", ( alloc['n_chunks'], ) )
+                            row = db.execute( f"SELECT rng_state FROM {table} WHERE id = ?", ( alloc['n_chunks'] - 1, ) ).fetchone()
+                            tips_after[ self._key( alloc ) ] = ( alloc['n_chunks'], bytes( row[0] ) if row else None )
+                        else:
+                            db.executemany( f"INSERT INTO {table} ( id, data, hash, rng_state, merkle_root ) VALUES ( ?, ?, ?, ?, ? )", rows )
+                            tips_after[ self._key( alloc ) ] = ( alloc['n_chunks'], rows[-1][3] if rows else tips[ self._key( alloc ) ][1] )
+            except Exception as e:
+                # The transaction was rolled back, the tips still match the tables.
+                bt.logging.error(f"Failed to resize hash tables in {path}: {e}")
+                continue
+            with self.lock:
+                self.tips.update( tips_after )
+                self.transactions += 1
+                self.generated += sum( len( rows ) for _, rows in changes if rows is not None )
+                self.truncated += sum( tips[ self._key( alloc ) ][0] - alloc['n_chunks'] for alloc, rows in changes if rows is None )
+            done.extend( alloc for alloc, _ in changes )
+
+        with self.lock:
+            self.seconds += time.time() - began
+        bt.logging.debug(f"Resized {len( grown )} hash chains up and {len( shrunk )} down in {time.time() - began:.2f}s")
+        return done
+
+    def drop( self, alloc: dict ):
+        """
+        Forget the tip of an allocation, i.e. when its database is deleted. The pooled connections of the file are
+        closed too, they would otherwise keep reading and writing the deleted file.
+        """
+        with self.lock:
+            self.tips.pop( self._key( alloc ), None )
+        connections.manager.close( alloc['path'] )
+
+    def close( self ):
+        self.executor.shutdown( wait = True )
+
+    def stats( self ) -> dict:
+        """
+        Return the number of chains known, chunks generated and truncated, transactions and seconds spent resizing.
+        """
+        with self.lock:
+            return {
+                'chains': len( self.tips ),
+                'generated': self.generated,
+                'truncated': self.truncated,
+                'transactions': self.transactions,
+                'seconds': self.seconds,
+            }
@@ -0,0 +1,248 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import typing
+import sqlite3
+import threading
+import contextlib
+import collections
+import bittensor as bt
+
+# Maximum number of reader connections open per database file.
+MAX_READERS = 8
+# Maximum number of database files with pooled connections, idle pools past this are closed.
+MAX_POOLS = 256
+# Number of prepared statements cached per connection.
+CACHED_STATEMENTS = 256
+# Seconds SQLite itself waits on a locked database before reporting it busy.
+BUSY_TIMEOUT = 5.0
+# Number of times a statement is retried after SQLite reports the database busy.
+BUSY_RETRIES = 5
+# Seconds slept before the first busy retry, doubled on every further retry.
+BUSY_BACKOFF = 0.05
+
+class Pool:
+    """
+    Connections to a single database file: up to MAX_READERS read-only readers and one writer.
+    """
+
+    def __init__( self, path: str ):
+        self.path = path
+        self.condition = threading.Condition()
+        self.idle = { True: [], False: [] }
+        self.opened = { True: 0, False: 0 }
+        self.capacity = { True: MAX_READERS, False: 1 }
+        self.in_use = 0
+
+    def open( self, readonly: bool ) -> sqlite3.Connection:
+        if readonly:
+            # Readers never take the write lock, so they do not block behind each other or the writer.
+            connection = sqlite3.connect( f"file:{self.path}?mode=ro", uri = True, timeout = BUSY_TIMEOUT, check_same_thread = False, cached_statements = CACHED_STATEMENTS )
+        else:
+            connection = sqlite3.connect( self.path, timeout = BUSY_TIMEOUT, check_same_thread = False, cached_statements = CACHED_STATEMENTS )
+            # WAL lets readers proceed while the writer commits, the mode is kept in the file.
+            connection.execute( "PRAGMA journal_mode=WAL" )
+            connection.execute( "PRAGMA synchronous=NORMAL" )
+        return connection
+
+    def close( self ):
+        # Close the idle connections, connections in use are returned to the pool as usual.
+        with self.condition:
+            for readonly, connections in self.idle.items():
+                for connection in connections:
+                    connection.close()
+                self.opened[ readonly ] -= len( connections )
+                connections.clear()
+
+class ConnectionManager:
+    """
+    Pools SQLite connections per database file, so handlers reuse open connections and their
+    prepared statements instead of connecting for every query.
+
+    Reader handles are opened read-only, writers in WAL mode, and a single writer per file is
+    handed out at a time so in-process writers queue here instead of spinning on SQLite's lock.
+    The time spent waiting for a connection and the number of busy retries are counted.
+    """
+
+    def __init__( self, max_readers: int = MAX_READERS, max_pools: int = MAX_POOLS ):
+        self.max_readers = max_readers
+        self.max_pools = max_pools
+        self.lock = threading.Lock()
+        self.pools: typing.OrderedDict[ str, Pool ] = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.wait_time = 0.0
+
+    def pool( self, path: str ) -> Pool:
+        # Return the pool of a database file, counted as in use so it cannot be evicted before it is released.
+        with self.lock:
+            pool = self.pools.get( path )
+            created = pool is None
+            if created:
+                pool = self.pools[ path ] = Pool( path )
+                pool.capacity[ True ] = self.max_readers
+            self.pools.move_to_end( path )
+            pool.in_use += 1
+            # Evict only once the new pool is counted as in use, it would otherwise be the first idle one closed.
+            if created:
+                self.evict()
+            return pool
+
+    def evict( self ):
+        # Close the least recently used pools with no connection handed out. Must hold the lock.
+        for path in list( self.pools ):
+            if len( self.pools ) <= self.max_pools: break
+            pool = self.pools[ path ]
+            if pool.in_use == 0:
+                pool.close()
+                del self.pools[ path ]
+                self.counters[ 'evicted' ] += 1
+
+    @contextlib.contextmanager
+    def connect( self, path: str, readonly: bool = True ) -> typing.Iterator[ sqlite3.Connection ]:
+        """
+        Borrow a connection to a database file, waiting while all of its connections are in use.
+        Writer connections are committed when the block exits and rolled back if it raises.
+
+        Args:
+        - path (str): The database file.
+        - readonly (bool): Borrow a read-only reader instead of the writer.
+        """
+        pool = self.pool( path )
+        start = time.time()
+        with pool.condition:
+            while not pool.idle[ readonly ] and pool.opened[ readonly ] >= pool.capacity[ readonly ]:
+                pool.condition.wait()
+            connection = pool.idle[ readonly ].pop() if pool.idle[ readonly ] else None
+            if connection is None:
+                pool.opened[ readonly ] += 1
+        waited = time.time() - start
+        with self.lock:
+            self.wait_time += waited
+            self.counters[ 'acquired' ] += 1
+
+        try:
+            if connection is None:
+                try:
+                    connection = pool.open( readonly )
+                except sqlite3.Error:
+                    with pool.condition:
+                        pool.opened[ readonly ] -= 1
+                    raise
+                with self.lock:
+                    self.counters[ 'opened' ] += 1
+            yield connection
+            if not readonly:
+                connection.commit()
+        except BaseException:
+            if connection is not None and connection.in_transaction:
+                connection.rollback()
+            raise
+        finally:
+            with self.lock:
+                pool.in_use -= 1
+            with pool.condition:
+                if connection is not None:
+                    pool.idle[ readonly ].append( connection )
+                pool.condition.notify()
+
+    def reader( self, path: str ) -> typing.ContextManager[ sqlite3.Connection ]:
+        """
+        Borrow a read-only connection to a database file.
+        """
+        return self.connect( path, readonly = True )
+
+    def writer( self, path: str ) -> typing.ContextManager[ sqlite3.Connection ]:
+        """
+        Borrow the writer connection of a database file, committed when the block exits.
+        """
+        return self.connect( path, readonly = False )
+
+    def execute( self, connection: sqlite3.Connection, sql: str, params: typing.Sequence = () ) -> sqlite3.Cursor:
+        """
+        Execute a statement, retrying with backoff while SQLite reports the database busy.
+        """
+        for attempt in range( BUSY_RETRIES + 1 ):
+            try:
+                return connection.execute( sql, params )
+            except sqlite3.OperationalError as e:
+                message = str( e )
+                if attempt == BUSY_RETRIES or ( 'locked' not in message and 'busy' not in message ):
+                    raise
+                with self.lock:
+                    self.counters[ 'busy_retries' ] += 1
+                bt.logging.debug(f"Database busy, retrying statement: {message}")
+                time.sleep( BUSY_BACKOFF * ( 2 ** attempt ) )
+
+    def close( self, path: typing.Optional[ str ] = None ):
+        """
+        Close the idle connections of a database file, or of every file when path is None.
+        """
+        with self.lock:
+            paths = list( self.pools ) if path is None else [ path ]
+            for path in paths:
+                pool = self.pools.get( path )
+                if pool is not None:
+                    pool.close()
+                    if pool.in_use == 0:
+                        del self.pools[ path ]
+
+    def stats( self ) -> dict:
+        """
+        Return the connection counters: connections acquired and opened, pools evicted, busy retries
+        and the total and mean seconds spent waiting for a connection.
+        """
+        with self.lock:
+            acquired = self.counters[ 'acquired' ]
+            return {
+                'pools': len( self.pools ),
+                'acquired': acquired,
+                'opened': self.counters[ 'opened' ],
+                'evicted': self.counters[ 'evicted' ],
+                'busy_retries': self.counters[ 'busy_retries' ],
+                'wait_time': self.wait_time,
+                'mean_wait_time': self.wait_time / acquired if acquired else 0.0,
+            }
+
+# Connection manager shared by everything in the process.
+manager = ConnectionManager()
+
+def reader( path: str ) -> typing.ContextManager[ sqlite3.Connection ]:
+    """
+    Borrow a read-only connection to a database file from the shared manager.
+    """
+    return manager.reader( path )
+
+def writer( path: str ) -> typing.ContextManager[ sqlite3.Connection ]:
+    """
+    Borrow the writer connection of a database file from the shared manager.
+    """
+    return manager.writer( path )
+
+def execute( connection: sqlite3.Connection, sql: str, params: typing.Sequence = () ) -> sqlite3.Cursor:
+    """
+    Execute a statement with busy retries counted by the shared manager.
+    """
+    return manager.execute( connection, sql, params )
+
+def stats() -> dict:
+    """
+    Return the counters of the shared manager.
+    """
+    return manager.stats()
@@ -0,0 +1,137 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import typing
+import numpy as np
+
+# Reed-Solomon erasure coding over GF(256) with the primitive polynomial x^8 + x^4 + x^3 + x^2 + 1.
+# Encoding is systematic: the first k shards are the data split into k pieces and the m parity
+# shards are a Cauchy matrix times the data shards, so any k of the k + m shards recover the data.
+PRIMITIVE_POLYNOMIAL = 0x11d
+
+def _build_tables() -> typing.Tuple[ np.ndarray, np.ndarray, np.ndarray ]:
+    exp = np.zeros( 512, dtype = np.uint8 )
+    log = np.zeros( 256, dtype = np.int32 )
+    x = 1
+    for i in range( 255 ):
+        exp[ i ] = x
+        log[ x ] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= PRIMITIVE_POLYNOMIAL
+    exp[ 255: 510 ] = exp[ :255 ]
+    # Full multiplication table, MUL[a, b] = a * b, so products of whole shards are a single gather.
+    mul = exp[ ( log[ :, None ] + log[ None, : ] ) % 255 ]
+    mul[ 0, : ] = 0
+    mul[ :, 0 ] = 0
+    return exp, log, mul
+
+EXP, LOG, MUL = _build_tables()
+
+def inverse( a: int ) -> int:
+    if a == 0:
+        raise ZeroDivisionError( "0 has no inverse in GF(256)" )
+    return int( EXP[ 255 - LOG[ a ] ] )
+
+def matmul( matrix: np.ndarray, shards: np.ndarray ) -> np.ndarray:
+    """
+    Multiply an r x k matrix by k shards of length L, i.e. a k x L array, over GF(256).
+    """
+    result = np.zeros( ( matrix.shape[0], shards.shape[1] ), dtype = np.uint8 )
+    for j in range( matrix.shape[1] ):
+        result ^= MUL[ matrix[ :, j ][ :, None ], shards[ j ][ None, : ] ]
+    return result
+
+def invert( matrix: np.ndarray ) -> np.ndarray:
+    """
+    Invert a square matrix over GF(256) with Gauss-Jordan elimination.
+    """
+    n = matrix.shape[0]
+    augmented = np.concatenate( [ matrix.astype( np.uint8 ), np.eye( n, dtype = np.uint8 ) ], axis = 1 )
+    for column in range( n ):
+        pivots = np.nonzero( augmented[ column:, column ] )[0]
+        if len( pivots ) == 0:
+            raise ValueError( "Matrix is singular" )
+        pivot = column + pivots[0]
+        augmented[ [ column, pivot ] ] = augmented[ [ pivot, column ] ]
+        augmented[ column ] = MUL[ inverse( int( augmented[ column, column ] ) ), augmented[ column ] ]
+        factors = augmented[ :, column ].copy()
+        factors[ column ] = 0
+        augmented ^= MUL[ factors[ :, None ], augmented[ column ][ None, : ] ]
+    return augmented[ :, n: ]
+
+def encoding_matrix( k: int, m: int ) -> np.ndarray:
+    """
+    The (k + m) x k encoding matrix: the identity on top of an m x k Cauchy matrix.
+    """
+    if k < 1 or m < 0 or k + m > 256:
+        raise ValueError( f"Unsupported number of shards: k = {k}, m = {m}" )
+    x = np.arange( k, k + m, dtype = np.int32 )
+    y = np.arange( k, dtype = np.int32 )
+    cauchy = EXP[ ( 255 - LOG[ x[ :, None ] ^ y[ None, : ] ] ) % 255 ]
+    return np.concatenate( [ np.eye( k, dtype = np.uint8 ), cauchy.astype( np.uint8 ) ], axis = 0 )
+
+def shard_size( size: int, k: int ) -> int:
+    return -( -size // k )
+
+def encode( data: bytes, k: int, m: int ) -> typing.List[ bytes ]:
+    """
+    Split data into k data shards, zero padded to equal length, followed by m parity shards.
+
+    Args:
+    - data (bytes): The data to encode.
+    - k (int): The number of data shards.
+    - m (int): The number of parity shards.
+
+    Returns:
+    - List[bytes]: The k + m shards.
+    """
+    if k == 1 and m == 0:
+        return [ bytes( data ) ]
+    length = shard_size( len( data ), k )
+    padded = np.zeros( k * length, dtype = np.uint8 )
+    padded[ :len( data ) ] = np.frombuffer( data, dtype = np.uint8 )
+    shards = padded.reshape( k, length )
+    parity = matmul( encoding_matrix( k, m )[ k: ], shards )
+    return [ row.tobytes() for row in shards ] + [ row.tobytes() for row in parity ]
+
+def decode( shards: typing.Dict[ int, bytes ], k: int, m: int, size: typing.Optional[ int ] = None ) -> bytes:
+    """
+    Recover the data from any k shards.
+
+    Args:
+    - shards (Dict[int, bytes]): Maps shard index to shard data, at least k entries.
+    - k (int): The number of data shards.
+    - m (int): The number of parity shards.
+    - size (int): The length of the original data, None keeps the padding.
+
+    Returns:
+    - bytes: The original data.
+    """
+    if len( shards ) < k:
+        raise ValueError( f"Need {k} shards to decode, got {len( shards )}" )
+    if all( index in shards for index in range( k ) ):
+        # All data shards are present, no arithmetic is needed.
+        data = b''.join( shards[ index ] for index in range( k ) )
+    else:
+        indices = sorted( shards )[ :k ]
+        matrix = encoding_matrix( k, m )[ indices ]
+        available = np.stack( [ np.frombuffer( shards[ index ], dtype = np.uint8 ) for index in indices ] )
+        data = matmul( invert( matrix ), available ).tobytes()
+    return data if size is None else data[ :size ]
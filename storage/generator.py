@@ -0,0 +1,268 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# In-process port of the generate_db chunk derivation, meant to produce the bytes and hashes of the Rust binary. It is
+# checked against tests/fixtures/generate_db.json, which is provisional until dumped from a built binary:
+# - The seed string is hashed with sha256 into the 32 byte seed of the first chunk.
+# - Each chunk is drawn from a fresh rand 0.8 StdRng, i.e. ChaCha12 keyed with the chunk's seed, one gen_range( 0..60 ) per character.
+# - The seed of the next chunk is the chunk's seed xor the sha256 of its data, this is the rng_state stored with the chunk.
+
+import typing
+import hashlib
+import argparse
+import numpy as np
+from . import merkle
+from . import connections
+
+# The generator's alphabet: 'a'..='z', 'A'..'Z' and '0'..'9'. The last two ranges are half open, so 'Z' and '9' never appear.
+ALPHABET = np.frombuffer( b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXY012345678', dtype = np.uint8 )
+
+# ChaCha constants, "expand 32-byte k".
+CONSTANTS = np.array( [ 0x61707865, 0x3320646e, 0x79622d32, 0x6b206574 ], dtype = np.uint32 )
+# StdRng is ChaCha with 12 rounds.
+ROUNDS = 12
+# 32 bit words per ChaCha block.
+BLOCK_WORDS = 16
+
+# rand's gen_range over usize multiplies a 64 bit draw by the range and rejects draws whose low 64 bits fall past the zone,
+# the zone being the range shifted to the top bit, minus one.
+RANGE = len( ALPHABET )
+ZONE = ( ( RANGE << ( 64 - RANGE.bit_length() ) ) - 1 ) & 0xFFFFFFFFFFFFFFFF
+# Expected fraction of draws accepted, used to size the keystream generated per chunk.
+ACCEPT_RATE = ( ZONE + 1 ) / 2**64
+# Number of chunks written per transaction by generate_table.
+COMMIT_CHUNKS = 16
+
+def hash_data( data: typing.Union[ str, bytes ] ) -> bytes:
+    """
+    sha256 of a chunk or seed string, as the generator computes it.
+    """
+    if isinstance( data, str ):
+        data = data.encode()
+    return hashlib.sha256( data ).digest()
+
+def combine_seeds( seed: bytes, digest: bytes ) -> bytes:
+    """
+    Derive the seed of the next chunk from the seed and data hash of the current one.
+    """
+    return bytes( a ^ b for a, b in zip( seed, digest ) )
+
+def _rotate( x: np.ndarray, n: int ) -> np.ndarray:
+    return ( x << np.uint32( n ) ) | ( x >> np.uint32( 32 - n ) )
+
+def _quarter_round( x: np.ndarray, a: int, b: int, c: int, d: int ):
+    x[a] += x[b]; x[d] ^= x[a]; x[d] = _rotate( x[d], 16 )
+    x[c] += x[d]; x[b] ^= x[c]; x[b] = _rotate( x[b], 12 )
+    x[a] += x[b]; x[d] ^= x[a]; x[d] = _rotate( x[d], 8 )
+    x[c] += x[d]; x[b] ^= x[c]; x[b] = _rotate( x[b], 7 )
+
+def chacha_blocks( key: bytes, start: int, count: int, rounds: int = ROUNDS ) -> np.ndarray:
+    """
+    Compute count consecutive ChaCha blocks with a 64 bit block counter starting at start and a zero stream id,
+    the layout rand_chacha uses. All blocks are computed at once, one array operation per step of the rounds.
+
+    Args:
+    - key (bytes): The 32 byte key, i.e. the rng seed.
+    - start (int): The counter of the first block.
+    - count (int): The number of blocks.
+    - rounds (int): The number of rounds.
+
+    Returns:
+    - np.ndarray: The keystream as count * 16 little endian 32 bit words.
+    """
+    counters = np.arange( start, start + count, dtype = np.uint64 )
+    state = np.empty( ( BLOCK_WORDS, count ), dtype = np.uint32 )
+    state[ 0:4 ] = CONSTANTS[ :, None ]
+    state[ 4:12 ] = np.frombuffer( key, dtype = '<u4' )[ :, None ]
+    state[ 12 ] = ( counters & np.uint64( 0xFFFFFFFF ) ).astype( np.uint32 )
+    state[ 13 ] = ( counters >> np.uint64( 32 ) ).astype( np.uint32 )
+    state[ 14:16 ] = 0
+    x = state.copy()
+    for _ in range( rounds // 2 ):
+        # Column round.
+        _quarter_round( x, 0, 4, 8, 12 )
+        _quarter_round( x, 1, 5, 9, 13 )
+        _quarter_round( x, 2, 6, 10, 14 )
+        _quarter_round( x, 3, 7, 11, 15 )
+        # Diagonal round.
+        _quarter_round( x, 0, 5, 10, 15 )
+        _quarter_round( x, 1, 6, 11, 12 )
+        _quarter_round( x, 2, 7, 8, 13 )
+        _quarter_round( x, 3, 4, 9, 14 )
+    x += state
+    return np.ascontiguousarray( x.T ).reshape( -1 )
+
+def keystream_u64( key: bytes, start: int, count: int ) -> np.ndarray:
+    """
+    The 64 bit draws of a StdRng seeded with key, taken from count blocks starting at block start.
+    Each draw is two consecutive words, low word first.
+    """
+    return chacha_blocks( key, start, count ).view( np.uint64 )
+
+def sample_indices( draws: np.ndarray ) -> typing.Tuple[ np.ndarray, np.ndarray ]:
+    """
+    Apply gen_range( 0..RANGE ) to 64 bit draws: the index is the high 64 bits of draw * RANGE, and the draw is
+    rejected if the low 64 bits are above ZONE.
+
+    Returns:
+    - np.ndarray: The index of every draw.
+    - np.ndarray: Whether each draw was accepted.
+    """
+    # Multiply in 32 bit halves so the 128 bit product never overflows a 64 bit lane.
+    low = ( draws & np.uint64( 0xFFFFFFFF ) ) * np.uint64( RANGE )
+    high = ( draws >> np.uint64( 32 ) ) * np.uint64( RANGE ) + ( low >> np.uint64( 32 ) )
+    product_low = ( high << np.uint64( 32 ) ) | ( low & np.uint64( 0xFFFFFFFF ) )
+    return high >> np.uint64( 32 ), product_low <= np.uint64( ZONE )
+
+def generate_chunk( seed: bytes, size: int ) -> bytes:
+    """
+    Generate the data of a single chunk from its seed.
+
+    Args:
+    - seed (bytes): The 32 byte seed, the rng_state of the previous chunk or the hashed seed string for the first.
+    - size (int): The chunk size in characters.
+
+    Returns:
+    - bytes: The chunk data.
+    """
+    out = np.empty( size, dtype = np.uint8 )
+    filled, block = 0, 0
+    while filled < size:
+        # Generate enough blocks to cover the expected rejections with a little slack, and more if they run out.
+        needed = size - filled
+        blocks = max( 1, int( needed / ACCEPT_RATE * 1.01 + 64 ) // ( BLOCK_WORDS // 2 ) + 1 )
+        indices, accepted = sample_indices( keystream_u64( seed, block, blocks ) )
+        indices = indices[ accepted ][ :needed ]
+        out[ filled: filled + len( indices ) ] = ALPHABET[ indices ]
+        filled += len( indices )
+        block += blocks
+    return out.tobytes()
+
+def generate(
+        seed: typing.Union[ str, bytes ],
+        n_chunks: int,
+        size: int,
+        start: int = 0,
+        rng_state: typing.Optional[ bytes ] = None,
+    ) -> typing.Iterator[ typing.Tuple[ int, bytes, bytes, bytes ] ]:
+    """
+    Generate the chunks of an allocation.
+
+    Args:
+    - seed (Union[str, bytes]): The allocation's seed string, or the already hashed 32 byte seed.
+    - n_chunks (int): Generate chunk ids up to n_chunks, exclusive.
+    - size (int): The chunk size in characters.
+    - start (int): The first chunk id to generate.
+    - rng_state (bytes): The rng_state stored with chunk start - 1, required to resume from start > 0.
+
+    Yields:
+    - Tuple[int, bytes, bytes, bytes]: The chunk id, its data, the sha256 of the data and the rng_state stored with it.
+    """
+    if start > 0 and rng_state is None:
+        raise ValueError( "rng_state of the previous chunk is required to resume generation" )
+    current = rng_state if start > 0 else ( hash_data( seed ) if isinstance( seed, str ) else seed )
+    for i in range( start, n_chunks ):
+        data = generate_chunk( current, size )
+        digest = hash_data( data )
+        current = combine_seeds( current, digest )
+        yield i, data, digest, current
+
+def chunk( seed: typing.Union[ str, bytes ], key: int, size: int, rng_state: typing.Optional[ bytes ] = None ) -> typing.Tuple[ bytes, bytes, bytes ]:
+    """
+    Regenerate a single chunk. With the rng_state stored with chunk key - 1 this costs one chunk, without it the
+    chain is replayed from the start.
+
+    Returns:
+    - Tuple[bytes, bytes, bytes]: The chunk data, the sha256 of the data and its rng_state.
+    """
+    start = key if rng_state is not None or key == 0 else 0
+    for i, data, digest, state in generate( seed, key + 1, size, start = start, rng_state = rng_state ):
+        if i == key:
+            return data, digest, state
+
+def table_name( seed: str ) -> str:
+    """
+    Return the name of an allocation's table, DB{seed}, rejecting seeds which are not safe to use as one.
+    """
+    if not seed.replace( '_', '' ).isalnum() or not seed.isascii():
+        raise ValueError( "Invalid characters in seed value." )
+    return f"DB{seed}"
+
+def create_table( db, table: str ):
+    # The schema the generate_db binary writes.
+    db.execute( f"CREATE TABLE IF NOT EXISTS {table} ( id INTEGER PRIMARY KEY, data TEXT NOT NULL, hash TEXT NOT NULL, rng_state BLOB NOT NULL, merkle_root TEXT )" )
+
+def generate_table( path: str, seed: str, n_chunks: int, size: int, hash: bool = False, delete: bool = False, progress: bool = False ):
+    """
+    Generate an allocation into its SQLite table DB{seed}, the same rows the generate_db binary writes. Like the binary
+    it resumes from the last stored chunk, and deletes the chunks past n_chunks if the allocation shrank.
+
+    Args:
+    - path (str): The database path.
+    - seed (str): The allocation's seed string, also the table name suffix.
+    - n_chunks (int): The number of chunks.
+    - size (int): The chunk size in characters.
+    - hash (bool): Store only the hashes, with empty data.
+    - delete (bool): Drop the table first.
+    - progress (bool): Print "progress <done> <total>" lines to stdout.
+    """
+    table = table_name( seed )
+    with connections.writer( path ) as db:
+        if delete:
+            db.execute( f"DROP TABLE IF EXISTS {table}" )
+        create_table( db, table )
+        row = db.execute( f"SELECT id, rng_state FROM {table} ORDER BY id DESC LIMIT 1" ).fetchone()
+    start, rng_state = ( row[0] + 1, bytes( row[1] ) ) if row else ( 0, None )
+    if progress: print( f"progress {min( start, n_chunks )} {n_chunks}", flush = True )
+
+    if start > n_chunks:
+        with connections.writer( path ) as db:
+            db.execute( f"DELETE FROM {table} WHERE id >= ?", ( n_chunks, ) )
+        if progress: print( f"progress {n_chunks} {n_chunks}", flush = True )
+        return
+
+    # Commit every few chunks so an interrupted run resumes close to where it stopped.
+    insert = f"INSERT INTO {table} ( id, data, hash, rng_state, merkle_root ) VALUES ( ?, ?, ?, ?, ? )"
+    rows = []
+    for i, data, digest, state in generate( seed, n_chunks, size, start = start, rng_state = rng_state ):
+        rows.append( ( i, '' if hash else data.decode(), digest.hex(), state, merkle.root( data ).hex() ) )
+        if len( rows ) == COMMIT_CHUNKS or i == n_chunks - 1:
+            with connections.writer( path ) as db:
+                db.executemany( insert, rows )
+            rows = []
+            if progress: print( f"progress {i + 1} {n_chunks}", flush = True )
+
+def main():
+    # Command line compatible with the generate_db binary, for machines without a cargo toolchain.
+    parser = argparse.ArgumentParser( description = "Generate chunks into an SQLite database." )
+    parser.add_argument( "--path", required = True, help = "Path to the SQLite database" )
+    parser.add_argument( "--hash", action = 'store_true', help = "Stores the hashes instead of the data itself." )
+    parser.add_argument( "--n", type = int, required = True, help = "Number of chunks to generate" )
+    parser.add_argument( "--size", type = int, required = True, help = "Size of each chunk in bytes" )
+    parser.add_argument( "--seed", required = True, help = "Seed used to generate the data." )
+    parser.add_argument( "--segments", action = 'store_true', help = "Not supported, segment files are written by the generate_db binary." )
+    parser.add_argument( "--progress", action = 'store_true', help = "Print progress lines to stdout." )
+    parser.add_argument( "--delete", action = 'store_true', help = "Delete the table if it exists." )
+    args = parser.parse_args()
+    if args.segments:
+        parser.error( "--segments requires the generate_db binary" )
+    generate_table( args.path, args.seed, args.n, args.size, hash = args.hash, delete = args.delete, progress = args.progress )
+
+if __name__ == "__main__":
+    main()
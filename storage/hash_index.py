@@ -0,0 +1,258 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import typing
+import sqlite3
+import threading
+import bittensor as bt
+from . import connections
+
+# Size of a sha256 digest in bytes.
+DIGEST_SIZE = 32
+# Digest used to mark ids which are not present in the table.
+EMPTY_DIGEST = bytes( DIGEST_SIZE )
+# Number of rows fetched per round trip when bulk loading a table.
+FETCH_SIZE = 4096
+
+def to_digest( value: typing.Union[ str, bytes ] ) -> bytes:
+    """
+    Convert a stored hash (hex string or raw digest) to a 32 byte digest.
+    """
+    if isinstance( value, str ):
+        return bytes.fromhex( value )
+    return bytes( value )
+
+class HashIndex:
+    """
+    In-memory index of the expected chunk hashes and merkle roots for a set of DB{seed} tables.
+
+    Each table is loaded once with a bulk read and kept as contiguous bytearrays of
+    32 byte digests indexed by chunk id, so a lookup is a slice instead of a file open.
+    Tables are extended or truncated incrementally with update() after generation.
+
+    Other processes, i.e. the bridge, rewrite the hashes of stored chunks in place. Those
+    writes are not seen by update(), callers reload() the ids whose hashes they doubt.
+
+    Rows are read from SQLite without holding the lock, so loading one large table never
+    stalls lookups in others. Callers on an event loop preload tables with update().
+    """
+
+    def __init__( self ):
+        # Maps (path, seed) to a pair of bytearrays holding the hashes and merkle roots.
+        self._tables: typing.Dict[ typing.Tuple[ str, str ], typing.Tuple[ bytearray, bytearray ] ] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _table_key( alloc: dict ) -> typing.Tuple[ str, str ]:
+        return ( alloc['path'], alloc['seed'] )
+
+    @staticmethod
+    def _read( alloc: dict, start: int, stop: typing.Optional[ int ] = None ) -> typing.Tuple[ bytearray, bytearray ]:
+        """
+        Read the hashes and roots for ids in [start, stop) into new buffers, the first entry being id start.
+        """
+        table = ( bytearray(), bytearray() )
+        where = "WHERE id >= ?" if stop is None else "WHERE id >= ? AND id < ?"
+        params = ( start, ) if stop is None else ( start, stop )
+        try:
+            with connections.reader( alloc['path'] ) as db:
+                HashIndex._read_rows( db, alloc, table, start, where, params )
+        except sqlite3.Error as e:
+            bt.logging.debug(f"Failed to load hashes from db: {alloc['path']} with error: {e}")
+        return table
+
+    @staticmethod
+    def _read_rows( db, alloc: dict, table: typing.Tuple[ bytearray, bytearray ], start: int, where: str, params: tuple ):
+        digests, roots = table
+        try:
+            cursor = connections.execute( db, f"SELECT id, hash, merkle_root FROM DB{alloc['seed']} {where} ORDER BY id", params )
+        except sqlite3.OperationalError:
+            # Tables generated before merkle roots were recorded.
+            cursor = connections.execute( db, f"SELECT id, hash, NULL FROM DB{alloc['seed']} {where} ORDER BY id", params )
+        try:
+            while True:
+                rows = cursor.fetchmany( FETCH_SIZE )
+                if not rows: break
+                for id, value, root in rows:
+                    # Ids are contiguous for generated tables, pad any gap with empty digests.
+                    missing = id - start - len( digests ) // DIGEST_SIZE
+                    if missing > 0:
+                        digests.extend( EMPTY_DIGEST * missing )
+                        roots.extend( EMPTY_DIGEST * missing )
+                    digests.extend( to_digest( value ) if value else EMPTY_DIGEST )
+                    roots.extend( to_digest( root ) if root else EMPTY_DIGEST )
+        finally:
+            cursor.close()
+
+    def _table( self, alloc: dict ) -> typing.Tuple[ bytearray, bytearray ]:
+        """
+        Return the table for an allocation, loading all of its rows on first use. The rows are read before taking the
+        lock, if another thread loaded the table meanwhile its copy is kept.
+        """
+        table_key = self._table_key( alloc )
+        with self._lock:
+            table = self._tables.get( table_key )
+        if table is not None:
+            return table
+        table = self._read( alloc, 0 )
+        with self._lock:
+            return self._tables.setdefault( table_key, table )
+
+    def update( self, alloc: dict ):
+        """
+        Synchronise the index for an allocation with its table after generation, loading the table if it is not held yet.
+        Only ids above the currently loaded length are read, and ids past n_chunks are dropped. Without n_chunks every
+        row past the loaded length is read, i.e. rows added by another process.
+
+        Args:
+        - alloc (dict): The allocation, with 'path', 'seed' and optionally 'n_chunks'.
+        """
+        n_chunks = alloc.get( 'n_chunks' )
+        table = self._table( alloc )
+        with self._lock:
+            loaded = len( table[0] ) // DIGEST_SIZE
+            if n_chunks is not None and loaded >= n_chunks:
+                for buffer in table:
+                    del buffer[ n_chunks * DIGEST_SIZE: ]
+                return
+        rows = self._read( alloc, loaded, n_chunks )
+        with self._lock:
+            # Another update may have extended or truncated the table while the rows were read, it then stays as it is.
+            if len( table[0] ) // DIGEST_SIZE == loaded:
+                for buffer, new in zip( table, rows ):
+                    buffer.extend( new )
+
+    def holds( self, alloc: dict, key: typing.Union[ str, int ] ) -> bool:
+        """
+        Return True if the table of an allocation is loaded and holds an entry for the id. Never reads the database.
+        """
+        with self._lock:
+            table = self._tables.get( self._table_key( alloc ) )
+            return table is not None and 0 <= int( key ) * DIGEST_SIZE < len( table[0] )
+
+    def reload( self, alloc: dict, keys: typing.List[ typing.Union[ str, int ] ] ) -> bool:
+        """
+        Re-read the hashes and roots of some chunks of a loaded table from the database, picking up writes made by
+        other processes since the table was loaded.
+
+        Args:
+        - alloc (dict): The allocation, with 'path' and 'seed'.
+        - keys (list): The chunk ids.
+
+        Returns:
+        - bool: True if the hash or root of any of the chunks changed.
+        """
+        ids = sorted( { int( key ) for key in keys } )
+        if not ids: return False
+        try:
+            with connections.reader( alloc['path'] ) as db:
+                placeholders = ','.join( '?' * len( ids ) )
+                try:
+                    rows = connections.execute( db, f"SELECT id, hash, merkle_root FROM DB{alloc['seed']} WHERE id IN ({placeholders})", ids ).fetchall()
+                except sqlite3.OperationalError:
+                    # Tables generated before merkle roots were recorded.
+                    rows = connections.execute( db, f"SELECT id, hash, NULL FROM DB{alloc['seed']} WHERE id IN ({placeholders})", ids ).fetchall()
+        except sqlite3.Error as e:
+            bt.logging.debug(f"Failed to reload hashes from db: {alloc['path']} with error: {e}")
+            return False
+        changed = False
+        with self._lock:
+            table = self._tables.get( self._table_key( alloc ) )
+            if table is None: return False
+            for id, value, root in rows:
+                offset = id * DIGEST_SIZE
+                if offset + DIGEST_SIZE > len( table[0] ): continue
+                for buffer, new_value in zip( table, ( value, root ) ):
+                    digest = to_digest( new_value ) if new_value else EMPTY_DIGEST
+                    if buffer[ offset: offset + DIGEST_SIZE ] != digest:
+                        buffer[ offset: offset + DIGEST_SIZE ] = digest
+                        changed = True
+        return changed
+
+    def _lookup( self, alloc: dict, key: typing.Union[ str, int ], column: int ) -> typing.Optional[ bytes ]:
+        table = self._table( alloc )
+        with self._lock:
+            buffer = table[ column ]
+            offset = int( key ) * DIGEST_SIZE
+            if offset < 0 or offset + DIGEST_SIZE > len( buffer ):
+                return None
+            digest = bytes( buffer[ offset: offset + DIGEST_SIZE ] )
+        return None if digest == EMPTY_DIGEST else digest
+
+    def get( self, alloc: dict, key: typing.Union[ str, int ] ) -> typing.Optional[ bytes ]:
+        """
+        Return the expected digest of a chunk, loading the whole table on first use.
+
+        Args:
+        - alloc (dict): The allocation, with 'path' and 'seed'.
+        - key (str|int): The chunk id.
+
+        Returns:
+        - Optional[bytes]: The 32 byte digest, or None if the id is unknown.
+        """
+        return self._lookup( alloc, key, 0 )
+
+    def hexdigest( self, alloc: dict, key: typing.Union[ str, int ] ) -> typing.Optional[ str ]:
+        """
+        Return the expected digest of a chunk as a hex string, or None if the id is unknown.
+        """
+        digest = self.get( alloc, key )
+        return digest.hex() if digest is not None else None
+
+    def root( self, alloc: dict, key: typing.Union[ str, int ] ) -> typing.Optional[ bytes ]:
+        """
+        Return the merkle root of a chunk, or None if the id is unknown or has no recorded root.
+        """
+        return self._lookup( alloc, key, 1 )
+
+    def put( self, alloc: dict, key: typing.Union[ str, int ], value: typing.Union[ str, bytes ], root: typing.Union[ str, bytes, None ] = None ):
+        """
+        Record a new expected hash and merkle root for a chunk, i.e. after its data was replaced.
+        Only ids the index already holds are replaced: tables which have not been loaded yet are left to be read on
+        first use, and ids past the loaded length to be read by update() once their rows exist.
+        """
+        with self._lock:
+            table = self._tables.get( self._table_key( alloc ) )
+            if table is None: return
+            offset = int( key ) * DIGEST_SIZE
+            if offset < 0 or offset + DIGEST_SIZE > len( table[0] ): return
+            for buffer, new_value in zip( table, ( value, root ) ):
+                buffer[ offset: offset + DIGEST_SIZE ] = to_digest( new_value ) if new_value else EMPTY_DIGEST
+
+    def count( self, alloc: dict ) -> int:
+        """
+        Return the number of chunk ids known for an allocation, loading the table on first use.
+        """
+        table = self._table( alloc )
+        with self._lock:
+            return len( table[0] ) // DIGEST_SIZE
+
+    def drop( self, alloc: dict ):
+        """
+        Remove an allocation from the index, i.e. when its hotkey leaves the metagraph.
+        """
+        with self._lock:
+            self._tables.pop( self._table_key( alloc ), None )
+
+    def nbytes( self ) -> int:
+        """
+        Total number of bytes held by the index.
+        """
+        with self._lock:
+            return sum( len( digests ) + len( roots ) for digests, roots in self._tables.values() )
@@ -0,0 +1,133 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import math
+import typing
+import hashlib
+
+# Number of bytes covered by each leaf of a chunk's merkle tree.
+LEAF_SIZE = 1000
+
+# Domain separation prefixes so leaves, inner nodes and the root can not be confused.
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+ROOT_PREFIX = b'\x02'
+
+def hash_leaf( leaf: bytes ) -> bytes:
+    return hashlib.sha256( LEAF_PREFIX + leaf ).digest()
+
+def hash_node( left: bytes, right: bytes ) -> bytes:
+    return hashlib.sha256( NODE_PREFIX + left + right ).digest()
+
+def hash_root( n_leaves: int, top: bytes ) -> bytes:
+    # Binding the leaf count into the root fixes the shape of the tree.
+    return hashlib.sha256( ROOT_PREFIX + n_leaves.to_bytes( 8, 'little' ) + top ).digest()
+
+def n_leaves( size: int, leaf_size: int = LEAF_SIZE ) -> int:
+    """
+    Number of leaves in the tree of a chunk of size bytes. An empty chunk has a single empty leaf.
+    """
+    return max( 1, math.ceil( size / leaf_size ) )
+
+def split( data: bytes, leaf_size: int = LEAF_SIZE ) -> typing.List[ bytes ]:
+    """
+    Split a chunk into its leaves.
+    """
+    return [ data[ i: i + leaf_size ] for i in range( 0, len( data ), leaf_size ) ] or [ b'' ]
+
+def build_tree( data: bytes, leaf_size: int = LEAF_SIZE ) -> typing.List[ typing.List[ bytes ] ]:
+    """
+    Build all levels of the merkle tree of a chunk, leaves first.
+    An unpaired node at the end of a level is carried up unchanged.
+
+    Args:
+    - data (bytes): The chunk data.
+    - leaf_size (int): The number of bytes per leaf.
+
+    Returns:
+    - List[List[bytes]]: The node hashes of every level, from the leaf hashes to the top node.
+    """
+    levels = [ [ hash_leaf( leaf ) for leaf in split( data, leaf_size ) ] ]
+    while len( levels[-1] ) > 1:
+        level = levels[-1]
+        levels.append( [ hash_node( level[i], level[i + 1] ) if i + 1 < len( level ) else level[i] for i in range( 0, len( level ), 2 ) ] )
+    return levels
+
+def root( data: bytes, leaf_size: int = LEAF_SIZE ) -> bytes:
+    """
+    Compute the merkle root of a chunk. Matches the root recorded by the generate_db binary.
+    """
+    levels = build_tree( data, leaf_size )
+    return hash_root( len( levels[0] ), levels[-1][0] )
+
+def prove( levels: typing.List[ typing.List[ bytes ] ], start: int, stop: int ) -> typing.List[ bytes ]:
+    """
+    Build the authentication path for the leaves in [start, stop).
+    At each level the left sibling of the range comes first, then the right sibling.
+
+    Args:
+    - levels (List[List[bytes]]): The tree as returned by build_tree.
+    - start (int): The first leaf of the range.
+    - stop (int): One past the last leaf of the range.
+
+    Returns:
+    - List[bytes]: The sibling hashes required to recompute the root from the range.
+    """
+    proof = []
+    for level in levels[:-1]:
+        if start % 2 == 1:
+            proof.append( level[ start - 1 ] )
+        if stop % 2 == 1 and stop < len( level ):
+            proof.append( level[ stop ] )
+        start, stop = start // 2, ( stop + 1 ) // 2
+    return proof
+
+def verify( expected_root: bytes, n_leaves: int, start: int, leaves: typing.List[ bytes ], proof: typing.List[ bytes ] ) -> bool:
+    """
+    Check a contiguous range of leaves against the merkle root of a chunk.
+
+    Args:
+    - expected_root (bytes): The root recorded when the chunk was generated or stored.
+    - n_leaves (int): The number of leaves in the chunk, bound into the root.
+    - start (int): The index of the first leaf in the range.
+    - leaves (List[bytes]): The leaf data of the range.
+    - proof (List[bytes]): The authentication path as returned by prove.
+
+    Returns:
+    - bool: True if the leaves and path recompute the expected root.
+    """
+    stop = start + len( leaves )
+    if not leaves or start < 0 or stop > n_leaves:
+        return False
+    nodes = [ hash_leaf( leaf ) for leaf in leaves ]
+    proof = list( proof )
+    width = n_leaves
+    while width > 1:
+        try:
+            if start % 2 == 1:
+                nodes.insert( 0, proof.pop( 0 ) )
+                start -= 1
+            if stop % 2 == 1 and stop < width:
+                nodes.append( proof.pop( 0 ) )
+                stop += 1
+        except IndexError:
+            return False
+        nodes = [ hash_node( nodes[i], nodes[i + 1] ) if i + 1 < len( nodes ) else nodes[i] for i in range( 0, len( nodes ), 2 ) ]
+        start, stop, width = start // 2, ( stop + 1 ) // 2, ( width + 1 ) // 2
+    return not proof and hash_root( n_leaves, nodes[0] ) == expected_root
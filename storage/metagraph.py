@@ -0,0 +1,231 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import typing
+import threading
+import numpy as np
+import bittensor as bt
+
+# Number of blocks the chain has to advance before the metagraph is synced again.
+BLOCK_INTERVAL = 5
+# Seconds between checks of the current block, about one block.
+POLL_INTERVAL = 12.0
+# Relative stake change below which a uid's stake is not reported as changed.
+STAKE_TOLERANCE = 0.01
+# Number of change sets kept for callers which do not drain them.
+MAX_PENDING_CHANGES = 64
+
+class Changes:
+    """
+    What changed between two metagraph syncs, as lists of uids.
+
+    Args:
+    - block (int): The block of the new metagraph.
+    - added (list): Uids which did not exist before.
+    - replaced (list): Uids whose hotkey changed, i.e. a new miner registered on them.
+    - removed (list): Uids which no longer exist.
+    - stake (list): Uids whose stake changed by more than STAKE_TOLERANCE.
+    - axons (list): Uids whose axon changed, i.e. the miner moved to another ip or port.
+    """
+
+    def __init__(
+            self,
+            block: int,
+            added: typing.List[ int ] = None,
+            replaced: typing.List[ int ] = None,
+            removed: typing.List[ int ] = None,
+            stake: typing.List[ int ] = None,
+            axons: typing.List[ int ] = None,
+        ):
+        self.block = block
+        self.added = added or []
+        self.replaced = replaced or []
+        self.removed = removed or []
+        self.stake = stake or []
+        self.axons = axons or []
+
+    @property
+    def hotkeys( self ) -> bool:
+        """
+        True if any uid now belongs to another hotkey or uids were added or removed.
+        """
+        return bool( self.added or self.replaced or self.removed )
+
+    def __bool__( self ) -> bool:
+        return bool( self.hotkeys or self.stake or self.axons )
+
+    def to_dict( self ) -> dict:
+        return {
+            'block': self.block,
+            'added': self.added,
+            'replaced': self.replaced,
+            'removed': self.removed,
+            'stake': self.stake,
+            'axons': self.axons,
+        }
+
+def axon_key( axon ) -> tuple:
+    # The parts of an axon a caller connects with.
+    return ( axon.hotkey, axon.ip, axon.port, axon.ip_type, axon.version )
+
+def compare( previous, current, block: int ) -> Changes:
+    """
+    Compute what changed from the previous to the current metagraph.
+
+    Args:
+    - previous (bt.metagraph): The previous metagraph.
+    - current (bt.metagraph): The current metagraph.
+    - block (int): The block of the current metagraph.
+
+    Returns:
+    - Changes: The uids added, replaced, removed or whose stake or axon changed.
+    """
+    previous_hotkeys, current_hotkeys = list( previous.hotkeys ), list( current.hotkeys )
+    n = min( len( previous_hotkeys ), len( current_hotkeys ) )
+    replaced = [ uid for uid in range( n ) if previous_hotkeys[ uid ] != current_hotkeys[ uid ] ]
+    previous_stake = np.asarray( previous.S, dtype = np.float64 )[ :n ]
+    current_stake = np.asarray( current.S, dtype = np.float64 )[ :n ]
+    moved = np.abs( current_stake - previous_stake ) > STAKE_TOLERANCE * np.maximum( previous_stake, 1.0 )
+    replaced_set = set( replaced )
+    return Changes(
+        block = block,
+        added = list( range( n, len( current_hotkeys ) ) ),
+        replaced = replaced,
+        removed = list( range( n, len( previous_hotkeys ) ) ),
+        stake = [ uid for uid in np.flatnonzero( moved ).tolist() if uid not in replaced_set ],
+        axons = [ uid for uid in range( n ) if uid not in replaced_set and axon_key( previous.axons[ uid ] ) != axon_key( current.axons[ uid ] ) ],
+    )
+
+class MetagraphCache:
+    """
+    The latest metagraph of a subnet, synced on a background thread only once the chain advanced by
+    block_interval blocks since the last sync, so the main loops read it without touching the chain.
+
+    The thread checks the current block every poll_interval seconds, which is a single cheap query,
+    and only then pulls the metagraph. Each sync is compared with the previous one and the Changes
+    are queued for changes() so callers update only the affected uids.
+
+    The subtensor is used from the background thread, give the cache a connection of its own rather
+    than one the caller keeps using.
+
+    Args:
+    - subtensor (bt.subtensor): The chain connection used by the cache.
+    - netuid (int): The subnet uid.
+    - block_interval (int): The number of blocks between syncs.
+    - poll_interval (float): The seconds between checks of the current block.
+    """
+
+    def __init__( self, subtensor, netuid: int, block_interval: int = BLOCK_INTERVAL, poll_interval: float = POLL_INTERVAL ):
+        self.subtensor = subtensor
+        self.netuid = netuid
+        self.block_interval = block_interval
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread: typing.Optional[ threading.Thread ] = None
+        self.pending: typing.List[ Changes ] = []
+        self.polls = 0
+        self.syncs = 0
+        self.errors = 0
+        self.sync_seconds = 0.0
+        # The first sync happens on the caller's thread, so the cache always holds a metagraph.
+        self.block = self.subtensor.get_current_block()
+        self._metagraph = self.pull()
+
+    def pull( self ):
+        began = time.time()
+        metagraph = self.subtensor.metagraph( self.netuid )
+        self.syncs += 1
+        self.sync_seconds += time.time() - began
+        return metagraph
+
+    @property
+    def metagraph( self ):
+        """
+        The latest metagraph. It is replaced, never modified, by a sync, so a reference taken here stays consistent.
+        """
+        with self.lock:
+            return self._metagraph
+
+    def refresh( self, force: bool = False ) -> typing.Optional[ Changes ]:
+        """
+        Sync the metagraph if the chain advanced by block_interval blocks since the last sync.
+
+        Args:
+        - force (bool): Sync regardless of the current block.
+
+        Returns:
+        - Changes: What changed, None if the metagraph was not synced.
+        """
+        block = self.subtensor.get_current_block()
+        self.polls += 1
+        if not force and block - self.block < self.block_interval:
+            return None
+        metagraph = self.pull()
+        with self.lock:
+            changes = compare( self._metagraph, metagraph, block )
+            self._metagraph, self.block = metagraph, block
+            if changes:
+                self.pending = ( self.pending + [ changes ] )[ -MAX_PENDING_CHANGES: ]
+        if changes:
+            bt.logging.debug(f"Metagraph changed at block {block}: {changes.to_dict()}")
+        return changes
+
+    def changes( self ) -> typing.List[ Changes ]:
+        """
+        Return the changes of the syncs since the last call, oldest first.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            return pending
+
+    def run( self ):
+        while not self.stopped.wait( self.poll_interval ):
+            try:
+                self.refresh()
+            except Exception as e:
+                # The chain may be unreachable for a while, callers keep the last metagraph meanwhile.
+                self.errors += 1
+                bt.logging.warning(f"Failed to sync the metagraph: {e}")
+
+    def start( self ) -> 'MetagraphCache':
+        if self.thread is None:
+            self.thread = threading.Thread( target = self.run, name = 'metagraph', daemon = True )
+            self.thread.start()
+        return self
+
+    def stop( self ):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join( timeout = self.poll_interval )
+            self.thread = None
+
+    def stats( self ) -> dict:
+        """
+        Return the block of the cached metagraph, the number of block polls, syncs and failed refreshes,
+        and the average seconds a sync took.
+        """
+        return {
+            'block': self.block,
+            'polls': self.polls,
+            'syncs': self.syncs,
+            'errors': self.errors,
+            'sync_seconds': self.sync_seconds / self.syncs if self.syncs else 0.0,
+        }
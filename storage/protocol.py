@@ -18,23 +18,131 @@
 # DEALINGS IN THE SOFTWARE.
 
 import typing
+import base64
 import bittensor as bt
 from bittensor.synapse import Synapse
 
-class Store( bt.Synapse ):
-    # Key of Data.
-    key: str
+# Maximum number of characters carried by a single frame of a streamed payload.
+# A multiple of 4 so every frame of a base64 payload decodes on its own.
+FRAME_SIZE = 1 << 18
+
+# Encodings of the data field. Generated chunks are plain utf-8 text,
+# binary payloads are sent as base64 which costs 4 characters per 3 bytes.
+ENCODING_UTF8 = 'utf-8'
+ENCODING_BASE64 = 'base64'
+ENCODINGS = [ ENCODING_UTF8, ENCODING_BASE64 ]
+
+def encode_data( data: bytes, encoding: str = ENCODING_BASE64 ) -> str:
+    """
+    Encode a binary payload into the string carried by the data field.
+    """
+    if encoding == ENCODING_BASE64:
+        return base64.b64encode( data ).decode( 'ascii' )
+    if encoding == ENCODING_UTF8:
+        return data.decode( 'utf-8' )
+    raise ValueError( f"Unknown encoding: {encoding}" )
+
+def decode_data( data: str, encoding: str = ENCODING_BASE64 ) -> bytes:
+    """
+    Decode the string carried by the data field back into the binary payload.
+    """
+    if encoding == ENCODING_BASE64:
+        return base64.b64decode( data, validate = True )
+    if encoding == ENCODING_UTF8:
+        return data.encode( 'utf-8' )
+    raise ValueError( f"Unknown encoding: {encoding}" )
+
+class StorageSynapse( bt.Synapse ):
+    # Set by a miner which turned the request away because its request queue is full.
+    overloaded: bool = False
+    # Number of requests queued or running on the miner when it handled this one.
+    queue_depth: typing.Optional[ int ] = None
+
+class Ping( bt.Synapse ):
+    # Set to "OK" by miners which are serving.
+    data: typing.Optional[ str ] = None
+    # Deserialize responses.
+    def deserialize(self) -> typing.Optional[ str ]:
+        return self.data
+
+class Store( StorageSynapse ):
+    # Key of Data, assigned by the miner when not set.
+    key: typing.Optional[ str ] = None
     # String encoded data.
     data: str
+    # Encoding of the data, see encode_data.
+    encoding: str = ENCODING_UTF8
+    # Set by the miner once the data is stored under key.
+    stored: bool = False
+    # Deserialize responses to the key the data was stored under, -1 if it was not stored.
+    def deserialize(self) -> int:
+        return int( self.key ) if self.stored and self.key is not None else -1
 
 class GetAllocation( bt.Synapse ):
     allocation: dict
 
-class Retrieve( bt.Synapse ):
+class Retrieve( StorageSynapse ):
     # Key of data.
     key: str = None
     # String encoded data.
     data: typing.Optional[ str ] = None
+    # Encoding the data was stored with, None for generated chunks and chunks stored before encodings were recorded.
+    encoding: typing.Optional[ str ] = None
     # Deserialize responses.
     def deserialize(self) -> str:
         return self.data
+
+class RetrieveBatch( StorageSynapse ):
+    # Keys of data.
+    keys: typing.List[ str ] = []
+    # String encoded data aligned with keys, None for keys which were not found.
+    data: typing.Optional[ typing.List[ typing.Optional[ str ] ] ] = None
+    # Encoding each chunk was stored with aligned with keys, see Retrieve.encoding.
+    encodings: typing.Optional[ typing.List[ typing.Optional[ str ] ] ] = None
+    # Deserialize responses.
+    def deserialize(self) -> typing.Optional[ typing.List[ typing.Optional[ str ] ] ]:
+        return self.data
+
+class Prove( StorageSynapse ):
+    # Keys of data.
+    keys: typing.List[ str ] = []
+    # Index of the first requested merkle leaf of each chunk, taken modulo its leaf count.
+    starts: typing.List[ int ] = []
+    # Number of consecutive leaves requested per chunk.
+    count: int = 1
+    # Number of leaves in each chunk, None for keys which were not found.
+    n_leaves: typing.Optional[ typing.List[ typing.Optional[ int ] ] ] = None
+    # Latin-1 encoded leaf data of each requested range.
+    leaves: typing.Optional[ typing.List[ typing.Optional[ typing.List[ str ] ] ] ] = None
+    # Hex encoded authentication path of each requested range.
+    proofs: typing.Optional[ typing.List[ typing.Optional[ typing.List[ str ] ] ] ] = None
+
+class StoreFrame( StorageSynapse ):
+    # Key of data, assigned by the miner on the first frame when not set.
+    key: typing.Optional[ str ] = None
+    # Offset of this frame in the payload, a frame at offset 0 starts a new payload.
+    offset: int = 0
+    # String encoded frame of the payload, at most FRAME_SIZE characters.
+    data: str = ''
+    # Set on the last frame of the payload.
+    final: bool = False
+    # Encoding of the payload, see encode_data.
+    encoding: str = ENCODING_UTF8
+    # Number of characters the receiver holds after this frame, None if the frame was rejected.
+    size: typing.Optional[ int ] = None
+    # Hex sha256 of the whole payload, set by the receiver on the final frame.
+    hash: typing.Optional[ str ] = None
+
+class RetrieveFrame( StorageSynapse ):
+    # Key of data.
+    key: str
+    # Offset of the requested frame in the payload.
+    offset: int = 0
+    # Maximum number of characters requested.
+    length: int = FRAME_SIZE
+    # String encoded frame of the payload, None if the key was not found.
+    data: typing.Optional[ str ] = None
+    # Total number of characters in the payload.
+    size: typing.Optional[ int ] = None
+    # Encoding the payload was stored with, see Retrieve.encoding.
+    encoding: typing.Optional[ str ] = None
@@ -0,0 +1,109 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import typing
+import hashlib
+import bittensor as bt
+from . import protocol
+
+def frames( data: str, frame_size: int = protocol.FRAME_SIZE ) -> typing.Iterator[ str ]:
+    """
+    Split an encoded payload into frames of at most frame_size characters.
+    """
+    for offset in range( 0, len( data ), frame_size ):
+        yield data[ offset: offset + frame_size ]
+
+async def send(
+        dendrite: bt.dendrite,  # The dendrite used to reach the receiver.
+        axon,  # The axon of the receiver.
+        key: typing.Optional[ str ],  # Key the payload is stored under, None lets the receiver assign one.
+        payload: typing.Iterable[ str ],  # Frames of the encoded payload, in order.
+        encoding: str = protocol.ENCODING_UTF8,  # Encoding of the payload.
+        timeout: float = 12.0,  # Timeout per frame.
+    ) -> typing.Optional[ typing.Tuple[ str, str ] ]:
+    """
+    Stream a payload to a receiver one frame per request, hashing it as it is sent.
+
+    Returns:
+    - Optional[Tuple[str, str]]: The key and hex sha256 of the payload if the receiver stored
+      every frame and reported the same hash, otherwise None.
+    """
+    hasher = hashlib.sha256()
+    offset = 0
+    response = None
+    frame_iterator = iter( payload )
+    frame = next( frame_iterator, '' )
+    while True:
+        next_frame = next( frame_iterator, None )
+        response = await dendrite.forward(
+            axon,
+            protocol.StoreFrame( key = key, offset = offset, data = frame, final = next_frame is None, encoding = encoding ),
+            timeout = timeout,
+            deserialize = False,
+        )
+        hasher.update( frame.encode( 'utf-8' ) )
+        offset += len( frame )
+        if response.size != offset or response.key == None:
+            bt.logging.debug(f"Receiver rejected frame at offset: {offset - len( frame )} for key: {key}")
+            return None
+        if next_frame is None:
+            break
+        frame = next_frame
+        key = response.key
+    digest = hasher.hexdigest()
+    return ( response.key, digest ) if response.hash == digest else None
+
+async def receive(
+        dendrite: bt.dendrite,  # The dendrite used to reach the sender.
+        axon,  # The axon of the sender.
+        key: str,  # Key of the payload.
+        on_frame: typing.Callable[ [ str ], None ],  # Called with each frame as it arrives.
+        frame_size: int = protocol.FRAME_SIZE,  # Number of characters requested per frame.
+        timeout: float = 12.0,  # Timeout per frame.
+        on_encoding: typing.Optional[ typing.Callable[ [ typing.Optional[ str ] ], None ] ] = None,  # Called with the encoding of the payload before its first frame.
+    ) -> typing.Optional[ bool ]:
+    """
+    Stream a payload from a sender one frame per request, so the caller can hash or write
+    each frame as it arrives and never holds more than one frame of the response.
+
+    Returns:
+    - Optional[bool]: True if the whole payload was received, None if the sender was overloaded.
+    """
+    offset = 0
+    while True:
+        response = await dendrite.forward(
+            axon,
+            protocol.RetrieveFrame( key = key, offset = offset, length = frame_size ),
+            timeout = timeout,
+            deserialize = False,
+        )
+        if response.overloaded:
+            return None
+        if response.data == None or response.size == None:
+            return False
+        if offset == 0 and on_encoding is not None:
+            on_encoding( response.encoding )
+        if response.data:
+            on_frame( response.data )
+            offset += len( response.data )
+        if offset >= response.size:
+            return True
+        if not response.data:
+            # The sender returned an empty frame before the end of the payload.
+            return False
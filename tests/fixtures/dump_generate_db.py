@@ -0,0 +1,51 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# Rebuild generate_db.json from the generate_db binary, run from the repository root after building it:
+#   cd neurons/generate_db; cargo build --release; cd -
+#   python tests/fixtures/dump_generate_db.py > tests/fixtures/generate_db.json
+
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+import subprocess
+
+BINARY = os.path.join( os.path.dirname( __file__ ), '..', '..', 'neurons', 'generate_db', 'target', 'release', 'storer_db_project' )
+
+# ( seed, n_chunks, size ) of every case: short chunks of a short seed, and multi leaf chunks of a seed made of two hotkeys like a real allocation.
+CASES = [
+    ( 'fixture', 4, 200 ),
+    ( '5FHneW46xGXgs5mUiveU4sbTyGBzmstUspZC92UhjJM694ty5GrwvaEF5zXb26Fz9rcQpDWS57CtERHpNehXCPcNoHGKutQY', 2, 2500 ),
+]
+
+def rows( seed: str, n: int, size: int, binary: str = BINARY ) -> list:
+    """
+    Generate an allocation with the binary and return its rows with the hashes, rng states and merkle roots hex encoded.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join( directory, 'fixture.db' )
+        subprocess.run( [ os.path.abspath( binary ), '--path', path, '--n', str( n ), '--size', str( size ), '--seed', seed ], check = True, capture_output = True )
+        with sqlite3.connect( path ) as db:
+            query = f"SELECT id, data, hash, hex( rng_state ), merkle_root FROM DB{seed} ORDER BY id"
+            return [ { 'id': id, 'data': data, 'hash': hash, 'rng_state': state.lower(), 'merkle_root': root } for id, data, hash, state, root in db.execute( query ) ]
+
+if __name__ == "__main__":
+    json.dump( [ { 'seed': seed, 'n': n, 'size': size, 'rows': rows( seed, n, size ) } for seed, n, size in CASES ], sys.stdout, indent = 1 )
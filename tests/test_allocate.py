@@ -0,0 +1,82 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import allocate
+
+def test_diff_unchanged_plan_has_no_jobs( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 10, 'hash': False, 'store': 'sqlite' }
+    open( alloc['path'], 'w' ).close()
+    assert allocate.diff( [ dict( alloc ) ], [ alloc ] ) == []
+
+def test_diff_add_grow_shrink_remove( tmp_path ):
+    grown = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 20, 'hash': False, 'store': 'sqlite' }
+    shrunk = { 'path': str( tmp_path / 'DB-b-v' ), 'seed': 'bv', 'n_chunks': 5, 'hash': False, 'store': 'sqlite' }
+    removed = { 'path': str( tmp_path / 'DB-c-v' ), 'seed': 'cv', 'n_chunks': 10, 'hash': False, 'store': 'sqlite' }
+    added = { 'path': str( tmp_path / 'DB-d-v' ), 'seed': 'dv', 'n_chunks': 10, 'hash': False, 'store': 'sqlite' }
+    for alloc in [ grown, shrunk, removed ]:
+        open( alloc['path'], 'w' ).close()
+    previous = [ dict( grown, n_chunks = 10 ), dict( shrunk, n_chunks = 10 ), removed ]
+    jobs = allocate.diff( previous, [ grown, shrunk, added ] )
+    assert [ ( job['action'], job['alloc']['path'] ) for job in jobs ] == [
+        ( allocate.GROW, grown['path'] ),
+        ( allocate.SHRINK, shrunk['path'] ),
+        ( allocate.ADD, added['path'] ),
+        ( allocate.REMOVE, removed['path'] ),
+    ]
+    # Jobs carry the manifest entry they were diffed against, none for a new allocation.
+    assert jobs[0]['previous']['n_chunks'] == 10 and jobs[2]['previous'] is None
+
+def test_diff_regenerates_changed_or_missing_databases( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 10, 'hash': False, 'store': 'sqlite' }
+    # The database was deleted behind the manifest's back.
+    jobs = allocate.diff( [ dict( alloc ) ], [ alloc ] )
+    assert [ job['action'] for job in jobs ] == [ allocate.ADD ] and jobs[0]['previous'] == alloc
+    # The data of a hash only allocation differs from a full one of the same seed.
+    open( alloc['path'], 'w' ).close()
+    jobs = allocate.diff( [ dict( alloc ) ], [ dict( alloc, hash = True ) ] )
+    assert [ job['action'] for job in jobs ] == [ allocate.ADD ]
+    # Entries recorded before the store was, were generated into SQLite.
+    legacy = { key: value for key, value in alloc.items() if key != 'store' }
+    assert allocate.diff( [ legacy ], [ alloc ] ) == []
+
+def test_manifest_round_trip( tmp_path ):
+    path = allocate.manifest_path( str( tmp_path / 'wallet' ) )
+    assert allocate.load_manifest( path ) == []
+    alloc = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 10, 'hash': False, 'store': 'sqlite' }
+    allocate.save_manifest( path, [ alloc ] )
+    assert allocate.load_manifest( path ) == [ dict( alloc, size = 10 * allocate.CHUNK_SIZE ) ]
+    # A corrupt manifest reads as empty, so every allocation is generated again.
+    with open( path, 'w' ) as f:
+        f.write( '[{' )
+    assert allocate.load_manifest( path ) == []
+
+def test_reallocate_removes_unallocated_databases( tmp_path ):
+    manifest = allocate.manifest_path( str( tmp_path / 'wallet' ) )
+    kept = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 10, 'hash': False, 'store': 'sqlite' }
+    removed = { 'path': str( tmp_path / 'DB-b-v' ), 'seed': 'bv', 'n_chunks': 10, 'hash': False, 'store': 'sqlite' }
+    for alloc in [ kept, removed ]:
+        open( alloc['path'], 'w' ).close()
+    allocate.save_manifest( manifest, [ kept, removed ] )
+    jobs = allocate.reallocate( [ kept ], manifest, no_prompt = True )
+    assert [ job['action'] for job in jobs ] == [ allocate.REMOVE ]
+    assert os.path.exists( kept['path'] ) and not os.path.exists( removed['path'] )
+    assert [ entry['path'] for entry in allocate.load_manifest( manifest ) ] == [ kept['path'] ]
+    # A second pass over the same plan has nothing to do.
+    assert allocate.reallocate( [ kept ], manifest, no_prompt = True ) == []
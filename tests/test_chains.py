@@ -0,0 +1,93 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import sqlite3
+from storage import chains, generator, merkle
+import allocate
+
+# Short chunks keep the chains cheap to generate.
+SIZE = 64
+
+def test_grow_writes_the_generated_chain( tmp_path ):
+    service = chains.HashChains( SIZE, workers = 2 )
+    alloc = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 5, 'hash': False }
+    assert service.resize( [ alloc ] ) == [ alloc ]
+    with sqlite3.connect( alloc['path'] ) as db:
+        rows = db.execute( "SELECT id, data, hash, rng_state, merkle_root FROM DBav ORDER BY id" ).fetchall()
+    assert rows == [ ( id, data.decode(), digest.hex(), state, merkle.root( data ).hex() ) for id, data, digest, state in generator.generate( 'av', 5, SIZE ) ]
+    assert service.stats()['generated'] == 5 and service.stats()['transactions'] == 1
+    service.close()
+
+def test_grow_and_shrink_continue_the_chain( tmp_path ):
+    service = chains.HashChains( SIZE, workers = 2 )
+    alloc = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 3, 'hash': True }
+    service.resize( [ alloc ] )
+    service.resize( [ dict( alloc, n_chunks = 6 ) ] )
+    service.resize( [ dict( alloc, n_chunks = 2 ) ] )
+    assert service.tip( alloc )[0] == 2
+    # Growing again resumes from the rng_state of the last chunk left.
+    service.resize( [ dict( alloc, n_chunks = 4 ) ] )
+    with sqlite3.connect( alloc['path'] ) as db:
+        rows = db.execute( "SELECT id, data, hash, rng_state FROM DBav ORDER BY id" ).fetchall()
+    # Hash tables store the hashes of the chunks and no data.
+    assert rows == [ ( id, '', digest.hex(), state ) for id, data, digest, state in generator.generate( 'av', 4, SIZE ) ]
+    assert service.stats()['generated'] == 8 and service.stats()['truncated'] == 4
+    service.close()
+
+def test_tables_of_a_file_change_in_one_transaction( tmp_path ):
+    service = chains.HashChains( SIZE, workers = 2 )
+    path = str( tmp_path / 'DB-v' )
+    first = { 'path': path, 'seed': 'av', 'n_chunks': 4, 'hash': True }
+    second = { 'path': path, 'seed': 'bv', 'n_chunks': 2, 'hash': True }
+    service.resize( [ first, second ] )
+    assert service.stats()['transactions'] == 1
+    service.resize( [ dict( first, n_chunks = 2 ), dict( second, n_chunks = 4 ) ] )
+    assert service.stats()['transactions'] == 2
+    with sqlite3.connect( path ) as db:
+        assert db.execute( "SELECT COUNT(*) FROM DBav" ).fetchone()[0] == 2
+        assert db.execute( "SELECT COUNT(*) FROM DBbv" ).fetchone()[0] == 4
+    # Tables already at their size are done without a transaction.
+    assert len( service.resize( [ dict( first, n_chunks = 2 ) ] ) ) == 1
+    assert service.stats()['transactions'] == 2
+    service.close()
+
+def test_drop_forgets_the_tip( tmp_path ):
+    service = chains.HashChains( SIZE, workers = 1 )
+    alloc = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 3, 'hash': True }
+    service.resize( [ alloc ] )
+    os.remove( alloc['path'] )
+    service.drop( alloc )
+    assert service.tip( alloc ) == ( 0, None )
+    service.resize( [ alloc ] )
+    assert service.tip( alloc )[0] == 3
+    service.close()
+
+def test_reallocate_resizes_sqlite_tables_in_process( tmp_path ):
+    service = chains.HashChains( SIZE, workers = 2 )
+    manifest = allocate.manifest_path( str( tmp_path ) )
+    alloc = { 'path': str( tmp_path / 'DB-a-v' ), 'seed': 'av', 'n_chunks': 3, 'hash': True, 'store': 'sqlite' }
+    jobs = allocate.reallocate( [ alloc ], manifest, no_prompt = True, chains = service )
+    assert [ job['action'] for job in jobs ] == [ allocate.ADD ]
+    jobs = allocate.reallocate( [ dict( alloc, n_chunks = 5 ) ], manifest, no_prompt = True, chains = service )
+    assert [ job['action'] for job in jobs ] == [ allocate.GROW ]
+    assert [ entry['n_chunks'] for entry in allocate.load_manifest( manifest ) ] == [ 5 ]
+    with sqlite3.connect( alloc['path'] ) as db:
+        assert db.execute( "SELECT COUNT(*) FROM DBav" ).fetchone()[0] == 5
+    service.close()
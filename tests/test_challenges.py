@@ -0,0 +1,113 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import math
+import challenges
+import allocation_table
+
+def test_probes_the_last_chunk_and_grows_while_it_passes():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 100 ] )
+    scheduler = challenges.ChallengeScheduler( table, decay = 1.0 )
+    # Nothing is known yet: no prefix to audit, only the last hashed chunk is probed.
+    assert scheduler.plan( n_keys = 1 ) == { 0: [ 99 ] }
+    scheduler.record( 0, [ 99 ], [ True ] )
+    assert scheduler.lower[0] == 100 and math.isinf( scheduler.upper[0] )
+    assert table.n_chunks[0] == 150
+    # The next probe is the last chunk of the grown estimate, with an audit below the proven prefix.
+    keys = scheduler.plan( n_keys = 1 )[0]
+    assert keys[-1] == 149 and len( keys ) == 2 and keys[0] < 100
+
+def test_failed_probe_bounds_the_capacity():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 200 ] )
+    scheduler = challenges.ChallengeScheduler( table, decay = 1.0 )
+    scheduler.record( 0, [ 99 ], [ True ] )
+    scheduler.record( 0, [ 5, 160 ], [ True, False ] )
+    assert scheduler.lower[0] == 100 and scheduler.upper[0] == 160
+    # The estimate follows the upper bound and probes bisect the interval.
+    assert table.n_chunks[0] == 160
+    for _ in range( 20 ):
+        keys = scheduler.plan( n_keys = 3 )[0]
+        assert len( [ key for key in keys if key < 100 ] ) == 1
+        assert all( 100 <= key < 160 for key in keys if key >= 100 )
+
+def test_bounds_decay_each_round():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 100 ], verified = [ 50 ] )
+    scheduler = challenges.ChallengeScheduler( table, decay = 0.5 )
+    scheduler.record( 0, [ 80 ], [ False ] )
+    assert scheduler.lower[0] == 50 and scheduler.upper[0] == 80
+    scheduler.plan()
+    assert scheduler.lower[0] == 25 and scheduler.upper[0] == 160
+
+def test_converged_miners_are_only_audited():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 100 ], verified = [ 90 ] )
+    scheduler = challenges.ChallengeScheduler( table, decay = 1.0 )
+    scheduler.record( 0, [ 95 ], [ False ] )
+    assert scheduler.width()[0] <= challenges.TOLERANCE
+    keys = scheduler.plan( n_keys = 4 )[0]
+    # Audits only, on as many keys as a challenge probes, all below the audit floor.
+    assert len( keys ) == 4 and all( key < scheduler.floor( 0 ) for key in keys )
+    assert scheduler.stats()['converged'] == 1
+
+def test_credit_follows_the_streak_of_passed_audits():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 200 ] )
+    scheduler = challenges.ChallengeScheduler( table, decay = 1.0 )
+    scheduler.record( 0, [ 99 ], [ True ] )
+    # The prefix is proven by its last key, but nothing below it has been audited yet.
+    assert scheduler.credit( 0 ) == 0 and table.verified[0] == 0
+    credits = []
+    for streak in range( 1, 4 ):
+        scheduler.record( 0, [ 5 ], [ True ] )
+        assert scheduler.streak[0] == streak
+        credits.append( scheduler.credit( 0 ) )
+        assert credits[-1] == int( 100 * challenges.CONFIDENCE ** ( 1.0 / streak ) )
+        assert table.verified[0] == credits[-1]
+    assert credits == sorted( credits )
+
+def test_streak_starts_over_when_the_prefix_grows():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 400 ] )
+    scheduler = challenges.ChallengeScheduler( table, decay = 1.0 )
+    scheduler.record( 0, [ 99 ], [ True ] )
+    scheduler.record( 0, [ 5 ], [ True ] )
+    verified = int( table.verified[0] )
+    assert scheduler.streak[0] == 1
+    # Audits of the first 100 chunks say little about the first 200, but the credit already given is kept.
+    scheduler.record( 0, [ 10, 199 ], [ True, True ] )
+    assert scheduler.streak[0] == 0 and scheduler.covered[0] == 200
+    assert table.verified[0] == verified
+
+def test_failed_audit_lowers_the_bounds_and_the_credit():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 200 ] )
+    scheduler = challenges.ChallengeScheduler( table, decay = 1.0 )
+    scheduler.record( 0, [ 99 ], [ True ] )
+    scheduler.record( 0, [ 5 ], [ True ] )
+    assert table.verified[0] > 0
+    scheduler.record( 0, [ 7 ], [ False ] )
+    assert scheduler.upper[0] == 7 and scheduler.lower[0] == 7
+    assert scheduler.streak[0] == 0 and table.verified[0] == 0
+    assert table.n_chunks[0] == challenges.MIN_CHUNKS
+    assert scheduler.stats()['failed_audits'] == 1
+
+def test_budget_and_exclude():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a', 'b', 'c' ], role = allocation_table.VALIDATOR, n_chunks = [ 100, 100, 100 ] )
+    scheduler = challenges.ChallengeScheduler( table, budget = 2 )
+    for _ in range( 10 ):
+        assert sorted( scheduler.plan( exclude = 'a' ) ) == [ 1, 2 ]
+    scheduler.budget = 1
+    assert len( scheduler.plan( exclude = 'a' ) ) == 1
+    assert scheduler.stats()['challenged'] == 21
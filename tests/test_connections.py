@@ -0,0 +1,119 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import sqlite3
+import pytest
+from storage import connections
+
+def test_connections_are_reused( tmp_path ):
+    manager = connections.ConnectionManager()
+    path = str( tmp_path / 'a.db' )
+    with manager.writer( path ) as first:
+        pass
+    with manager.writer( path ) as second:
+        assert second is first
+    assert manager.stats()['acquired'] == 2 and manager.stats()['opened'] == 1
+
+def test_writer_uses_wal_and_readers_are_read_only( tmp_path ):
+    manager = connections.ConnectionManager()
+    path = str( tmp_path / 'a.db' )
+    with manager.writer( path ) as db:
+        assert db.execute( "PRAGMA journal_mode" ).fetchone()[0] == 'wal'
+        db.execute( "CREATE TABLE t ( x INTEGER )" )
+        db.execute( "INSERT INTO t VALUES ( 1 )" )
+    with manager.reader( path ) as db:
+        # The writer committed when its block exited.
+        assert db.execute( "SELECT x FROM t" ).fetchall() == [ ( 1, ) ]
+        with pytest.raises( sqlite3.OperationalError ):
+            db.execute( "INSERT INTO t VALUES ( 2 )" )
+
+def test_writer_rolls_back_when_the_block_raises( tmp_path ):
+    manager = connections.ConnectionManager()
+    path = str( tmp_path / 'a.db' )
+    with manager.writer( path ) as db:
+        db.execute( "CREATE TABLE t ( x INTEGER )" )
+    with pytest.raises( ValueError ):
+        with manager.writer( path ) as db:
+            db.execute( "INSERT INTO t VALUES ( 1 )" )
+            raise ValueError()
+    with manager.reader( path ) as db:
+        assert db.execute( "SELECT COUNT(*) FROM t" ).fetchone()[0] == 0
+
+def test_least_recently_used_pools_are_evicted( tmp_path ):
+    manager = connections.ConnectionManager( max_pools = 2 )
+    paths = [ str( tmp_path / f'{name}.db' ) for name in 'abc' ]
+    with manager.writer( paths[0] ) as evicted:
+        pass
+    with manager.writer( paths[1] ):
+        pass
+    # Using a again makes b the least recently used.
+    with manager.writer( paths[0] ):
+        pass
+    with manager.writer( paths[2] ):
+        pass
+    assert list( manager.pools ) == [ paths[0], paths[2] ]
+    assert manager.stats()['evicted'] == 1
+    with manager.writer( paths[1] ):
+        pass
+    assert list( manager.pools ) == [ paths[2], paths[1] ]
+    # The idle connections of an evicted pool are closed.
+    with pytest.raises( sqlite3.ProgrammingError ):
+        evicted.execute( "SELECT 1" )
+
+def test_pools_in_use_are_not_evicted( tmp_path ):
+    manager = connections.ConnectionManager( max_pools = 1 )
+    first, second = str( tmp_path / 'a.db' ), str( tmp_path / 'b.db' )
+    with manager.writer( first ) as db:
+        # Every other pool is in use, so the limit is exceeded until they are released.
+        with manager.writer( second ):
+            assert list( manager.pools ) == [ first, second ]
+        with manager.writer( str( tmp_path / 'c.db' ) ):
+            pass
+        # The pool of the connection handed out outlived the idle one opened after it.
+        assert first in manager.pools and second not in manager.pools
+        db.execute( "SELECT 1" )
+    assert manager.stats()['evicted'] == 1
+
+def test_close_drops_idle_pools( tmp_path ):
+    manager = connections.ConnectionManager()
+    path = str( tmp_path / 'a.db' )
+    with manager.writer( path ) as db:
+        pass
+    manager.close( path )
+    assert path not in manager.pools
+    with pytest.raises( sqlite3.ProgrammingError ):
+        db.execute( "SELECT 1" )
+
+def test_execute_retries_while_busy( monkeypatch ):
+    monkeypatch.setattr( connections, 'BUSY_BACKOFF', 0.0 )
+    manager = connections.ConnectionManager()
+
+    class Busy:
+        calls = 0
+        def execute( self, sql, params ):
+            Busy.calls += 1
+            if Busy.calls < 3:
+                raise sqlite3.OperationalError( "database is locked" )
+            return 'cursor'
+
+    assert manager.execute( Busy(), "SELECT 1" ) == 'cursor'
+    assert manager.stats()['busy_retries'] == 2
+    with pytest.raises( sqlite3.OperationalError ):
+        manager.execute( sqlite3.connect( ':memory:' ), "SELECT * FROM missing" )
+    assert manager.stats()['busy_retries'] == 2
@@ -0,0 +1,87 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import random
+import itertools
+import pytest
+import numpy as np
+from storage import erasure
+
+# ( data shards, parity shards ) of every tested code, from whole chunks to wide codes.
+CODES = [ ( 1, 0 ), ( 1, 2 ), ( 2, 1 ), ( 3, 3 ), ( 4, 2 ), ( 10, 4 ) ]
+# Sizes divisible by every k and sizes which leave the last data shard padded.
+SIZES = [ 1, 60, 997, 4096 ]
+
+def erasures( n: int, m: int ) -> list:
+    """
+    Every set of at most m of the n shard indices, sampled when there are too many to try.
+    """
+    subsets = [ subset for count in range( m + 1 ) for subset in itertools.combinations( range( n ), count ) ]
+    return subsets if len( subsets ) <= 256 else random.Random( n * m ).sample( subsets, 256 )
+
+@pytest.mark.parametrize( 'k, m', CODES )
+@pytest.mark.parametrize( 'size', SIZES )
+def test_decode_with_up_to_m_erasures( k, m, size ):
+    data = random.Random( size ).randbytes( size )
+    shards = erasure.encode( data, k, m )
+    assert len( shards ) == k + m
+    assert len( set( len( shard ) for shard in shards ) ) == 1
+    # The code is systematic, the data shards are the zero padded data.
+    assert b''.join( shards[ :k ] )[ :size ] == data
+    for erased in erasures( k + m, m ):
+        available = { index: shard for index, shard in enumerate( shards ) if index not in erased }
+        assert erasure.decode( available, k, m, size ) == data
+
+@pytest.mark.parametrize( 'k, m', [ code for code in CODES if code[1] > 0 ] )
+def test_decode_from_parity_only( k, m ):
+    # Any k shards recover the data, including the last k which hold the fewest data shards.
+    data = random.Random( k ).randbytes( 1000 )
+    shards = erasure.encode( data, k, m )
+    last = { index: shards[ index ] for index in range( m, k + m ) }
+    assert erasure.decode( last, k, m, len( data ) ) == data
+
+@pytest.mark.parametrize( 'k, m', [ code for code in CODES if code[1] > 0 ] )
+def test_decode_needs_k_shards( k, m ):
+    shards = erasure.encode( b'x' * 100, k, m )
+    with pytest.raises( ValueError ):
+        erasure.decode( { index: shards[ index ] for index in range( 1, k ) }, k, m, 100 )
+
+def test_decode_keeps_padding_without_size():
+    shards = erasure.encode( b'abcde', 2, 1 )
+    assert erasure.decode( { 1: shards[1], 2: shards[2] }, 2, 1 ) == b'abcde\x00'
+
+def test_encoding_matrix_bounds():
+    with pytest.raises( ValueError ):
+        erasure.encoding_matrix( 0, 2 )
+    with pytest.raises( ValueError ):
+        erasure.encoding_matrix( 200, 57 )
+
+def test_field_inverse():
+    for a in range( 1, 256 ):
+        assert erasure.MUL[ a, erasure.inverse( a ) ] == 1
+    with pytest.raises( ZeroDivisionError ):
+        erasure.inverse( 0 )
+
+@pytest.mark.parametrize( 'k, m', [ code for code in CODES if code[1] > 0 ] )
+def test_every_k_rows_of_the_encoding_matrix_invert( k, m ):
+    # Any k shards decode only if every k rows of the encoding matrix form an invertible matrix.
+    matrix = erasure.encoding_matrix( k, m )
+    for rows in itertools.islice( itertools.combinations( range( k + m ), k ), 256 ):
+        square = matrix[ list( rows ) ]
+        assert np.array_equal( erasure.matmul( erasure.invert( square ), square ), np.eye( k, dtype = np.uint8 ) )
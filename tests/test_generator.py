@@ -0,0 +1,94 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# The in-process generator must write exactly the rows of the generate_db binary, validators and miners check each
+# other's chunks by hash. generate_db.json is provisional: it was derived from a transcription of the binary's source
+# and not from the binary itself. Regenerate it with fixtures/dump_generate_db.py against a built binary, after which
+# test_binary_matches_fixture keeps it honest.
+
+import os
+import json
+import sqlite3
+import pytest
+import numpy as np
+from storage import generator, merkle
+
+FIXTURES = os.path.join( os.path.dirname( __file__ ), 'fixtures' )
+BINARY = os.path.join( os.path.dirname( __file__ ), '..', 'neurons', 'generate_db', 'target', 'release', 'storer_db_project' )
+
+with open( os.path.join( FIXTURES, 'generate_db.json' ) ) as f:
+    CASES = json.load( f )
+
+def case_id( case: dict ) -> str:
+    return f"{case['seed'][:8]}-{case['size']}"
+
+@pytest.mark.parametrize( 'case', CASES, ids = case_id )
+def test_generate_matches_fixture( case ):
+    generated = list( generator.generate( case['seed'], case['n'], case['size'] ) )
+    assert len( generated ) == len( case['rows'] )
+    for ( id, data, digest, state ), row in zip( generated, case['rows'] ):
+        assert id == row['id']
+        assert data.decode() == row['data']
+        assert digest.hex() == row['hash']
+        assert state.hex() == row['rng_state']
+        assert merkle.root( data ).hex() == row['merkle_root']
+
+@pytest.mark.parametrize( 'case', CASES, ids = case_id )
+def test_resume_from_rng_state( case ):
+    # Every chunk regenerates alone from the rng_state stored with the previous one.
+    rows = case['rows']
+    for previous, row in zip( rows, rows[ 1: ] ):
+        data, digest, state = generator.chunk( case['seed'], row['id'], case['size'], rng_state = bytes.fromhex( previous['rng_state'] ) )
+        assert data.decode() == row['data']
+        assert digest.hex() == row['hash']
+        assert state.hex() == row['rng_state']
+
+@pytest.mark.parametrize( 'case', CASES, ids = case_id )
+def test_generate_table_matches_fixture( case, tmp_path ):
+    path = str( tmp_path / 'generated.db' )
+    generator.generate_table( path, case['seed'], case['n'], case['size'] )
+    with sqlite3.connect( path ) as db:
+        rows = db.execute( f"SELECT id, data, hash, rng_state, merkle_root FROM DB{case['seed']} ORDER BY id" ).fetchall()
+    assert rows == [ ( row['id'], row['data'], row['hash'], bytes.fromhex( row['rng_state'] ), row['merkle_root'] ) for row in case['rows'] ]
+
+def test_alphabet():
+    # The binary's CHARS: 'a'..='z' then the half open 'A'..'Z' and '0'..'9', so 'Z' and '9' are never drawn.
+    expected = [ chr( c ) for c in range( ord( 'a' ), ord( 'z' ) + 1 ) ] + [ chr( c ) for c in range( ord( 'A' ), ord( 'Z' ) ) ] + [ chr( c ) for c in range( ord( '0' ), ord( '9' ) ) ]
+    assert generator.ALPHABET.tobytes().decode() == ''.join( expected )
+    assert len( generator.ALPHABET ) == 60
+    # The binary draws every character of its alphabet and nothing else.
+    drawn = set( ''.join( row['data'] for case in CASES for row in case['rows'] ) )
+    assert drawn == set( expected )
+
+def test_sample_indices_rejects_past_zone():
+    # The index is the high half of draw * RANGE, and a draw whose low half falls past the zone is rejected.
+    draws = np.array( [ 0, generator.ZONE // generator.RANGE, 2**63, 2**64 - 1 ], dtype = np.uint64 )
+    indices, accepted = generator.sample_indices( draws )
+    assert indices.tolist() == [ 0, 0, generator.RANGE // 2, generator.RANGE - 1 ]
+    assert accepted.tolist() == [ True, True, True, False ]
+
+@pytest.mark.skipif( not os.path.exists( BINARY ), reason = "generate_db binary is not built" )
+@pytest.mark.parametrize( 'case', CASES, ids = case_id )
+def test_binary_matches_fixture( case ):
+    # With the binary built, check the fixture is still what it writes.
+    import importlib.util
+    spec = importlib.util.spec_from_file_location( 'dump_generate_db', os.path.join( FIXTURES, 'dump_generate_db.py' ) )
+    dump = importlib.util.module_from_spec( spec )
+    spec.loader.exec_module( dump )
+    assert dump.rows( case['seed'], case['n'], case['size'], binary = BINARY ) == case['rows']
@@ -0,0 +1,147 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import sqlite3
+from storage import hash_index
+
+def digest( id: int, salt: int = 0 ) -> str:
+    # Never the all zero digest, which marks missing ids.
+    return bytes( [ ( id + salt ) % 255 + 1 ] * 32 ).hex()
+
+# The hash table of allocation 'a', as written by generate_db.
+CREATE = "CREATE TABLE IF NOT EXISTS DBa ( id INTEGER PRIMARY KEY, data TEXT NOT NULL, hash TEXT NOT NULL, rng_state BLOB NOT NULL, merkle_root TEXT )"
+INSERT = "INSERT OR REPLACE INTO DBa VALUES ( ?, '', ?, x'00', ? )"
+
+def test_first_lookup_loads_the_table( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a' }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 10 ) ] )
+    index = hash_index.HashIndex()
+    assert not index.holds( alloc, 0 )
+    assert index.hexdigest( alloc, 3 ) == digest( 3 )
+    assert index.root( alloc, 3 ).hex() == digest( 3, 1 )
+    assert index.holds( alloc, 9 ) and not index.holds( alloc, 10 )
+    assert index.get( alloc, 10 ) is None
+    assert index.count( alloc ) == 10
+
+def test_update_extends_and_truncates( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a', 'n_chunks': 4 }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 10 ) ] )
+    index = hash_index.HashIndex()
+    index.update( alloc )
+    assert index.count( alloc ) == 4
+    index.update( dict( alloc, n_chunks = 8 ) )
+    assert index.count( alloc ) == 8 and index.hexdigest( alloc, 7 ) == digest( 7 )
+    index.update( dict( alloc, n_chunks = 2 ) )
+    assert index.count( alloc ) == 2 and index.get( alloc, 2 ) is None
+
+def test_update_without_n_chunks_reads_rows_added_later( tmp_path ):
+    # The bridge's allocations carry no n_chunks, rows the validator adds after the first load are read on update.
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a' }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 5 ) ] )
+    index = hash_index.HashIndex()
+    assert index.count( alloc ) == 5
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 5, 12 ) ] )
+    assert not index.holds( alloc, 11 )
+    index.update( alloc )
+    assert index.holds( alloc, 11 ) and index.hexdigest( alloc, 11 ) == digest( 11 )
+
+def test_gaps_are_padded( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a' }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 3 ) ] )
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 6, 8 ) ] )
+    index = hash_index.HashIndex()
+    assert index.count( alloc ) == 8
+    assert index.get( alloc, 4 ) is None and index.hexdigest( alloc, 7 ) == digest( 7 )
+    index = hash_index.HashIndex()
+    index.update( dict( alloc, n_chunks = 2 ) )
+    index.update( alloc )
+    assert index.count( alloc ) == 8 and index.hexdigest( alloc, 6 ) == digest( 6 )
+
+def test_put_only_replaces_known_ids( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a' }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 4 ) ] )
+    index = hash_index.HashIndex()
+    # Unloaded tables are left to be read on first use.
+    index.put( alloc, 1, digest( 1, 50 ) )
+    assert not index.holds( alloc, 0 )
+    index.put( alloc, 1, digest( 1, 50 ), digest( 1, 51 ) )
+    index.count( alloc )
+    index.put( alloc, 1, digest( 1, 50 ), digest( 1, 51 ) )
+    index.put( alloc, 9, digest( 9, 50 ) )
+    assert index.hexdigest( alloc, 1 ) == digest( 1, 50 ) and index.root( alloc, 1 ).hex() == digest( 1, 51 )
+    assert index.count( alloc ) == 4
+
+def test_reload_picks_up_writes_from_other_processes( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a' }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 4 ) ] )
+    index = hash_index.HashIndex()
+    assert index.hexdigest( alloc, 2 ) == digest( 2 )
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id, 100 ), digest( id, 101 ) ) for id in range( 2, 3 ) ] )
+    assert not index.reload( alloc, [ 1 ] )
+    assert index.reload( alloc, [ '1', '2' ] )
+    assert index.hexdigest( alloc, 2 ) == digest( 2, 100 )
+    assert not index.reload( alloc, [ 2 ] )
+
+def test_tables_are_read_without_the_lock( tmp_path, monkeypatch ):
+    # Loading one table must not block lookups in the others.
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a' }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 4 ) ] )
+    index = hash_index.HashIndex()
+    read = hash_index.HashIndex._read
+    def checked_read( *args, **kwargs ):
+        assert not index._lock.locked()
+        return read( *args, **kwargs )
+    monkeypatch.setattr( hash_index.HashIndex, '_read', staticmethod( checked_read ) )
+    assert index.hexdigest( alloc, 0 ) == digest( 0 )
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 4, 6 ) ] )
+    index.update( alloc )
+    assert index.count( alloc ) == 6
+
+def test_drop( tmp_path ):
+    alloc = { 'path': str( tmp_path / 'a.db' ), 'seed': 'a' }
+    with sqlite3.connect( alloc['path'] ) as db:
+        db.execute( CREATE )
+        db.executemany( INSERT, [ ( id, digest( id ), digest( id, 1 ) ) for id in range( 4 ) ] )
+    index = hash_index.HashIndex()
+    index.count( alloc )
+    assert index.nbytes() == 4 * 2 * hash_index.DIGEST_SIZE
+    index.drop( alloc )
+    assert index.nbytes() == 0 and not index.holds( alloc, 0 )
@@ -0,0 +1,102 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import random
+import pytest
+from storage import merkle
+
+# Leaf counts covering single leaves, full trees and trees with unpaired nodes on several levels.
+LEAF_COUNTS = [ 1, 2, 3, 5, 7, 8, 13 ]
+# A small leaf size keeps the trees deep with little data.
+LEAF_SIZE = 4
+
+def tree( n_leaves: int ):
+    # The last leaf is short unless the tree has a single one.
+    data = random.Random( n_leaves ).randbytes( n_leaves * LEAF_SIZE - ( 1 if n_leaves > 1 else 0 ) )
+    levels = merkle.build_tree( data, LEAF_SIZE )
+    return merkle.split( data, LEAF_SIZE ), levels, merkle.hash_root( len( levels[0] ), levels[-1][0] )
+
+def ranges( n_leaves: int ):
+    return [ ( start, stop ) for start in range( n_leaves ) for stop in range( start + 1, n_leaves + 1 ) ]
+
+@pytest.mark.parametrize( 'n_leaves', LEAF_COUNTS )
+def test_every_range_verifies( n_leaves ):
+    leaves, levels, root = tree( n_leaves )
+    assert len( leaves ) == merkle.n_leaves( sum( len( leaf ) for leaf in leaves ), LEAF_SIZE ) == n_leaves
+    assert root == merkle.root( b''.join( leaves ), LEAF_SIZE )
+    for start, stop in ranges( n_leaves ):
+        assert merkle.verify( root, n_leaves, start, leaves[ start: stop ], merkle.prove( levels, start, stop ) )
+
+def test_empty_chunk_has_one_empty_leaf():
+    assert merkle.split( b'' ) == [ b'' ]
+    levels = merkle.build_tree( b'' )
+    assert merkle.verify( merkle.root( b'' ), 1, 0, [ b'' ], merkle.prove( levels, 0, 1 ) )
+
+@pytest.mark.parametrize( 'n_leaves', LEAF_COUNTS )
+def test_wrong_root_fails( n_leaves ):
+    leaves, levels, root = tree( n_leaves )
+    other = merkle.root( b''.join( leaves ) + b'!', LEAF_SIZE )
+    for start, stop in ranges( n_leaves ):
+        proof = merkle.prove( levels, start, stop )
+        assert not merkle.verify( other, n_leaves, start, leaves[ start: stop ], proof )
+        # The bare top node is not the root either, the leaf count is bound into it.
+        assert not merkle.verify( levels[-1][0], n_leaves, start, leaves[ start: stop ], proof )
+
+@pytest.mark.parametrize( 'n_leaves', LEAF_COUNTS )
+def test_tampered_leaf_fails( n_leaves ):
+    leaves, levels, root = tree( n_leaves )
+    for start, stop in ranges( n_leaves ):
+        proof = merkle.prove( levels, start, stop )
+        for index in range( start, stop ):
+            tampered = list( leaves[ start: stop ] )
+            tampered[ index - start ] = bytes( [ tampered[ index - start ][0] ^ 1 ] ) + tampered[ index - start ][ 1: ]
+            assert not merkle.verify( root, n_leaves, start, tampered, proof )
+        # Shifting the range or dropping a leaf breaks the path as well.
+        if stop < n_leaves:
+            assert not merkle.verify( root, n_leaves, start + 1, leaves[ start: stop ], proof )
+        if stop - start > 1:
+            assert not merkle.verify( root, n_leaves, start, leaves[ start: stop - 1 ], proof )
+
+@pytest.mark.parametrize( 'n_leaves', LEAF_COUNTS )
+def test_forged_leaf_count_fails( n_leaves ):
+    leaves, levels, root = tree( n_leaves )
+    for start, stop in ranges( n_leaves ):
+        proof = merkle.prove( levels, start, stop )
+        for forged in { 1, n_leaves - 1, n_leaves + 1, 2 * n_leaves } - { n_leaves }:
+            assert not merkle.verify( root, forged, start, leaves[ start: stop ], proof )
+
+@pytest.mark.parametrize( 'n_leaves', [ n for n in LEAF_COUNTS if n > 1 ] )
+def test_tampered_proof_fails( n_leaves ):
+    leaves, levels, root = tree( n_leaves )
+    for start, stop in ranges( n_leaves ):
+        proof = merkle.prove( levels, start, stop )
+        for index in range( len( proof ) ):
+            tampered = list( proof )
+            tampered[ index ] = bytes( 32 )
+            assert not merkle.verify( root, n_leaves, start, leaves[ start: stop ], tampered )
+        # A missing or surplus sibling is rejected rather than ignored.
+        if proof:
+            assert not merkle.verify( root, n_leaves, start, leaves[ start: stop ], proof[ :-1 ] )
+        assert not merkle.verify( root, n_leaves, start, leaves[ start: stop ], proof + [ bytes( 32 ) ] )
+
+def test_out_of_range_fails():
+    leaves, levels, root = tree( 5 )
+    assert not merkle.verify( root, 5, 0, [], [] )
+    assert not merkle.verify( root, 5, -1, leaves[ :1 ], merkle.prove( levels, 0, 1 ) )
+    assert not merkle.verify( root, 5, 4, leaves[ 4: ] + leaves[ :1 ], merkle.prove( levels, 4, 5 ) )
@@ -0,0 +1,82 @@
+# The MIT License (MIT)
+# Copyright © 2023 Yuma Rao
+# TODO(developer): Set your name
+# Copyright © 2023 <your name>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import numpy as np
+import state
+import allocation_table
+
+def test_save_and_load( tmp_path ):
+    path = str( tmp_path / 'validator' / state.STATE_NAME )
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a', 'b' ], role = allocation_table.VALIDATOR, n_chunks = [ 150, 40 ], verified = [ 120, 0 ] )
+    state.save( path, table, np.array( [ 0.5, 2.0 ] ), 42 )
+    assert not os.path.exists( path + '.tmp' )
+    checkpoint = state.load( path )
+    assert checkpoint['owner'] == 'validator' and checkpoint['step'] == 42
+    assert checkpoint['hotkeys'] == [ 'a', 'b' ]
+    assert checkpoint['n_chunks'].tolist() == [ 150, 40 ]
+    assert checkpoint['verified'].tolist() == [ 120, 0 ]
+    assert checkpoint['scores'].tolist() == [ 0.5, 2.0 ]
+
+def test_load_ignores_missing_corrupt_and_old_checkpoints( tmp_path ):
+    path = str( tmp_path / state.STATE_NAME )
+    assert state.load( path ) is None
+    with open( path, 'wb' ) as f:
+        f.write( b'not a checkpoint' )
+    assert state.load( path ) is None
+    with open( path, 'wb' ) as f:
+        np.savez( f, version = np.int64( state.VERSION + 1 ) )
+    assert state.load( path ) is None
+    # Columns of different lengths.
+    with open( path, 'wb' ) as f:
+        np.savez( f, version = np.int64( state.VERSION ), owner = np.str_( 'validator' ), step = np.int64( 1 ), hotkeys = np.array( [ 'a', 'b' ] ), n_chunks = np.array( [ 1 ] ), verified = np.array( [ 1, 2 ] ), scores = np.array( [ 1.0, 2.0 ] ) )
+    assert state.load( path ) is None
+
+def test_reconcile_matches_miners_by_hotkey():
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a', 'b', 'c' ], role = allocation_table.VALIDATOR, n_chunks = [ 150, 40, 300 ], verified = [ 120, 0, 250 ], hash = True )
+    # b was replaced by d on its uid, c moved to another uid and e registered.
+    reconciled, scores, reset = state.reconcile( table, np.array( [ 0.5, 2.0, 3.0 ] ), [ 'a', 'd', 'e', 'c' ] )
+    assert reconciled.peers == [ 'a', 'd', 'e', 'c' ] and reset == 2
+    assert reconciled.n_chunks.tolist() == [ 150, state.DEFAULT_CHUNKS, state.DEFAULT_CHUNKS, 300 ]
+    assert reconciled.verified.tolist() == [ 120, 0, 0, 250 ]
+    assert scores.tolist() == [ 0.5, state.DEFAULT_SCORE, state.DEFAULT_SCORE, 3.0 ]
+    assert reconciled.owner == 'validator' and reconciled.role == allocation_table.VALIDATOR and reconciled.hash
+    # The given table is left as it was.
+    assert table.peers == [ 'a', 'b', 'c' ] and table.n_chunks.tolist() == [ 150, 40, 300 ]
+
+def test_restore_from_checkpoint( tmp_path ):
+    path = str( tmp_path / state.STATE_NAME )
+    table = allocation_table.AllocationTable( '/db', 'validator', [ 'a', 'b' ], role = allocation_table.VALIDATOR, n_chunks = [ 150, 40 ], verified = [ 120, 10 ] )
+    state.save( path, table, np.array( [ 0.5, 2.0 ] ), 42 )
+    allocations, scores, step = state.restore( path, '/db', 'validator', [ 'b', 'c' ] )
+    assert step == 42 and allocations.peers == [ 'b', 'c' ]
+    assert allocations.n_chunks.tolist() == [ 40, state.DEFAULT_CHUNKS ]
+    assert allocations.verified.tolist() == [ 10, 0 ]
+    assert scores.tolist() == [ 2.0, state.DEFAULT_SCORE ]
+
+def test_restore_starts_over_without_a_usable_checkpoint( tmp_path ):
+    path = str( tmp_path / state.STATE_NAME )
+    table = allocation_table.AllocationTable( '/db', 'other', [ 'a' ], role = allocation_table.VALIDATOR, n_chunks = [ 150 ], verified = [ 120 ] )
+    state.save( path, table, np.array( [ 0.5 ] ), 42 )
+    # The checkpoint of another hotkey, no checkpoint at all, or --fresh_state.
+    for checkpoint in [ path, str( tmp_path / 'missing.npz' ), None ]:
+        allocations, scores, step = state.restore( checkpoint, '/db', 'validator', [ 'a' ] )
+        assert step == 0 and allocations.owner == 'validator'
+        assert allocations.n_chunks.tolist() == [ state.DEFAULT_CHUNKS ] and allocations.verified.tolist() == [ 0 ]
+        assert scores.tolist() == [ state.DEFAULT_SCORE ]